@@ -0,0 +1,110 @@
+# Measures the memory retained by parsed responses, per 100k results.
+#
+#   python -m benchmarks.bench_memory
+import argparse
+import gc
+import json
+import tracemalloc
+
+from saucenao_api.containers import SauceResponse, LazySauceResponse
+
+RESULTS_PER_RESPONSE = 6
+
+_RESULT_DATA = [
+    (5, {'ext_urls': ['https://www.pixiv.net/member_illust.php?mode=medium&illust_id=77630170'],
+         'title': 'めぐみん', 'pixiv_id': 77630170, 'member_name': 'frgs', 'member_id': 2542523}),
+    (9, {'ext_urls': ['https://danbooru.donmai.us/post/show/3808763', 'https://gelbooru.com/index.php?id=5073491'],
+         'danbooru_id': 3808763, 'gelbooru_id': 5073491, 'creator': 'frgs', 'material': 'kono subarashii sekai',
+         'characters': 'megumin', 'source': 'https://i.pximg.net/img-original/img/2019/11/03/77630170_p0.png'}),
+    (21, {'ext_urls': ['https://anidb.net/anime/69'], 'source': 'One Piece', 'anidb_aid': 69, 'part': '299',
+          'year': '1999-1999', 'est_time': '00:14:13 / 00:24:39'}),
+    (37, {'ext_urls': ['https://mangadex.org/chapter/53801/'], 'md_id': 53801, 'mu_id': 63043, 'mal_id': 25297,
+          'source': 'Prison School', 'part': ' - Chapter 27', 'artist': 'Hiramoto Akira',
+          'author': 'Hiramoto Akira'}),
+    (34, {'ext_urls': ['https://deviantart.com/view/515715132'], 'title': 'Chie Satonaka', 'da_id': '515715132',
+          'author_name': 'Darkavenger4', 'author_url': 'https://deviantart.com/darkavenger4'}),
+    (41, {'ext_urls': ['https://twitter.com/i/web/status/879295443850506242'],
+          'created_at': '2017-06-26T11:09:04Z', 'tweet_id': '879295443850506242',
+          'twitter_user_id': '2834564586', 'twitter_user_handle': 'petty_lily_xxx'}),
+]
+
+
+def make_response(seed: int, results_count: int = RESULTS_PER_RESPONSE) -> str:
+    return json.dumps({'header': make_header(results_count), 'results': make_results(seed, results_count)})
+
+
+def make_results(seed: int, results_count: int = RESULTS_PER_RESPONSE) -> list:
+    results = []
+    for position in range(results_count):
+        index_id, data = _RESULT_DATA[position % len(_RESULT_DATA)]
+        results.append({
+            'header': {'similarity': f'{90 - position * 7 + seed % 5}.{seed % 100:02d}',
+                       'thumbnail': f'https://img1.saucenao.com/res/{seed}/{position}.jpg',
+                       'index_id': index_id, 'index_name': f'Index #{index_id}: {seed}'},
+            'data': data,
+        })
+    return results
+
+
+def make_header(results_count: int = RESULTS_PER_RESPONSE, *, short_limit: int = 4, short_remaining: int = 3,
+                long_limit: int = 100, long_remaining: int = 99) -> dict:
+    index = {str(i): {'status': 0, 'parent_id': i, 'id': i, 'results': 6} for i in range(40)}
+    return {'user_id': '1', 'account_type': '1', 'short_limit': str(short_limit), 'long_limit': str(long_limit),
+            'long_remaining': long_remaining, 'short_remaining': short_remaining, 'status': 0,
+            'results_requested': results_count, 'index': index, 'search_depth': '128', 'minimum_similarity': 30.0,
+            'query_image_display': 'userdata/x.png', 'query_image': 'x.png', 'results_returned': results_count}
+
+
+# The layout before `__slots__` (2.4.0): the same fields in an instance `__dict__`, raw JSON kept
+class _DictLayout:
+    def __init__(self, obj):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                setattr(self, name, getattr(obj, name))
+
+    def __len__(self):
+        return len(self.results)
+
+
+def dict_layout(raw):
+    resp = _DictLayout(SauceResponse(raw))
+    resp.results = [_DictLayout(result) for result in resp.results]
+    return resp
+
+
+CASES = {
+    '2.4.0 (__dict__)': dict_layout,
+    'default': lambda raw: SauceResponse(raw),
+    'data_keys': lambda raw: SauceResponse(raw, data_keys=['ext_urls']),
+    'keep_raw=False': lambda raw: SauceResponse(raw, keep_raw=False),
+    'lazy, untouched': lambda raw: LazySauceResponse(raw),
+}
+
+
+def measure(build, bodies):
+    gc.collect()
+    tracemalloc.start()
+    kept = [build(json.loads(body)) for body in bodies]
+    for resp in kept:
+        len(resp)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, len(kept)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results', type=int, default=100_000)
+    args = parser.parse_args()
+
+    bodies = [make_response(seed) for seed in range(args.results // RESULTS_PER_RESPONSE)]
+    print(f'{"layout":<20}{"MiB per 100k results":>22}')
+    for name, build in CASES.items():
+        size, count = measure(build, bodies)
+        per_100k = size / (count * RESULTS_PER_RESPONSE) * 100_000 / 2 ** 20
+        print(f'{name:<20}{per_100k:>22.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Measures the average latency of searches with and without a query planner, against a local stub server
+# where every searched index adds latency and the best match usually comes from the same few indexes.
+#
+#   python -m benchmarks.bench_planner --requests 300 --index-latency 0.002 --rotate 0.5
+import argparse
+import time
+
+from saucenao_api import SauceNao
+from saucenao_api.planner import QueryPlanner
+
+from .stub_server import StubServer
+
+IMAGE_URL = 'https://example.com/image.png'
+
+
+def run(url, requests, planner=None):
+    with SauceNao(planner=planner) as client:
+        client.SAUCENAO_URL = url
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.from_url(IMAGE_URL)
+            latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    return {
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.005, help='server latency in seconds')
+    parser.add_argument('--index-latency', type=float, default=0.002, help='latency per searched index')
+    parser.add_argument('--rotate', type=float, default=0.5, help='mean rotation of the indexes of the results')
+    parser.add_argument('--threshold', type=float, default=85.0)
+    parser.add_argument('--coverage', type=float, default=0.9)
+    args = parser.parse_args()
+
+    print(f'{"case":<12}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}{"requests":>10}  narrow indexes')
+    for name in ('all', 'planned'):
+        planner = QueryPlanner(args.threshold, coverage=args.coverage) if name == 'planned' else None
+        with StubServer(latency=args.latency, index_latency=args.index_latency, rotate=args.rotate,
+                        long_limit=10 ** 9) as server:
+            case = run(server.url, args.requests, planner)
+        narrow = planner.indexes if planner is not None else None
+        print(f'{name:<12}{case["mean_ms"]:>10.2f}{case["p50_ms"]:>10.2f}{case["p99_ms"]:>10.2f}'
+              f'{server.requests:>10}  {narrow or ""}')
+        if planner is not None:
+            print(f'{"":<12}narrow searches: {planner.narrowed} matched, {planner.widened} widened; '
+                  f'searches of all the indexes: {planner.full}')
+
+
+if __name__ == '__main__':
+    main()
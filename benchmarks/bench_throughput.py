@@ -0,0 +1,212 @@
+# Measures the throughput and latency of both clients against a local stub server, and the cost of
+# decoding and parsing a response.
+#
+#   python -m benchmarks.bench_throughput --concurrency 1 4 16 64 --latency 0.02
+#   python -m benchmarks.bench_throughput --output baseline.json
+#   python -m benchmarks.bench_throughput --compare baseline.json --tolerance 0.15
+#
+# Every case runs `--repeat` times and the median is reported. With `--compare` the exit code is 1
+# when a case is slower than the baseline by more than the tolerance.
+import argparse
+import asyncio
+import gc
+import json
+import resource
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.containers import SauceResponse, LazySauceResponse
+from saucenao_api.errors import SauceNaoApiError
+
+from .bench_memory import RESULTS_PER_RESPONSE, make_response, measure
+from .stub_server import StubServer, parse_fault
+
+IMAGE_URL = 'https://example.com/image.png'
+
+# Metrics where a larger value is better, for --compare
+_HIGHER_IS_BETTER = {'rps'}
+
+
+def run_sync(url, concurrency, requests, payload):
+    with SauceNao(pool_maxsize=concurrency) as client:
+        client.SAUCENAO_URL = url
+        latencies = []
+        errors = Counter()
+
+        def call(_):
+            started = time.perf_counter()
+            try:
+                if payload:
+                    client.from_file(payload)
+                else:
+                    client.from_url(IMAGE_URL)
+            except SauceNaoApiError as exc:
+                errors[type(exc).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # Opens the connections before the clock starts
+            list(executor.map(call, range(concurrency)))
+            latencies.clear()
+            errors.clear()
+
+            started = time.perf_counter()
+            list(executor.map(call, range(requests)))
+            elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, errors)
+
+
+def run_async(url, concurrency, requests, payload):
+    async def benchmark():
+        async with AIOSauceNao(pool_maxsize=concurrency) as client:
+            client.SAUCENAO_URL = url
+            latencies = []
+            errors = Counter()
+
+            async def call():
+                started = time.perf_counter()
+                try:
+                    if payload:
+                        await client.from_file(payload)
+                    else:
+                        await client.from_url(IMAGE_URL)
+                except SauceNaoApiError as exc:
+                    errors[type(exc).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+            async def work(count):
+                for _ in range(count):
+                    await call()
+
+            await asyncio.gather(*[call() for _ in range(concurrency)])
+            latencies.clear()
+            errors.clear()
+
+            started = time.perf_counter()
+            shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+            await asyncio.gather(*[work(share) for share in shares])
+            return summarize(latencies, time.perf_counter() - started, errors)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(benchmark())
+    finally:
+        loop.close()
+
+
+# Decoding and parsing time per response, and the memory retained by the parsed responses
+def run_parse(results_count, count=2000):
+    loads = SauceNao().json_loads
+    bodies = [make_response(seed, results_count).encode() for seed in range(count)]
+    builders = {
+        'parse': SauceResponse,
+        'parse lazy': LazySauceResponse,
+        'parse top 1': partial(SauceResponse, top_k=1),
+    }
+    cases = {}
+    # Timed before any memory is traced, tracemalloc slows down the allocations that follow it
+    for name, build in builders.items():
+        gc.collect()
+        started = time.perf_counter()
+        for body in bodies:
+            build(loads(body))
+        cases[name] = {'us_per_response': (time.perf_counter() - started) / count * 1e6}
+    for name, build in builders.items():
+        size, _ = measure(build, bodies)
+        cases[name]['kib_per_response'] = size / count / 1024
+    return cases
+
+
+def summarize(latencies, elapsed, errors):
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': dict(errors),
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def median_case(runs):
+    runs = sorted(runs, key=lambda run: run['rps'] if 'rps' in run else run['us_per_response'])
+    return runs[len(runs) // 2]
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, case in results.items():
+        for metric, value in case.items():
+            old = baseline.get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not old:
+                continue
+            change = value / old - 1
+            if metric in _HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(f'{name} {metric}: {old:.2f} -> {value:.2f} ({change:+.0%} worse)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=500, help='requests per case')
+    parser.add_argument('--latency', type=float, default=0.01, help='server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--results', type=int, default=RESULTS_PER_RESPONSE, help='results per response')
+    parser.add_argument('--upload', type=int, default=0, help='upload a file of this many bytes instead of a URL')
+    parser.add_argument('--fault', type=parse_fault, action='append', default=[], help='STATUS=SHARE, e.g. 429=0.05')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--clients', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results of a previous --output')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    payload = b'\xff' * args.upload
+    runners = {'sync': run_sync, 'async': run_async}
+    results = {}
+
+    print(f'{"case":<16}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}  errors')
+    with StubServer(latency=args.latency, jitter=args.jitter, results=args.results, faults=dict(args.fault)) as server:
+        for client in args.clients:
+            for concurrency in args.concurrency:
+                runs = [runners[client](server.url, concurrency, args.requests, payload) for _ in range(args.repeat)]
+                case = results[f'{client} x{concurrency}'] = median_case(runs)
+                print(f'{client + " x" + str(concurrency):<16}{case["rps"]:>10.1f}{case["p50_ms"]:>10.2f}'
+                      f'{case["p99_ms"]:>10.2f}  {case["errors"] or ""}')
+
+    print(f'\n{"case":<16}{"us/response":>12}{"KiB/response":>14}')
+    parse_runs = [run_parse(args.results) for _ in range(args.repeat)]
+    for name in parse_runs[0]:
+        case = results[name] = median_case([run[name] for run in parse_runs])
+        print(f'{name:<16}{case["us_per_response"]:>12.1f}{case["kib_per_response"]:>14.2f}')
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'\nmax RSS: {max_rss / 1024:.1f} MiB')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
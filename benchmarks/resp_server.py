@@ -0,0 +1,208 @@
+# A local stand-in for Redis that speaks enough of its protocol for RedisPacer, for tests and benchmarks.
+#
+#   python -m benchmarks.resp_server --port 6379
+#
+# Supports PING, AUTH, SELECT, GET, SET, DEL, TIME, WATCH, UNWATCH, MULTI, EXEC and DISCARD. All the
+# commands run under one lock, so a transaction is atomic like on a real server
+import argparse
+import socketserver
+import threading
+import time
+from typing import Optional
+
+_NIL = object()
+
+
+class RespServer:
+    def __init__(self,
+                 host:     str = '127.0.0.1',
+                 port:     int = 0,
+                 *,
+                 password: Optional[str] = None,
+                 ) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.commands = 0
+
+        self._lock = threading.Lock()
+        self._data = {}
+        self._versions = {}
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        auth = f':{self.password}@' if self.password is not None else ''
+        return f'redis://{auth}{self.host}:{self.port}/0'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> None:
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                connection = _Connection(server)
+                while True:
+                    try:
+                        command = _read_command(self.rfile)
+                    except (OSError, ValueError):
+                        return
+                    if command is None:
+                        return
+                    if not command:
+                        continue
+                    self.wfile.write(_encode(connection.run(command)))
+
+        self._server = _ThreadingTCPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+
+
+# The WATCH and MULTI state of one client connection
+class _Connection:
+    def __init__(self, server):
+        self.server = server
+        self.authenticated = server.password is None
+        self.watched = {}
+        self.queue = None
+
+    def run(self, command):
+        name = command[0].upper()
+        args = command[1:]
+        if name == b'AUTH':
+            if args[-1].decode() != self.server.password:
+                return _Error('WRONGPASS invalid password')
+            self.authenticated = True
+            return 'OK'
+        if not self.authenticated:
+            return _Error('NOAUTH Authentication required.')
+
+        if self.queue is not None and name not in (b'EXEC', b'DISCARD', b'MULTI', b'WATCH'):
+            self.queue.append((name, args))
+            return 'QUEUED'
+
+        server = self.server
+        with server._lock:
+            server.commands += 1
+            if name == b'MULTI':
+                if self.queue is not None:
+                    return _Error('ERR MULTI calls can not be nested')
+                self.queue = []
+                return 'OK'
+            elif name == b'EXEC':
+                if self.queue is None:
+                    return _Error('ERR EXEC without MULTI')
+                queue, self.queue = self.queue, None
+                watched, self.watched = self.watched, {}
+                if any(server._versions.get(key, 0) != version for key, version in watched.items()):
+                    return _NIL
+                return [self._execute(name, args) for name, args in queue]
+            elif name == b'DISCARD':
+                self.queue = None
+                self.watched = {}
+                return 'OK'
+            elif name == b'WATCH':
+                if self.queue is not None:
+                    return _Error('ERR WATCH inside MULTI is not allowed')
+                for key in args:
+                    self.watched[key] = server._versions.get(key, 0)
+                return 'OK'
+            elif name == b'UNWATCH':
+                self.watched = {}
+                return 'OK'
+            return self._execute(name, args)
+
+    def _execute(self, name, args):
+        server = self.server
+        if name == b'PING':
+            return 'PONG'
+        elif name == b'SELECT':
+            return 'OK'
+        elif name == b'GET':
+            return server._data.get(args[0], _NIL)
+        elif name == b'SET':
+            server._data[args[0]] = args[1]
+            server._versions[args[0]] = server._versions.get(args[0], 0) + 1
+            return 'OK'
+        elif name == b'DEL':
+            deleted = 0
+            for key in args:
+                if server._data.pop(key, None) is not None:
+                    server._versions[key] = server._versions.get(key, 0) + 1
+                    deleted += 1
+            return deleted
+        elif name == b'TIME':
+            now = time.time()
+            return [str(int(now)).encode(), str(int(now % 1 * 1e6)).encode()]
+        return _Error(f'ERR unknown command {name.decode()!r}')
+
+
+class _Error(str):
+    pass
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _read_command(rfile):
+    line = rfile.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()    # inline command
+    command = []
+    for _ in range(int(line[1:])):
+        length = int(rfile.readline()[1:])
+        command.append(rfile.read(length + 2)[:-2])
+    return command
+
+
+def _encode(reply):
+    if reply is _NIL:
+        return b'$-1\r\n'
+    elif isinstance(reply, _Error):
+        return b'-' + reply.encode() + b'\r\n'
+    elif isinstance(reply, str):
+        return b'+' + reply.encode() + b'\r\n'
+    elif isinstance(reply, int):
+        return b':%d\r\n' % reply
+    elif isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    with RespServer(port=args.port, password=args.password) as server:
+        print(f'Serving on {server.url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
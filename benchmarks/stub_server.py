@@ -0,0 +1,220 @@
+# A local server that speaks the search.php JSON protocol, for benchmarks and tests.
+#
+#   python -m benchmarks.stub_server --port 8080 --latency 0.05 --fault 429=0.1
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from saucenao_api.params import DB
+
+from .bench_memory import RESULTS_PER_RESPONSE, make_header, make_results
+
+SHORT_WINDOW = 30
+# Indexes searched without a dbmask
+ALL_INDEXES = len([value for name, value in vars(DB).items() if not name.startswith('_') and value != DB.ALL])
+_FAULT_MESSAGES = {
+    403: 'Invalid API key',
+    413: 'File is too large',
+    429: 'Search Rate Too High.',
+}
+
+
+# Replies to every search with `results` generated results after `latency` (+- `jitter`) seconds.
+# `faults` maps the status codes 403, 413 and 429 to the share of requests that fail with them.
+# The quota fields count the requests of the last 30 seconds and of the server's lifetime; with
+# `enforce_quota` the server answers 429 once they run out, like SauceNAO does.
+# A search takes `index_latency` more seconds for every index it selects, and only returns the results
+# of the indexes of its dbmask. With `rotate` the indexes move by a random number of places, `rotate`
+# on average, for every response, so that the best match doesn't always come from the same index
+class StubServer:
+    def __init__(self,
+                 *,
+                 latency:       float = 0.0,
+                 jitter:        float = 0.0,
+                 results:       int = RESULTS_PER_RESPONSE,
+                 faults:        Optional[Dict[int, float]] = None,
+                 index_latency: float = 0.0,
+                 rotate:        float = 0.0,
+                 short_limit:   int = 4,
+                 long_limit:    int = 100,
+                 enforce_quota: bool = False,
+                 seed:          int = 0,
+                 host:          str = '127.0.0.1',
+                 port:          int = 0,
+                 ) -> None:
+        unknown = set(faults or ()) - set(_FAULT_MESSAGES)
+        if unknown:
+            raise ValueError(f'Unsupported fault status codes: {sorted(unknown)}')
+
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = dict(faults or {})
+        self.index_latency = index_latency
+        self.rotate = rotate
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.enforce_quota = enforce_quota
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.bytes_received = 0
+        self.statuses = Counter()
+        self.dbmasks = Counter()
+
+        self._random = random.Random(seed)
+        self._started = []         # sorted start times of the requests in the last 30 seconds
+        self._long_used = 0
+        # Without a dbmask or `rotate` the results don't depend on the request, so they are encoded only once
+        self._result_list = make_results(seed, results)
+        self._results = json.dumps(self._result_list)
+        self._results_count = results
+
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/search.php'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # Starts the server on its own event loop in a daemon thread
+    def start(self) -> None:
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application(client_max_size=64 * 2 ** 20)
+        app.router.add_route('*', '/search.php', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.TCPSite(self._runner, self.host, self.port).start())
+        self.port = self._runner.addresses[0][1]
+        ready.set()
+        self._loop.run_forever()
+
+    async def _handle(self, request):
+        self.bytes_received += len(await request.read())
+        if request.method == 'HEAD':
+            return web.Response()
+
+        self.requests += 1
+        mask = int(request.query['dbmask']) if 'dbmask' in request.query else None
+        self.dbmasks[mask] += 1
+        indexes = bin(mask).count('1') if mask is not None else ALL_INDEXES
+        delay = self.latency + self.jitter * (2 * self._random.random() - 1) + self.index_latency * indexes
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        status = self._fault()
+        if status is None:
+            short_remaining, long_remaining = self._spend(time.monotonic())
+            if self.enforce_quota and long_remaining < 0:
+                status, message = 429, 'Daily Search Limit Exceeded.'
+            elif self.enforce_quota and short_remaining < 0:
+                status, message = 429, _FAULT_MESSAGES[429]
+        else:
+            message = _FAULT_MESSAGES[status]
+
+        self.statuses[status or 200] += 1
+        if status is not None:
+            return web.json_response({'header': {'status': -1, 'message': message}}, status=status)
+
+        results, count = self._results, self._results_count
+        if mask is not None or self.rotate:
+            result_list = self._select(mask)
+            results, count = json.dumps(result_list), len(result_list)
+
+        header = make_header(count, short_limit=self.short_limit, long_limit=self.long_limit,
+                             short_remaining=max(short_remaining, 0), long_remaining=max(long_remaining, 0))
+        body = f'{{"header":{json.dumps(header)},"results":{results}}}'
+        return web.Response(text=body, content_type='application/json')
+
+    # The results of the indexes of `mask`. A rotation keeps the similarities in place and moves the rest
+    def _select(self, mask):
+        results = self._result_list
+        if self.rotate and results:
+            shift = int(self._random.expovariate(1 / self.rotate)) % len(results)
+            moved = results[shift:] + results[:shift]
+            results = [{'header': {**result['header'], 'similarity': place['header']['similarity']},
+                        'data': result['data']}
+                       for place, result in zip(self._result_list, moved)]
+        if mask is not None:
+            results = [result for result in results if mask >> result['header']['index_id'] & 1]
+        return results
+
+    def _fault(self):
+        draw = self._random.random()
+        for status, share in self.faults.items():
+            if draw < share:
+                return status
+            draw -= share
+        return None
+
+    def _spend(self, now):
+        del self._started[:bisect.bisect_right(self._started, now - SHORT_WINDOW)]
+        self._started.append(now)
+        self._long_used += 1
+        return self.short_limit - len(self._started), self.long_limit - self._long_used
+
+
+def parse_fault(value: str):
+    status, share = value.split('=')
+    return int(status), float(share)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--results', type=int, default=RESULTS_PER_RESPONSE)
+    parser.add_argument('--fault', type=parse_fault, action='append', default=[], help='STATUS=SHARE, e.g. 429=0.1')
+    parser.add_argument('--index-latency', type=float, default=0.0, help='latency per searched index')
+    parser.add_argument('--rotate', type=float, default=0.0)
+    parser.add_argument('--short-limit', type=int, default=4)
+    parser.add_argument('--long-limit', type=int, default=100)
+    parser.add_argument('--enforce-quota', action='store_true')
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, jitter=args.jitter, results=args.results, faults=dict(args.fault),
+                        index_latency=args.index_latency, rotate=args.rotate, short_limit=args.short_limit,
+                        long_limit=args.long_limit, enforce_quota=args.enforce_quota, port=args.port)
+    with server:
+        print(f'Serving on {server.url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, NamedTuple, Union
+
+from .cache import make_key
+
+BatchInput = Union[str, os.PathLike, BinaryIO]
+
+
+def is_url(item: BatchInput) -> bool:
+    return isinstance(item, str) and item.startswith(('http://', 'https://'))
+
+
+def input_key(params: dict, item: BatchInput, content: bytes = None) -> str:
+    if content is None:
+        return make_key(params, url=item)
+    return make_key(params, content=content)
+
+
+# The result of an input dropped as a duplicate of `first` by `iter_search(..., duplicates=True)`
+class Duplicate(NamedTuple):
+    first: BatchInput
+
+
+# Remembers the last `maxsize` keys, so duplicates are dropped without the memory growing with the batch
+class RecentKeys:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key: str) -> bool:
+        value = object()
+        return self.setdefault(key, value) is value
+
+    # Returns the value of a known key, or stores `value` for a new one and returns it
+    def setdefault(self, key: str, value: Any) -> Any:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return self._keys[key]
+
+            self._keys[key] = value
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+            return value
@@ -0,0 +1,199 @@
+import abc
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# These params don't change the search results
+_IGNORED_PARAMS = ('api_key', 'output_type', 'url')
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def make_key(params: dict, *, content: Optional[bytes] = None, url: Optional[str] = None) -> str:
+    if content is not None:
+        source = 'file:' + hashlib.sha256(content).hexdigest()
+    else:
+        source = 'url:' + normalize_url(url)
+
+    return hashlib.sha256(json.dumps([source, _search_params(params)]).encode()).hexdigest()
+
+
+def params_key(params: dict) -> str:
+    return hashlib.sha256(json.dumps(_search_params(params)).encode()).hexdigest()
+
+
+def _search_params(params):
+    return sorted((name, str(value)) for name, value in params.items() if name not in _IGNORED_PARAMS)
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc += f':{parts.port}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class Cache(abc.ABC):
+    hits = 0
+    misses = 0
+
+    @abc.abstractmethod
+    def get(self, key: str, *, allow_stale: bool = False) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, raw: dict) -> None:
+        ...
+
+
+class MemoryCache(Cache):
+    def __init__(self,
+                 maxsize: int = 1024,
+                 ttl:     Optional[float] = None,
+                 *,
+                 clock:   Callable[[], float] = time.monotonic,
+                 ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str, *, allow_stale: bool = False) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (not allow_stale and self._expired(entry)):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, raw: dict) -> None:
+        with self._lock:
+            self._entries[key] = (raw, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, entry):
+        return self.ttl is not None and self._clock() - entry[1] > self.ttl
+
+
+# Keeps the raw JSON responses in a SQLite database, so the cache outlives the process and can be shared
+# by several processes on the same host
+class SQLiteCache(Cache):
+    EVICT_INTERVAL = 100
+
+    def __init__(self,
+                 path:        str,
+                 ttl:         Optional[float] = None,
+                 *,
+                 max_entries: Optional[int] = None,
+                 max_bytes:   Optional[int] = None,
+                 timeout:     float = 30,
+                 clock:       Callable[[], float] = time.time,
+                 ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._clock = clock
+        self._sets = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'key TEXT PRIMARY KEY, raw TEXT NOT NULL, created REAL NOT NULL, '
+                           'accessed REAL NOT NULL, size INTEGER NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key: str, *, allow_stale: bool = False) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT raw, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (not allow_stale and self._expired(row[1])):
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (self._clock(), key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, raw: dict) -> None:
+        data = json.dumps(raw, ensure_ascii=False, separators=(',', ':'))
+        now = self._clock()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, raw, created, accessed, size) '
+                               'VALUES (?, ?, ?, ?, ?)', (key, data, now, now, len(data.encode())))
+            self._sets += 1
+            if self._sets % self.EVICT_INTERVAL == 0:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+
+    # Evicts entries over the size caps and rebuilds the database file to reclaim the free pages.
+    # Expired entries are dropped too, so call it with `keep_stale=True` to keep them for `allow_stale`
+    def compact(self, *, keep_stale: bool = False) -> None:
+        with self._lock:
+            if self.ttl is not None and not keep_stale:
+                self._conn.execute('DELETE FROM responses WHERE created < ?', (self._clock() - self.ttl,))
+            self._evict()
+            self._conn.execute('VACUUM')
+
+    def _evict(self):
+        if self.max_entries is not None:
+            self._conn.execute('DELETE FROM responses WHERE key IN ('
+                               'SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                               (self.max_entries,))
+        if self.max_bytes is not None:
+            # The least recently used entries go first until the rest fits. A running total with a window
+            # function would need SQLite 3.25, older than some Python 3.6 builds ship
+            excess = self._conn.execute('SELECT TOTAL(size) FROM responses').fetchone()[0] - self.max_bytes
+            evicted = []
+            if excess > 0:
+                for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+                    evicted.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+            self._conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def _expired(self, created):
+        return self.ttl is not None and self._clock() - created > self.ttl
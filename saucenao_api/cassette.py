@@ -0,0 +1,212 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Awaitable, Callable, Iterator, NamedTuple, Optional, Tuple
+
+from .errors import UnrecordedRequestError
+from .upload import MultipartBody
+
+_DATA_MAGIC = b'SNCASS1\n'
+_INDEX_MAGIC = b'SNCIDX1\n'
+_RECORD = struct.Struct('<16sHdI')     # key, status code, latency, body length
+_ENTRY = struct.Struct('<16sQ')        # key, record offset
+
+Response = Tuple[int, bytes]
+
+
+class Record(NamedTuple):
+    key:     bytes
+    status:  int
+    latency: float
+    body:    bytes
+
+
+# Records the raw HTTP responses of a client and serves them back without touching the network.
+#
+# Records are appended one after another to `path`, so a cassette can be streamed with `records()`.
+# The index of sorted keys and record offsets is written to `path + '.idx'` on close, and memory
+# mapped on replay, so a replay starts at once however many calls were recorded. Requests are
+# matched by their params (without `api_key`) and the content of the uploaded file. A request that
+# was recorded several times gets its responses in the recorded order, and the last one after that.
+# With `timing` every response is delayed by its recorded latency divided by `speed`
+class Cassette:
+    def __init__(self,
+                 path:   str,
+                 mode:   str = 'replay',
+                 *,
+                 timing: bool = False,
+                 speed:  float = 1.0,
+                 ) -> None:
+        if mode not in ('record', 'replay'):
+            raise ValueError("mode must be 'record' or 'replay'")
+
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.speed = speed
+
+        self._lock = threading.Lock()
+        self._closed = False
+        if mode == 'record':
+            self._file = open(path, 'wb')
+            self._file.write(_DATA_MAGIC)
+            self._entries = []
+        else:
+            if not _index_is_fresh(path):
+                reindex(path)
+            self._data = _map(path)
+            self._index = _map(path + '.idx')
+            self._keys = _IndexKeys(self._index)
+            self._played = {}
+
+    def __len__(self):
+        if self.mode == 'record':
+            return len(self._entries)
+        return len(self._keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self.mode == 'record':
+                self._file.close()
+                _write_index(self.path, self._entries)
+            else:
+                self._data.close()
+                self._index.close()
+
+    @staticmethod
+    def key(params: dict, body: Optional[MultipartBody] = None) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps(sorted((name, str(value)) for name, value in params.items()
+                                        if name != 'api_key')).encode())
+        if body is not None:
+            digest.update(body.digest())
+        return digest.digest()
+
+    def play(self, params: dict, body: Optional[MultipartBody], send: Callable[[], Response]) -> Response:
+        key = self.key(params, body)
+        if self.mode == 'replay':
+            status, content, latency = self.replay(key)
+            if self.timing:
+                time.sleep(latency / self.speed)
+            return status, content
+
+        started = time.perf_counter()
+        status, content = send()
+        self.record(key, status, content, time.perf_counter() - started)
+        return status, content
+
+    async def play_async(self, params: dict, body: Optional[MultipartBody],
+                         send: Callable[[], Awaitable[Response]]) -> Response:
+        key = self.key(params, body)
+        if self.mode == 'replay':
+            status, content, latency = self.replay(key)
+            if self.timing:
+                await asyncio.sleep(latency / self.speed)
+            return status, content
+
+        started = time.perf_counter()
+        status, content = await send()
+        self.record(key, status, content, time.perf_counter() - started)
+        return status, content
+
+    def record(self, key: bytes, status: int, content: bytes, latency: float) -> None:
+        with self._lock:
+            self._entries.append((key, self._file.tell()))
+            self._file.write(_RECORD.pack(key, status, latency, len(content)))
+            self._file.write(content)
+
+    def replay(self, key: bytes) -> Tuple[int, bytes, float]:
+        start = bisect.bisect_left(self._keys, key)
+        stop = bisect.bisect_right(self._keys, key, start)
+        if start == stop:
+            raise UnrecordedRequestError(f'No recorded response for request {key.hex()}')
+
+        with self._lock:
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+        offset = _ENTRY.unpack_from(self._index, len(_INDEX_MAGIC) + min(start + played, stop - 1) * _ENTRY.size)[1]
+
+        _, status, latency, length = _RECORD.unpack_from(self._data, offset)
+        body_start = offset + _RECORD.size
+        return status, self._data[body_start:body_start + length], latency
+
+    def records(self) -> Iterator[Record]:
+        return iter_records(self.path)
+
+
+def iter_records(path: str) -> Iterator[Record]:
+    with open(path, 'rb') as f:
+        if f.read(len(_DATA_MAGIC)) != _DATA_MAGIC:
+            raise ValueError(f'{path} is not a cassette')
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            key, status, latency, length = _RECORD.unpack(header)
+            body = f.read(length)
+            if len(body) < length:
+                return    # cut off while recording
+            yield Record(key, status, latency, body)
+
+
+# Rebuilds the index of a cassette, e.g. after the recording process was killed
+def reindex(path: str) -> None:
+    entries = []
+    offset = len(_DATA_MAGIC)
+    for record in iter_records(path):
+        entries.append((record.key, offset))
+        offset += _RECORD.size + len(record.body)
+    _write_index(path, entries)
+
+
+def _write_index(path, entries):
+    # Sorted by key, and by offset for the same key, which keeps the recorded order
+    entries.sort()
+    with open(path + '.idx.tmp', 'wb') as f:
+        f.write(_INDEX_MAGIC)
+        for key, offset in entries:
+            f.write(_ENTRY.pack(key, offset))
+    os.replace(path + '.idx.tmp', path + '.idx')
+
+
+def _index_is_fresh(path):
+    try:
+        return os.path.getmtime(path + '.idx') >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f'{path} is empty')
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# The keys of a memory mapped index as a sequence, for bisect
+class _IndexKeys:
+    def __init__(self, index):
+        self._index = index
+        self._length = (len(index) - len(_INDEX_MAGIC)) // _ENTRY.size
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, item):
+        start = len(_INDEX_MAGIC) + item * _ENTRY.size
+        return self._index[start:start + 16]
@@ -0,0 +1,319 @@
+# The `saucenao` command. Searches files, directories, globs and lists of URLs and streams the
+# results as JSON lines or CSV:
+#
+#   saucenao -k API_KEY ~/Pictures 'downloads/**/*.png' -o results.jsonl --checkpoint scan.db
+#   saucenao -k API_KEY --urls urls.txt --format csv -o results.csv
+#
+# With `--checkpoint`, every input that got a result is remembered, and the same command run again
+# skips it, so an interrupted scan resumes where it stopped. The output file is appended to. An input with
+# the same content or URL as an earlier one isn't searched or written again, but it is checkpointed too
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+from .batch import Duplicate, is_url
+from .cache import SQLiteCache
+from .errors import BadKeyError, LimitReachedError, LongLimitReachedError
+from .params import DB
+from .quota import Pacer
+from .retry import RetryPolicy
+from .saucenao_api import SauceNao
+
+IMAGE_EXTENSIONS = frozenset(('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp'))
+CSV_FIELDS = ('input', 'similarity', 'index_id', 'index_name', 'title', 'author', 'urls', 'error')
+
+EXIT_LONG_LIMIT = 3
+EXIT_INTERRUPTED = 130
+
+
+# Yields the files and URLs to search, one at a time, so a tree of millions of files is never listed in memory
+def iter_inputs(sources:    Iterable[str],
+                url_lists:  Iterable[str] = (),
+                extensions: Optional[Iterable[str]] = IMAGE_EXTENSIONS,
+                ) -> Iterator[str]:
+    extensions = frozenset(extension.lower() for extension in extensions) if extensions is not None else None
+    for source in sources:
+        if is_url(source):
+            yield source
+        elif os.path.isdir(source):
+            yield from walk(source, extensions)
+        elif any(char in source for char in '*?['):
+            for path in glob.iglob(source, recursive=True):
+                if os.path.isdir(path):
+                    yield from walk(path, extensions)
+                else:
+                    yield path
+        else:
+            yield source
+
+    for url_list in url_lists:
+        f = sys.stdin if url_list == '-' else open(url_list, encoding='utf-8')
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+# Files under `root` in a stable order, with one of `extensions` (any file if None)
+def walk(root: str, extensions: Optional[frozenset] = IMAGE_EXTENSIONS) -> Iterator[str]:
+    directories = [root]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as it:
+                entries = sorted(it, key=lambda entry: entry.name, reverse=True)
+        except OSError:
+            continue
+
+        for entry in reversed(entries):
+            if entry.is_dir():
+                directories.append(entry.path)
+            elif extensions is None or os.path.splitext(entry.name)[1].lower() in extensions:
+                yield entry.path
+
+
+# The inputs that already have a result. Kept in SQLite, so millions of them don't have to fit in memory,
+# and committed after every result, so nothing is searched twice after a crash
+class Checkpoint:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS done (input TEXT PRIMARY KEY) WITHOUT ROWID')
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM done').fetchone()[0]
+
+    def __contains__(self, item):
+        return self._conn.execute('SELECT 1 FROM done WHERE input = ?', (item,)).fetchone() is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, item: str) -> None:
+        self._conn.execute('INSERT OR IGNORE INTO done (input) VALUES (?)', (item,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class JsonLinesWriter:
+    def __init__(self, f: TextIO) -> None:
+        self._f = f
+
+    def write(self, item, response=None, error=None):
+        line = {
+            'input': item,
+            'error': _error_message(error),
+            'results': [_result_fields(result) for result in response] if response is not None else [],
+        }
+        self._f.write(json.dumps(line, ensure_ascii=False) + '\n')
+        self._f.flush()
+
+
+# One row per result, or a single row for an input without results
+class CsvWriter:
+    def __init__(self, f: TextIO, header: bool = True) -> None:
+        self._f = f
+        self._writer = csv.writer(f)
+        if header:
+            self._writer.writerow(CSV_FIELDS)
+
+    def write(self, item, response=None, error=None):
+        rows = []
+        for result in response if response is not None else ():
+            fields = _result_fields(result)
+            fields['urls'] = ' '.join(fields['urls'])
+            rows.append([item] + [fields[name] for name in CSV_FIELDS[1:-1]] + [''])
+        if not rows:
+            rows.append([item] + [''] * (len(CSV_FIELDS) - 2) + [_error_message(error) or ''])
+        self._writer.writerows(rows)
+        self._f.flush()
+
+
+# Throughput and remaining quota, redrawn on one line of a terminal
+class Progress:
+    def __init__(self,
+                 stream:   TextIO,
+                 interval: float = 1.0,
+                 *,
+                 clock:    Callable[[], float] = time.monotonic,
+                 ) -> None:
+        self.stream = stream
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+
+        self._clock = clock
+        self._started = self._clock()
+        self._shown = None
+        self._tty = stream.isatty()
+
+    def show(self, quota=None, *, force: bool = False) -> None:
+        now = self._clock()
+        if not force and self._shown is not None and now - self._shown < self.interval:
+            return
+        self._shown = now
+        self.stream.write(self.render(quota, now) + ('\r' if self._tty and not force else '\n'))
+        self.stream.flush()
+
+    def render(self, quota=None, now=None) -> str:
+        elapsed = (now if now is not None else self._clock()) - self._started
+        line = f'done {self.done}, failed {self.failed}, skipped {self.skipped}'
+        line += f', {self.done / elapsed if elapsed > 0 else 0:.2f}/s'
+        if quota is not None:
+            line += (f', quota {quota.short_remaining}/{quota.short_limit} short'
+                     f' {quota.long_remaining}/{quota.long_limit} long')
+        return line
+
+
+def _result_fields(result):
+    return {
+        'similarity': result.similarity,
+        'index_id': result.index_id,
+        'index_name': result.index_name,
+        'title': result.title,
+        'author': result.author,
+        'urls': result.urls,
+    }
+
+
+def _error_message(error):
+    return f'{type(error).__name__}: {error}' if error is not None else None
+
+
+# Errors that say nothing about the input, so it's searched again on the next run
+def _retry_later(error):
+    return isinstance(error, (LimitReachedError, BadKeyError)) or RetryPolicy.retryable(error)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='saucenao', description='Search SauceNAO for files, directories, '
+                                                                  'globs and URLs.')
+    parser.add_argument('inputs', nargs='*', help='files, directories, globs or URLs')
+    parser.add_argument('-k', '--api-key', default=os.environ.get('SAUCENAO_API_KEY'),
+                        help='API key, SAUCENAO_API_KEY by default')
+    parser.add_argument('-u', '--urls', action='append', default=[], metavar='FILE',
+                        help='file with one URL per line, - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='output file, appended to (default: stdout)')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'], help='guessed from the output file name')
+    parser.add_argument('-c', '--checkpoint', metavar='FILE', help='remember finished inputs in this file')
+    parser.add_argument('--cache', metavar='FILE', help='cache responses in this SQLite file')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='concurrent searches (default: 4)')
+    parser.add_argument('--db', type=int, default=DB.ALL, help='index to search (default: all)')
+    parser.add_argument('--dbmask', type=int)
+    parser.add_argument('--numres', type=int, default=6)
+    parser.add_argument('--min-similarity', type=float, help='drop results under this similarity')
+    parser.add_argument('--index', type=int, action='append', dest='indexes', metavar='ID',
+                        help='keep only results from this index, can be repeated')
+    parser.add_argument('--top-k', type=int, help='keep only the best results')
+    parser.add_argument('--all-files', action='store_true', help='search every file in directories, '
+                                                                  'not only images')
+    parser.add_argument('--retries', type=int, default=2, help='retries of transient errors (default: 2)')
+    parser.add_argument('--stats-interval', type=float, default=1.0, help='seconds between stats lines')
+    parser.add_argument('-q', '--quiet', action='store_true', help="don't show stats")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.urls:
+        parser.error('nothing to search, pass files, directories, globs, URLs or --urls')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.retries < 0:
+        parser.error('--retries must not be negative')
+    if args.format is None:
+        args.format = 'csv' if args.output.lower().endswith('.csv') else 'jsonl'
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    cache = SQLiteCache(args.cache) if args.cache else None
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    client = SauceNao(args.api_key, db=args.db, dbmask=args.dbmask, numres=args.numres,
+                      min_similarity=args.min_similarity, index_allowlist=args.indexes, top_k=args.top_k,
+                      pool_maxsize=args.workers, pacer=Pacer(), retry=RetryPolicy(args.retries + 1), cache=cache)
+
+    if args.output == '-':
+        out = sys.stdout
+    else:
+        out = open(args.output, 'a', encoding='utf-8', newline='' if args.format == 'csv' else None)
+    if args.format == 'csv':
+        writer = CsvWriter(out, header=out is sys.stdout or out.tell() == 0)
+    else:
+        writer = JsonLinesWriter(out)
+    progress = Progress(sys.stderr, args.stats_interval)
+
+    inputs = iter_inputs(args.inputs, args.urls, None if args.all_files else IMAGE_EXTENSIONS)
+    if checkpoint is not None:
+        inputs = _skip_done(inputs, checkpoint, progress)
+
+    status = 0
+    try:
+        for item, result in client.iter_search(inputs, workers=args.workers, duplicates=True):
+            if isinstance(result, Duplicate):
+                if checkpoint is not None:
+                    checkpoint.add(str(item))
+                progress.skipped += 1
+                continue
+
+            error = result if isinstance(result, Exception) else None
+            if error is not None and _retry_later(error):
+                progress.failed += 1
+                print(f'{item}: {_error_message(error)}', file=sys.stderr)
+                if isinstance(error, (LongLimitReachedError, BadKeyError)):
+                    status = EXIT_LONG_LIMIT if isinstance(error, LongLimitReachedError) else 1
+                    break
+                continue
+
+            # Written before it's checkpointed, so a crash in between repeats one line instead of losing it
+            writer.write(str(item), None if error is not None else result, error)
+            if checkpoint is not None:
+                checkpoint.add(str(item))
+            # An input with a permanent error is finished too, but it's counted once, as failed
+            if error is not None:
+                progress.failed += 1
+            else:
+                progress.done += 1
+            if not args.quiet:
+                progress.show(client.quota)
+    except KeyboardInterrupt:
+        status = EXIT_INTERRUPTED
+    finally:
+        if not args.quiet:
+            progress.show(client.quota, force=True)
+        if status == EXIT_LONG_LIMIT:
+            print('24 hours limit reached, run the same command later to resume', file=sys.stderr)
+        if out is not sys.stdout:
+            out.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if cache is not None:
+            cache.close()
+        client.close()
+    return status
+
+
+def _skip_done(inputs, checkpoint, progress):
+    for item in inputs:
+        if str(item) in checkpoint:
+            progress.skipped += 1
+        else:
+            yield item
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,70 +1,153 @@
-from typing import Optional, List
+import heapq
+from functools import partial
+from typing import Any, Callable, Collection, Optional, List, NamedTuple, Sequence, Iterable, Tuple
 
 from .params import DB
 
 
+def _trim_raw(raw, keep_raw, data_keys):
+    if not keep_raw:
+        return None
+    if data_keys is None:
+        return raw
+    return {'header': raw['header'], 'data': {key: value for key, value in raw['data'].items() if key in data_keys}}
+
+
+# Numbers of results dropped by the result filters of a response, in the order they are applied
+class FilteredCounts(NamedTuple):
+    index:      int = 0
+    similarity: int = 0
+    top_k:      int = 0
+
+    @property
+    def total(self) -> int:
+        return self.index + self.similarity + self.top_k
+
+
+def _similarity(result):
+    return float(result['header']['similarity'])
+
+
+# Drops the raw results outside `index_allowlist` and under `min_similarity`, and returns the best `top_k`
+# of the rest by similarity. Nothing is built for the dropped results, and the top k are picked with a heap
+def select_results(results:         Optional[list],
+                   *,
+                   min_similarity:  Optional[float] = None,
+                   index_allowlist: Optional[Collection[int]] = None,
+                   top_k:           Optional[int] = None,
+                   ) -> Tuple[list, FilteredCounts]:
+    if not results:
+        return [], FilteredCounts()
+
+    kept = results
+    if index_allowlist is not None:
+        kept = [result for result in kept if result['header']['index_id'] in index_allowlist]
+    outside_allowlist = len(results) - len(kept)
+
+    count = len(kept)
+    if min_similarity is not None:
+        kept = [result for result in kept if _similarity(result) >= min_similarity]
+    below_similarity = count - len(kept)
+
+    count = len(kept)
+    if top_k is not None and top_k < count:
+        # Same order as the sort below, ties keep their order in the response
+        kept = heapq.nlargest(max(top_k, 0), kept, key=_similarity)
+    else:
+        kept = sorted(kept, key=_similarity, reverse=True)
+
+    return kept, FilteredCounts(outside_allowlist, below_similarity, count - len(kept))
+
+
+# Builds the function that picks a field out of a result's data: the value of the first key of `rule`
+# found in the data. An entry of the rule is a key or a (key, convert) pair, and the value of a pair's
+# key is passed through `convert`. Without any of the keys the field is None, or `default()` if it is set.
+# The rule is resolved once into (key, convert) pairs, so extracting a field is a loop over them
+def _compile_rule(rule: Sequence, default: Optional[Callable] = None) -> Callable[[dict], Any]:
+    pairs = tuple((entry, None) if isinstance(entry, str) else tuple(entry) for entry in rule)
+
+    def extract(data):
+        for key, convert in pairs:
+            if key in data:
+                return data[key] if convert is None else convert(data[key])
+        return default() if default is not None else None
+
+    return extract
+
+
+def _first_item(value):
+    return value[0] if isinstance(value, list) else value
+
+
+def _getchu_urls(getchu_id):
+    return [f'http://www.getchu.com/soft.phtml?id={getchu_id}']
+
+
+_CONTAINERS = {}
+
+
+# Makes the decorated class the container of the results of these indexes
+def register(*index_ids: int) -> Callable[[type], type]:
+    def decorator(cls):
+        for index_id in index_ids:
+            _CONTAINERS[index_id] = cls
+        return cls
+    return decorator
+
+
+# The container class of the results of an index, BasicSauce for the indexes without their own
+def container_for(index_id: int) -> type:
+    return _CONTAINERS.get(index_id, BasicSauce)
+
+
+# `_TITLE_RULE`, `_URLS_RULE` and `_AUTHOR_RULE` list the keys a field is read from, in order of
+# priority. They are compiled into `_get_title`, `_get_urls` and `_get_author` once per class, so
+# a subclass only overrides the rules of its indexes
 class BasicSauce:
-    def __init__(self, raw):
+    __slots__ = ('raw', 'similarity', 'thumbnail', 'index_id', 'index_name', 'title', 'urls', 'author')
+
+    # Order is important!
+    _TITLE_RULE = ('title', 'eng_name', 'material', 'source', 'created_at')
+    _URLS_RULE = ('ext_urls', ('getchu_id', _getchu_urls))
+    _AUTHOR_RULE = ('author', 'author_name', 'member_name', 'pawoo_user_username', 'twitter_user_handle', 'company',
+                    ('creator', _first_item))
+
+    def __init__(self, raw, *, keep_raw: bool = True, data_keys: Optional[Iterable[str]] = None):
         result_header = raw['header']
+        data = raw['data']
 
-        self.raw:        dict = raw
+        self.raw:        Optional[dict] = _trim_raw(raw, keep_raw, data_keys)
         self.similarity: float = float(result_header['similarity'])
         self.thumbnail:  str = result_header['thumbnail']
         self.index_id:   int = result_header['index_id']
         self.index_name: str = result_header['index_name']
-        self.title:      Optional[str] = self._get_title(raw['data'])
-        self.urls:       List[str] = self._get_urls(raw['data'])
-        self.author:     Optional[str] = self._get_author(raw['data'])
+        self.title:      Optional[str] = self._get_title(data)
+        self.urls:       List[str] = self._get_urls(data)
+        self.author:     Optional[str] = self._get_author(data)
 
-    @staticmethod
-    def _get_title(data):
-        # Order is important!
-        if 'title' in data:
-            return data['title']
-        elif 'eng_name' in data:
-            return data['eng_name']
-        elif 'material' in data:
-            return data['material']
-        elif 'source' in data:
-            return data['source']
-        elif 'created_at' in data:
-            return data['created_at']
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._compile_rules()
 
-    @staticmethod
-    def _get_urls(data):
-        if 'ext_urls' in data:
-            return data['ext_urls']
-        elif 'getchu_id' in data:
-            return [f'http://www.getchu.com/soft.phtml?id={data["getchu_id"]}']
-        return []
-
-    @staticmethod
-    def _get_author(data):
-        # Order is important!
-        if 'author' in data:
-            return data['author']
-        elif 'author_name' in data:
-            return data['author_name']
-        elif 'member_name' in data:
-            return data['member_name']
-        elif 'pawoo_user_username' in data:
-            return data['pawoo_user_username']
-        elif 'twitter_user_handle' in data:
-            return data['twitter_user_handle']
-        elif 'company' in data:
-            return data['company']
-        elif 'creator' in data:
-            if isinstance(data['creator'], list):
-                return data['creator'][0]
-            return data['creator']
+    @classmethod
+    def _compile_rules(cls):
+        cls._get_title = staticmethod(_compile_rule(cls._TITLE_RULE))
+        cls._get_urls = staticmethod(_compile_rule(cls._URLS_RULE, default=list))
+        cls._get_author = staticmethod(_compile_rule(cls._AUTHOR_RULE))
 
     def __repr__(self):
-        return f'<BasicSauce(title={repr(self.title)}, similarity={self.similarity:.2f})>'
+        return f'<{type(self).__name__}(title={repr(self.title)}, similarity={self.similarity:.2f})>'
+
 
+BasicSauce._compile_rules()
 
+
+@register(DB.HMagazines, DB.Madokami, DB.MangaDex)
 class BookSauce(BasicSauce):
-    def __init__(self, raw):
-        super().__init__(raw)
+    __slots__ = ('part',)
+
+    def __init__(self, raw, **kwargs):
+        super().__init__(raw, **kwargs)
         data = raw['data']
 
         self.part: str = data['part']
@@ -73,9 +156,12 @@ class BookSauce(BasicSauce):
         return f'<BookSauce(title={repr(self.title)}, part={repr(self.part)}, similarity={self.similarity:.2f})>'
 
 
+@register(DB.Anime, DB.HAnime, DB.Movies, DB.Shows)
 class VideoSauce(BasicSauce):
-    def __init__(self, raw):
-        super().__init__(raw)
+    __slots__ = ('part', 'year', 'est_time')
+
+    def __init__(self, raw, **kwargs):
+        super().__init__(raw, **kwargs)
         data = raw['data']
 
         self.part:     str = data['part']
@@ -86,15 +172,103 @@ class VideoSauce(BasicSauce):
         return f'<VideoSauce(title={repr(self.title)}, part={repr(self.part)}, similarity={self.similarity:.2f})>'
 
 
+@register(DB.Pixiv_Images, DB.Pixiv_Historical)
+class PixivSauce(BasicSauce):
+    __slots__ = ('pixiv_id', 'member_id')
+
+    _TITLE_RULE = ('title',)
+    _AUTHOR_RULE = ('member_name',)
+
+    def __init__(self, raw, **kwargs):
+        super().__init__(raw, **kwargs)
+        data = raw['data']
+
+        self.pixiv_id:  Optional[int] = data.get('pixiv_id')
+        self.member_id: Optional[int] = data.get('member_id')
+
+
+# A result of an imageboard. A post is often found on several boards and the data has the ids of all of them,
+# `post_id` is the id on the board of the result's index
+@register(DB.Danbooru, DB.Yandere, DB.Gelbooru, DB.Konachan, DB.SankakuChannel, DB.AnimePicturesnet, DB.E621net,
+          DB.IdolComplex)
+class BooruSauce(BasicSauce):
+    __slots__ = ('post_id', 'characters', 'material', 'source')
+
+    _TITLE_RULE = ('title', 'material', 'source')
+    _AUTHOR_RULE = ('author', ('creator', _first_item))
+    _POST_ID_KEYS = {
+        DB.Danbooru:         'danbooru_id',
+        DB.Yandere:          'yandere_id',
+        DB.Gelbooru:         'gelbooru_id',
+        DB.Konachan:         'konachan_id',
+        DB.SankakuChannel:   'sankaku_id',
+        DB.AnimePicturesnet: 'anime-pictures_id',
+        DB.E621net:          'e621_id',
+        DB.IdolComplex:      'idol_id',
+    }
+
+    def __init__(self, raw, **kwargs):
+        super().__init__(raw, **kwargs)
+        data = raw['data']
+
+        self.post_id:    Optional[int] = data.get(self._POST_ID_KEYS.get(self.index_id))
+        self.characters: Optional[str] = data.get('characters')
+        self.material:   Optional[str] = data.get('material')
+        self.source:     Optional[str] = data.get('source')
+
+
+@register(DB.Twitter)
+class TwitterSauce(BasicSauce):
+    __slots__ = ('tweet_id', 'user_id', 'created_at')
+
+    _TITLE_RULE = ('created_at',)
+    _AUTHOR_RULE = ('twitter_user_handle',)
+
+    def __init__(self, raw, **kwargs):
+        super().__init__(raw, **kwargs)
+        data = raw['data']
+
+        self.tweet_id:   Optional[str] = data.get('tweet_id')
+        self.user_id:    Optional[str] = data.get('twitter_user_id')
+        self.created_at: Optional[str] = data.get('created_at')
+
+
 class SauceResponse:
-    _BOOK_INDEXES = [DB.HMagazines, DB.Madokami, DB.MangaDex]
-    _VIDEO_INDEXES = [DB.Anime, DB.HAnime, DB.Movies, DB.Shows]
+    __slots__ = ('raw', 'user_id', 'account_type', 'short_limit', 'long_limit', 'long_remaining', 'short_remaining',
+                 'status', 'results_requested', 'search_depth', 'minimum_similarity', 'results_returned', 'results',
+                 'filtered')
+
+    # `keep_raw=False` drops the raw JSON, and `data_keys` keeps only these keys of every result's data.
+    # `min_similarity`, `index_allowlist` and `top_k` drop results before they are built, see `select_results`,
+    # and the raw JSON keeps only the results that are left
+    def __init__(self,
+                 resp,
+                 *,
+                 keep_raw:        bool = True,
+                 data_keys:       Optional[Iterable[str]] = None,
+                 min_similarity:  Optional[float] = None,
+                 index_allowlist: Optional[Iterable[int]] = None,
+                 top_k:           Optional[int] = None,
+                 ):
+        if data_keys is not None:
+            data_keys = frozenset(data_keys)
+        if index_allowlist is not None:
+            index_allowlist = frozenset(index_allowlist)
 
-    def __init__(self, resp):
         resp_header = resp['header']
-        parsed_results = self._parse_results(resp['results'])
+        raw_results, filtered = select_results(resp['results'], min_similarity=min_similarity,
+                                               index_allowlist=index_allowlist, top_k=top_k)
+        parsed_results = [self._parse_result(result, keep_raw=keep_raw, data_keys=data_keys)
+                          for result in raw_results]
+
+        if not keep_raw:
+            resp = None
+        elif data_keys is not None:
+            resp = {'header': resp_header, 'results': [result.raw for result in parsed_results]}
+        elif filtered.total:
+            resp = {'header': resp_header, 'results': raw_results}
 
-        self.raw:                 dict = resp
+        self.raw:                 Optional[dict] = resp
         self.user_id:             int = resp_header['user_id']
         self.account_type:        int = resp_header['account_type']
         self.short_limit:         str = resp_header['short_limit']
@@ -107,23 +281,11 @@ class SauceResponse:
         self.minimum_similarity:  float = resp_header['minimum_similarity']
         self.results_returned:    int = resp_header['results_returned']
         self.results:             List[BasicSauce] = parsed_results
+        self.filtered:            FilteredCounts = filtered
 
-    def _parse_results(self, results):
-        if results is None:
-            return []
-
-        sorted_results = sorted(results, key=lambda r: float(r['header']['similarity']), reverse=True)
-
-        parsed_results = []
-        for result in sorted_results:
-            index_id = result['header']['index_id']
-            if index_id in self._BOOK_INDEXES:
-                parsed_results.append(BookSauce(result))
-            elif index_id in self._VIDEO_INDEXES:
-                parsed_results.append(VideoSauce(result))
-            else:
-                parsed_results.append(BasicSauce(result))
-        return parsed_results
+    @staticmethod
+    def _parse_result(result, **kwargs):
+        return _CONTAINERS.get(result['header']['index_id'], BasicSauce)(result, **kwargs)
 
     def __len__(self):
         return len(self.results)
@@ -137,3 +299,97 @@ class SauceResponse:
     def __repr__(self):
         return (f'<SauceResponse(count={repr(len(self.results))}, long_remaining={repr(self.long_remaining)}, '
                 f'short_remaining={repr(self.short_remaining)})>')
+
+
+# Reads the header fields on first access and builds a result container only when it is indexed or iterated.
+# The filters are applied once when the response is made, and the raw JSON keeps only the remaining results
+# like SauceResponse's. The raw JSON is kept even with `keep_raw=False`, which only applies to the results
+class LazySauceResponse(SauceResponse):
+    __slots__ = ('_parse_options',)
+
+    _HEADER_FIELDS = frozenset(('user_id', 'account_type', 'short_limit', 'long_limit', 'long_remaining',
+                                'short_remaining', 'status', 'results_requested', 'search_depth',
+                                'minimum_similarity', 'results_returned'))
+
+    def __init__(self,
+                 resp,
+                 *,
+                 keep_raw:        bool = True,
+                 data_keys:       Optional[Iterable[str]] = None,
+                 min_similarity:  Optional[float] = None,
+                 index_allowlist: Optional[Iterable[int]] = None,
+                 top_k:           Optional[int] = None,
+                 ):
+        if data_keys is not None:
+            data_keys = frozenset(data_keys)
+
+        self._parse_options = {'keep_raw': keep_raw, 'data_keys': data_keys}
+        if min_similarity is not None or index_allowlist is not None or top_k is not None:
+            if index_allowlist is not None:
+                index_allowlist = frozenset(index_allowlist)
+            raw_results, self.filtered = select_results(resp['results'], min_similarity=min_similarity,
+                                                        index_allowlist=index_allowlist, top_k=top_k)
+            if self.filtered.total:
+                resp = {'header': resp['header'], 'results': raw_results}
+        self.raw: dict = resp
+
+    def __getattr__(self, name):
+        if name == 'results':
+            value = LazyResults(self.raw['results'] or [], partial(self._parse_result, **self._parse_options))
+        elif name == 'filtered':
+            value = FilteredCounts()
+        elif name in self._HEADER_FIELDS:
+            value = self.raw['header'][name]
+        else:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+        setattr(self, name, value)
+        return value
+
+
+class LazyResults(Sequence):
+    __slots__ = ('_raw_results', '_parse_result', '_order', '_parsed')
+
+    def __init__(self, raw_results, parse_result):
+        self._raw_results = raw_results
+        self._parse_result = parse_result
+        self._order = None
+        self._parsed = {}
+
+    def __len__(self):
+        return len(self._raw_results)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('results index out of range')
+
+        parsed = self._parsed.get(item)
+        if parsed is None:
+            parsed = self._parsed[item] = self._parse_result(self._raw_results[self._position(item)])
+        return parsed
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyResults)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _position(self, item):
+        similarity = self._similarity
+        # The best result doesn't need the full sort, max() picks the same one as the stable sort
+        if self._order is None and item == 0:
+            return max(range(len(self._raw_results)), key=similarity)
+
+        if self._order is None:
+            self._order = sorted(range(len(self._raw_results)), key=similarity, reverse=True)
+        return self._order[item]
+
+    def _similarity(self, position):
+        return float(self._raw_results[position]['header']['similarity'])
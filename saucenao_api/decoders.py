@@ -0,0 +1,21 @@
+import json
+from typing import Any, Callable
+
+JsonLoads = Callable[[bytes], Any]
+
+
+# Picks the fastest installed decoder, all of them decode straight from bytes
+def default_loads() -> JsonLoads:
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        pass
+
+    try:
+        import ujson
+        return ujson.loads
+    except ImportError:
+        pass
+
+    return json.loads
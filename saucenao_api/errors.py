@@ -1,9 +1,14 @@
+from typing import Optional
+
+
 class SauceNaoApiError(Exception):
     pass
 
 
 class UnknownApiError(SauceNaoApiError):
-    pass
+    def __init__(self, *args, status_code: Optional[int] = None):
+        super().__init__(*args)
+        self.status_code = status_code
 
 
 class UnknownServerError(UnknownApiError):
@@ -32,3 +37,7 @@ class ShortLimitReachedError(LimitReachedError):
 
 class LongLimitReachedError(LimitReachedError):
     pass
+
+
+class UnrecordedRequestError(SauceNaoApiError):
+    pass
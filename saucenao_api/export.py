@@ -0,0 +1,192 @@
+from array import array
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+from .containers import BookSauce, SauceResponse, VideoSauce, container_for
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+Response = Union[SauceResponse, dict]
+
+# Columns of an export, one row per result: name, array typecode for numbers or None for strings,
+# NumPy dtype and Arrow type name. `response` is the position of the result's response in the input
+COLUMNS = (
+    ('response',        'q',  'i8', 'int64'),
+    ('similarity',      'f',  'f4', 'float32'),
+    ('index_id',        'h',  'i2', 'int16'),
+    ('title',           None, 'O',  'string'),
+    ('author',          None, 'O',  'string'),
+    ('url',             None, 'O',  'string'),
+    ('part',            None, 'O',  'string'),
+    ('year',            None, 'O',  'string'),
+    ('est_time',        None, 'O',  'string'),
+    ('short_limit',     'i',  'i4', 'int32'),
+    ('short_remaining', 'i',  'i4', 'int32'),
+    ('long_limit',      'i',  'i4', 'int32'),
+    ('long_remaining',  'i',  'i4', 'int32'),
+)
+CHUNK_SIZE = 100_000
+
+
+# Collects the columns of the results of many responses straight from their raw JSON, without building
+# the result containers. Numbers are kept in typed arrays, which NumPy and Arrow use without a copy.
+# Titles, authors and URLs are picked by the rules of the container of each index, and `part`, `year` and
+# `est_time` are only set for the indexes that have a BookSauce or a VideoSauce. A response's raw JSON only keeps
+# the results left by its filters, so the dropped ones are not exported
+class ColumnBuilder:
+    def __init__(self) -> None:
+        self.responses = 0
+        self.clear()
+
+    def __len__(self):
+        return len(self._columns['response'])
+
+    def clear(self) -> None:
+        self._columns = {name: array(typecode) if typecode else [] for name, typecode, _, _ in COLUMNS}
+
+    def add(self, response: Response) -> None:
+        raw = response if isinstance(response, dict) else response.raw
+        if raw is None:
+            raise ValueError('The response was built with keep_raw=False, export the raw JSON instead')
+
+        header = raw['header']
+        results = raw['results'] or ()
+        position = self.responses
+        self.responses += 1
+        if not results:
+            return
+
+        columns = self._columns
+        for result in results:
+            result_header = result['header']
+            data = result['data']
+            index_id = result_header['index_id']
+            columns['similarity'].append(float(result_header['similarity']))
+            columns['index_id'].append(index_id)
+            container = container_for(index_id)
+            columns['title'].append(container._get_title(data))
+            columns['author'].append(container._get_author(data))
+            urls = container._get_urls(data)
+            columns['url'].append(urls[0] if urls else None)
+
+            video = issubclass(container, VideoSauce)
+            columns['part'].append(_string(data.get('part')) if video or issubclass(container, BookSauce) else None)
+            columns['year'].append(_string(data.get('year')) if video else None)
+            columns['est_time'].append(_string(data.get('est_time')) if video else None)
+
+        count = len(results)
+        columns['response'].extend(array('q', [position]) * count)
+        for name in ('short_limit', 'short_remaining', 'long_limit', 'long_remaining'):
+            columns[name].extend(array('i', [int(header[name])]) * count)
+
+    def to_numpy(self) -> 'np.ndarray':
+        _require(np, 'numpy')
+        table = np.empty(len(self), dtype=[(name, dtype) for name, _, dtype, _ in COLUMNS])
+        for name, typecode, dtype, _ in COLUMNS:
+            column = self._columns[name]
+            table[name] = np.frombuffer(column, dtype=dtype) if typecode else column
+        return table
+
+    def to_arrow(self) -> 'pa.RecordBatch':
+        _require(pa, 'pyarrow')
+        arrays = []
+        for name, typecode, _, type_name in COLUMNS:
+            column = self._columns[name]
+            arrow_type = getattr(pa, type_name)()
+            if typecode:
+                arrays.append(pa.Array.from_buffers(arrow_type, len(column), [None, pa.py_buffer(column)]))
+            else:
+                arrays.append(pa.array(column, type=arrow_type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema())
+
+
+def schema() -> 'pa.Schema':
+    _require(pa, 'pyarrow')
+    return pa.schema([(name, getattr(pa, type_name)()) for name, _, _, type_name in COLUMNS])
+
+
+def to_numpy(responses: Iterable[Response]) -> 'np.ndarray':
+    builder = ColumnBuilder()
+    for response in responses:
+        builder.add(response)
+    return builder.to_numpy()
+
+
+def to_arrow(responses: Iterable[Response], chunk_size: int = CHUNK_SIZE) -> 'pa.Table':
+    _require(pa, 'pyarrow')
+    return pa.Table.from_batches(list(iter_batches(responses, chunk_size)), schema=schema())
+
+
+# Record batches of about `chunk_size` rows, so a stream of responses is never held in memory at once
+def iter_batches(responses: Iterable[Response], chunk_size: int = CHUNK_SIZE) -> Iterator['pa.RecordBatch']:
+    _require(pa, 'pyarrow')
+    builder = ColumnBuilder()
+    for response in responses:
+        builder.add(response)
+        if len(builder) >= chunk_size:
+            yield builder.to_arrow()
+            builder.clear()
+    if len(builder):
+        yield builder.to_arrow()
+
+
+# Writes the responses to a Parquet file, one row group per chunk. Returns the number of rows
+def write_parquet(responses:   Iterable[Response],
+                  path:        str,
+                  *,
+                  chunk_size:  int = CHUNK_SIZE,
+                  compression: Optional[str] = 'snappy',
+                  ) -> int:
+    _require(pa, 'pyarrow')
+    rows = 0
+    with pa.parquet.ParquetWriter(path, schema(), compression=compression) as writer:
+        for batch in iter_batches(responses, chunk_size):
+            writer.write_table(pa.Table.from_batches([batch]))
+            rows += batch.num_rows
+    return rows
+
+
+# Writes the responses to a Feather (Arrow IPC) file in chunks. Without compression the file can be
+# read back without copying it. Returns the number of rows
+def write_feather(responses:   Iterable[Response],
+                  path:        str,
+                  *,
+                  chunk_size:  int = CHUNK_SIZE,
+                  compression: Optional[str] = None,
+                  ) -> int:
+    _require(pa, 'pyarrow')
+    rows = 0
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema(), options=options) as writer:
+        for batch in iter_batches(responses, chunk_size):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+# Reads a file written by `write_parquet` or `write_feather` with memory mapping
+def read_table(path: str, columns: Optional[Sequence[str]] = None) -> 'pa.Table':
+    _require(pa, 'pyarrow')
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == b'PAR1':
+        return pa.parquet.read_table(path, columns=columns, memory_map=True)
+    return pa.feather.read_table(path, columns=columns, memory_map=True)
+
+
+def _string(value):
+    return str(value) if value is not None else None
+
+
+def _require(module, name):
+    if module is None:
+        raise ImportError(f'Columnar export requires {name}: pip install saucenao_api[export]')
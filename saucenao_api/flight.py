@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+
+# Runs `func` once for all threads calling `do` with the same key at the same time. The others wait for it
+# and get its result, or its exception
+class SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = func(*args)
+        except BaseException as exc:
+            self._finish(key)
+            call.set_exception(exc)
+            raise
+
+        self._finish(key)
+        call.set_result(result)
+        return result
+
+    def _finish(self, key):
+        # Calls that come after this get a new flight
+        with self._lock:
+            del self._calls[key]
+
+
+# The coroutine runs in its own task, so a cancelled caller doesn't cancel the search for the others
+class AsyncSingleFlight:
+    def __init__(self) -> None:
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda _: self._finish(key, task))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        del self._calls[key]
+        # Marks the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,61 @@
+import threading
+from typing import Callable, Iterable, List, Tuple
+
+from .errors import BadKeyError, LimitReachedError, LongLimitReachedError, SauceNaoApiError
+from .quota import Pacer, SharedPacer
+
+
+# Spreads requests across several API keys. Every key has its own pacer, and the key that can send
+# the next request the soonest is picked, preferring the one with the most daily quota left.
+class KeyPool:
+    def __init__(self, keys: Iterable[str], *, pacer_factory: Callable[[], Pacer] = Pacer) -> None:
+        self._pacers = {key: pacer_factory() for key in keys}
+        # Pacers in a shared store do I/O on every call, so the async client calls the pool off the event loop
+        self.shared = any(isinstance(pacer, SharedPacer) for pacer in self._pacers.values())
+        self._lock = threading.RLock()
+
+        if not self._pacers:
+            raise ValueError('At least one API key is required')
+
+    def __len__(self):
+        return len(self._pacers)
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self._pacers)
+
+    def acquire(self) -> Tuple[str, Pacer]:
+        with self._lock:
+            if not self._pacers:
+                raise BadKeyError('All API keys are invalid')
+
+            candidates = [(key, pacer) for key, pacer in self._pacers.items() if not pacer.exhausted]
+            if not candidates:
+                raise LongLimitReachedError('24 hours limit reached')
+
+            return min(candidates, key=self._rank)
+
+    # Picks a key like `acquire` and reserves a permit on its pacer under the same lock, so that two threads
+    # can't both take the last free slot of one key. Returns the key, its pacer and how long to wait
+    def reserve(self) -> Tuple[str, Pacer, float]:
+        with self._lock:
+            key, pacer = self.acquire()
+            return key, pacer, pacer.reserve()
+
+    def report(self, key: str, exc: SauceNaoApiError) -> None:
+        if isinstance(exc, BadKeyError):
+            with self._lock:
+                self._pacers.pop(key, None)
+        elif isinstance(exc, LimitReachedError):
+            pacer = self._pacers.get(key)
+            if pacer is not None:
+                pacer.penalize(exc)
+
+    @staticmethod
+    def _rank(item):
+        pacer = item[1]
+        state = pacer.state
+        # Keys without a known quota are tried first
+        if state is None:
+            return pacer.delay(), float('-inf'), 0
+        return pacer.delay(), -state.long_remaining, -state.short_remaining
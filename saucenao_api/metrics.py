@@ -0,0 +1,237 @@
+import abc
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, Optional, Sequence
+
+# Metrics reported by the clients:
+#   saucenao_requests_total{status, error}   counter, one per HTTP request
+#   saucenao_request_seconds                 histogram, from sending a request to its decoded response
+#   saucenao_phase_seconds{phase}            histogram, phases are connect, upload, wait, download, decode and build.
+#                                            connect and upload are only measured for files, for URLs
+#                                            the time up to the response headers is all wait
+#   saucenao_uploaded_bytes_total            counter
+#   saucenao_downloaded_bytes_total          counter
+#   saucenao_short_remaining                 gauge
+#   saucenao_long_remaining                  gauge
+#   saucenao_planned_searches_total{stage}   counter, with a QueryPlanner: narrow searches with a match (narrow),
+#                                            without one (widened) and searches of all the indexes (all)
+_HELP = {
+    'saucenao_requests_total': 'SauceNAO API requests by status code and error class.',
+    'saucenao_request_seconds': 'Time from sending a request to its decoded response.',
+    'saucenao_phase_seconds': 'Time spent in each phase of a search.',
+    'saucenao_uploaded_bytes_total': 'Bytes of multipart bodies uploaded.',
+    'saucenao_downloaded_bytes_total': 'Bytes of response bodies downloaded.',
+    'saucenao_short_remaining': 'Remaining searches in the 30 seconds window.',
+    'saucenao_long_remaining': 'Remaining searches in the 24 hours window.',
+    'saucenao_planned_searches_total': 'Searches planned by the query planner by stage.',
+}
+
+
+class MetricsSink(abc.ABC):
+    @abc.abstractmethod
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def set(self, name: str, value: float, **labels: str) -> None:
+        ...
+
+
+# Keeps the metrics in memory and renders them in the Prometheus text format
+class PrometheusMetrics(MetricsSink):
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            counts = histogram[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def value(self, name: str, **labels: str) -> Optional[float]:
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][2]
+            return self._counters.get(key, self._gauges.get(key))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name, samples in _group(metrics):
+                    lines.extend(_header(name, kind))
+                    lines.extend(f'{name}{_labels(labels)} {_number(value)}' for labels, value in samples)
+
+            for name, samples in _group(self._histograms):
+                lines.extend(_header(name, 'histogram'))
+                for labels, (counts, total, count) in samples:
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                    lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    # Serves `render()` on http://address:port/metrics from a daemon thread
+    def serve(self, port: int, address: str = '') -> HTTPServer:
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', metrics.CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = _ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# Collects the phases of one request and reports them to the sink when the request is done
+class RequestTimer:
+    __slots__ = ('sink', 'status', 'uploaded', 'downloaded', '_clock', '_started', '_last', '_phases')
+
+    def __init__(self, sink: MetricsSink, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.sink = sink
+        self.status = ''
+        self.uploaded = 0
+        self.downloaded = 0
+
+        self._clock = clock
+        self._started = self._last = clock()
+        self._phases = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.finish(exc_type.__name__ if exc_type is not None else '')
+
+    # Ends the phase that started with the previous mark
+    def mark(self, phase: str) -> None:
+        now = self._clock()
+        self._phases.append((phase, now - self._last))
+        self._last = now
+
+    def wrap(self, body):
+        return _TimedBody(body, self)
+
+    def finish(self, error: str = '') -> None:
+        sink = self.sink
+        sink.increment('saucenao_requests_total', status=str(self.status), error=error)
+        if not error:
+            sink.observe('saucenao_request_seconds', self._clock() - self._started)
+        for phase, seconds in self._phases:
+            sink.observe('saucenao_phase_seconds', seconds, phase=phase)
+        if self.uploaded:
+            sink.increment('saucenao_uploaded_bytes_total', self.uploaded)
+        if self.downloaded:
+            sink.increment('saucenao_downloaded_bytes_total', self.downloaded)
+
+
+# Marks `connect` when the HTTP client starts reading the body, and `upload` when it has read all of it
+class _TimedBody:
+    def __init__(self, body, timer):
+        self._body = body
+        self._timer = timer
+        self._state = 0
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+    def __len__(self):
+        return len(self._body)
+
+    def __iter__(self):
+        return iter(lambda: self.read(self._body.CHUNK_SIZE), b'')
+
+    def read(self, size=-1):
+        if self._state == 0:
+            self._timer.mark('connect')
+            self._state = 1
+
+        chunk = self._body.read(size)
+        self._timer.uploaded += len(chunk)
+        if self._state == 1 and self._body.tell() >= len(self._body):
+            self._timer.mark('upload')
+            self._state = 2
+        return chunk
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _group(metrics):
+    grouped = {}
+    for (name, labels), value in metrics.items():
+        grouped.setdefault(name, []).append((labels, value))
+    return sorted((name, sorted(samples)) for name, samples in grouped.items())
+
+
+def _header(name, kind):
+    if name in _HELP:
+        yield f'# HELP {name} {_HELP[name]}'
+    yield f'# TYPE {name} {kind}'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -6,6 +6,7 @@ class DB(enum.auto):
     HGame_CG = 2
     DoujinshiDB = 3
     Pixiv_Images = 5
+    Pixiv_Historical = 6
     Nico_Nico_Seiga = 8
     Danbooru = 9
     Drawr_Images = 10
@@ -0,0 +1,266 @@
+import io
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Optional
+
+try:
+    import numpy as np
+    from PIL import Image, UnidentifiedImageError
+except ImportError:
+    np = None
+
+_SIGN_BIT = 1 << 63
+
+
+def dhash(content: bytes, size: int = 8) -> int:
+    image = _open_grayscale(content, (size + 1, size))
+    pixels = np.asarray(image, dtype=np.int16)
+    return _pack_bits(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(content: bytes, size: int = 8, highfreq_factor: int = 4) -> int:
+    side = size * highfreq_factor
+    image = _open_grayscale(content, (side, side))
+    pixels = np.asarray(image, dtype=np.float64)
+
+    dct = _dct_matrix(side)
+    low_freq = (dct @ pixels @ dct.T)[:size, :size]
+    return _pack_bits(low_freq > np.median(low_freq))
+
+
+# Finds responses of images within `max_distance` bits of a known image hash.
+#
+# The hashes are split into `max_distance + 1` chunks, and every chunk has its own table of buckets. Two hashes
+# that differ by at most `max_distance` bits have at least one equal chunk, so only a few buckets have to be
+# checked, and their candidates are compared in one vectorized pass. The hashes and the raw responses are
+# stored in SQLite when `path` is set, the tables are rebuilt from it on open.
+#
+# Like the caches, `max_entries` keeps only the most recently used images and `ttl` drops images added more
+# than `ttl` seconds ago. Without them the index grows with every new image
+class PerceptualIndex:
+    EVICT_INTERVAL = 100
+
+    def __init__(self,
+                 path:         Optional[str] = None,
+                 max_distance: int = 4,
+                 *,
+                 hash_func:    Callable[[bytes], int] = dhash,
+                 max_entries:  Optional[int] = None,
+                 ttl:          Optional[float] = None,
+                 clock:        Callable[[], float] = time.time,
+                 ) -> None:
+        if np is None:
+            raise ImportError('Perceptual hashing requires Pillow and numpy: pip install saucenao_api[phash]')
+        if not 0 <= max_distance < 64:
+            raise ValueError('max_distance must be between 0 and 63')
+
+        self.path = path
+        self.max_distance = max_distance
+        self.hash_func = hash_func
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._namespaces = {}
+        # Row ids from the least to the most recently used, with their namespace and when they were added
+        self._entries = OrderedDict()
+        self._raws = {}
+        self._next_id = 0
+        self._adds = 0
+
+        self._conn = None
+        if path is not None:
+            self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS images ('
+                               'id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, hash INTEGER NOT NULL, '
+                               'raw TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+            rows = self._conn.execute('SELECT id, namespace, hash, created FROM images ORDER BY accessed')
+            for row_id, namespace, image_hash, created in rows:
+                self._insert(row_id, namespace, image_hash % (1 << 64), created)
+            with self._lock:
+                self._evict(expired=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+
+    # Returns None for files that can't be decoded as images
+    def hash(self, content: bytes) -> Optional[int]:
+        try:
+            return self.hash_func(content)
+        except (UnidentifiedImageError, OSError, ValueError):
+            return None
+
+    def find(self, image_hash: int, namespace: str = '') -> Optional[dict]:
+        with self._lock:
+            tables = self._namespaces.get(namespace)
+            row_id = None
+            while tables is not None:
+                row_id = tables.nearest(image_hash, self.max_distance)
+                if row_id is None or not self._expired(self._entries[row_id][1]):
+                    break
+                # A farther image may still be fresh
+                self._remove([row_id])
+            if row_id is None:
+                return None
+
+            self._entries.move_to_end(row_id)
+            if self._conn is None:
+                return self._raws[row_id]
+            self._conn.execute('UPDATE images SET accessed = ? WHERE id = ?', (self._clock(), row_id))
+            row = self._conn.execute('SELECT raw FROM images WHERE id = ?', (row_id,)).fetchone()
+        return json.loads(row[0])
+
+    def add(self, image_hash: int, raw: dict, namespace: str = '') -> None:
+        now = self._clock()
+        with self._lock:
+            if self._conn is None:
+                row_id = self._next_id
+                self._next_id += 1
+                self._raws[row_id] = raw
+            else:
+                # SQLite integers are signed
+                signed_hash = image_hash - (1 << 64) if image_hash & _SIGN_BIT else image_hash
+                row_id = self._conn.execute('INSERT INTO images (namespace, hash, raw, created, accessed) '
+                                            'VALUES (?, ?, ?, ?, ?)',
+                                            (namespace, signed_hash, json.dumps(raw, ensure_ascii=False), now, now)
+                                            ).lastrowid
+            self._insert(row_id, namespace, image_hash, now)
+            self._adds += 1
+            self._evict(expired=self._adds % self.EVICT_INTERVAL == 0)
+
+    def _insert(self, row_id, namespace, image_hash, created):
+        tables = self._namespaces.get(namespace)
+        if tables is None:
+            tables = self._namespaces[namespace] = _ChunkTables(self.max_distance + 1)
+        tables.add(image_hash, row_id)
+        self._entries[row_id] = (namespace, created)
+
+    # The expired images are looked for only every `EVICT_INTERVAL` adds, `find` skips them in between
+    def _evict(self, expired):
+        if expired and self.ttl is not None:
+            self._remove([row_id for row_id, (_, created) in self._entries.items() if self._expired(created)])
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._remove(list(self._entries)[:len(self._entries) - self.max_entries])
+
+    def _remove(self, row_ids):
+        for row_id in row_ids:
+            namespace, _ = self._entries.pop(row_id)
+            self._namespaces[namespace].remove(row_id)
+            self._raws.pop(row_id, None)
+        if self._conn is not None:
+            self._conn.executemany('DELETE FROM images WHERE id = ?', [(row_id,) for row_id in row_ids])
+
+    def _expired(self, created):
+        return self.ttl is not None and self._clock() - created > self.ttl
+
+
+class _ChunkTables:
+    def __init__(self, chunks):
+        bounds = [round(64 * i / chunks) for i in range(chunks + 1)]
+        self._chunks = [(start, (1 << (stop - start)) - 1) for start, stop in zip(bounds, bounds[1:])]
+        self._buckets = [{} for _ in self._chunks]
+
+        # Slot `i` of the hashes belongs to the row `ids[i]`, buckets keep slots. The slots of removed rows
+        # are only taken out of the buckets, and reclaimed when the arrays are full
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._ids = np.empty(1024, dtype=np.int64)
+        self._slots = {}
+        self._size = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, image_hash, row_id):
+        if self._size == len(self._hashes):
+            if len(self._slots) <= self._size // 2:
+                self._compact()
+            else:
+                self._hashes = np.resize(self._hashes, self._size * 2)
+                self._ids = np.resize(self._ids, self._size * 2)
+
+        slot = self._size
+        self._hashes[slot] = image_hash
+        self._ids[slot] = row_id
+        self._slots[row_id] = slot
+        self._size += 1
+
+        for buckets, (shift, mask) in zip(self._buckets, self._chunks):
+            bucket = buckets.get((image_hash >> shift) & mask)
+            if bucket is None:
+                bucket = buckets[(image_hash >> shift) & mask] = array('q')
+            bucket.append(slot)
+
+    def remove(self, row_id):
+        slot = self._slots.pop(row_id)
+        image_hash = int(self._hashes[slot])
+        for buckets, (shift, mask) in zip(self._buckets, self._chunks):
+            key = (image_hash >> shift) & mask
+            bucket = buckets[key]
+            bucket.remove(slot)
+            if not bucket:
+                del buckets[key]
+
+    def _compact(self):
+        live = [(int(self._hashes[slot]), row_id) for row_id, slot in self._slots.items()]
+        self._buckets = [{} for _ in self._chunks]
+        self._slots = {}
+        self._size = 0
+        for image_hash, row_id in live:
+            self.add(image_hash, row_id)
+
+    def nearest(self, image_hash, max_distance):
+        candidates = [np.frombuffer(bucket, dtype=np.int64)
+                      for buckets, (shift, mask) in zip(self._buckets, self._chunks)
+                      for bucket in (buckets.get((image_hash >> shift) & mask),) if bucket]
+        if not candidates:
+            return None
+
+        slots = np.unique(np.concatenate(candidates))
+        distances = _popcount(self._hashes[slots] ^ np.uint64(image_hash))
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None
+        return int(self._ids[slots[best]])
+
+
+def _open_grayscale(content, size):
+    image = Image.open(io.BytesIO(content))
+    image.draft('L', (size[0] * 4, size[1] * 4))
+    return image.convert('L').resize(size, Image.LANCZOS)
+
+
+def _pack_bits(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+if np is not None and hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+elif np is not None:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
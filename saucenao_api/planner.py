@@ -0,0 +1,124 @@
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from .params import DB
+
+
+# The dbmask that selects these indexes, e.g. dbmask([DB.Pixiv_Images, DB.Danbooru])
+def dbmask(indexes: Iterable[int]) -> int:
+    mask = 0
+    for index in indexes:
+        if index == DB.ALL:
+            raise ValueError('DB.ALL is not an index, leave dbmask unset to search all the indexes')
+        if index < 0:
+            raise ValueError(f'Invalid index {index}')
+        mask |= 1 << index
+    return mask
+
+
+def indexes_of(mask: int) -> List[int]:
+    return [index for index in range(mask.bit_length()) if mask >> index & 1]
+
+
+# Learns which indexes the matches of a workload come from, and plans each search as a cascade: a narrow
+# search of the indexes that gave `coverage` of the past matches first, and a search of all the indexes
+# only when nothing in the narrow one reaches `threshold`. A match is a result at or above `threshold`.
+# Nothing is narrowed before `min_matches` matches are seen, and every `explore_every`-th search goes to
+# all the indexes anyway, so an index outside the narrow set can come back into it. With `decay` under 1
+# the past matches count less with every recorded search, so the plan follows a changing workload.
+# Share one planner between clients to share what it learned
+class QueryPlanner:
+    def __init__(self,
+                 threshold:     float = 80.0,
+                 *,
+                 coverage:      float = 0.9,
+                 max_indexes:   Optional[int] = None,
+                 min_matches:   int = 20,
+                 explore_every: Optional[int] = 20,
+                 decay:         float = 1.0,
+                 ) -> None:
+        if not 0 < coverage <= 1:
+            raise ValueError('coverage must be in (0, 1]')
+        if not 0 < decay <= 1:
+            raise ValueError('decay must be in (0, 1]')
+
+        self.threshold = threshold
+        self.coverage = coverage
+        self.max_indexes = max_indexes
+        self.min_matches = min_matches
+        self.explore_every = explore_every
+        self.decay = decay
+
+        # Narrow searches with a match, narrow searches without one, and searches of all the indexes,
+        # right away or after a narrow search
+        self.narrowed = 0
+        self.widened = 0
+        self.full = 0
+
+        self._lock = threading.Lock()
+        self._matches: Dict[int, float] = {}
+        self._total = 0.0
+        self._planned = 0
+        self._mask = None
+        self._stale = False
+
+    @property
+    def matches(self) -> Dict[int, float]:
+        with self._lock:
+            return dict(self._matches)
+
+    # The indexes a narrow search would select now, or None while the planner searches all the indexes
+    @property
+    def indexes(self) -> Optional[List[int]]:
+        mask = self._narrow_mask()
+        return indexes_of(mask) if mask is not None else None
+
+    # The dbmask of the next search's narrow step, or None to search all the indexes at once
+    def plan(self) -> Optional[int]:
+        with self._lock:
+            self._planned += 1
+            if self.explore_every and self._planned % self.explore_every == 0:
+                return None
+        return self._narrow_mask()
+
+    # Learns from the response of a search with the dbmask `mask`, None for all the indexes, and returns
+    # whether it has a match. A narrow search without one is widened by the client
+    def record(self, raw: dict, mask: Optional[int] = None) -> bool:
+        threshold = self.threshold
+        matched = [result['header']['index_id'] for result in raw['results'] or ()
+                   if float(result['header']['similarity']) >= threshold]
+
+        with self._lock:
+            if mask is None:
+                self.full += 1
+            elif matched:
+                self.narrowed += 1
+            else:
+                self.widened += 1
+
+            if self.decay < 1:
+                for index in self._matches:
+                    self._matches[index] *= self.decay
+                self._total *= self.decay
+            for index in matched:
+                self._matches[index] = self._matches.get(index, 0.0) + 1
+            self._total += len(matched)
+            self._stale = self._stale or bool(matched) or self.decay < 1
+        return bool(matched)
+
+    # Fewest indexes, the ones with the most matches first, that gave `coverage` of all the matches
+    def _narrow_mask(self):
+        with self._lock:
+            if self._stale:
+                self._stale = False
+                self._mask = None
+                if self._total >= self.min_matches:
+                    ranked = sorted(self._matches.items(), key=lambda item: item[1], reverse=True)
+                    selected, covered = [], 0.0
+                    for index, matches in ranked[:self.max_indexes]:
+                        selected.append(index)
+                        covered += matches
+                        if covered >= self.coverage * self._total:
+                            break
+                    self._mask = dbmask(selected)
+            return self._mask
@@ -0,0 +1,83 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from .errors import BadFileSizeError
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+
+# Downscales images to a size that is still enough for matching and re-encodes them to JPEG before the upload.
+# The size is checked locally, so an oversized file raises BadFileSizeError without spending a request
+class ImagePreprocessor:
+    MAX_BYTES = 15 * 1024 * 1024
+
+    def __init__(self,
+                 max_side:   int = 1024,
+                 *,
+                 quality:    int = 85,
+                 max_bytes:  int = MAX_BYTES,
+                 cache_size: int = 64,
+                 ) -> None:
+        if Image is None:
+            raise ImportError('Image preprocessing requires Pillow: pip install saucenao_api[image]')
+
+        self.max_side = max_side
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+
+        # Processed bytes of the last files, so that retrying a search doesn't process the file again
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, content: bytes) -> bytes:
+        digest = hashlib.sha256(content).digest()
+        with self._lock:
+            processed = self._cache.get(digest)
+            if processed is not None:
+                self._cache.move_to_end(digest)
+                return processed
+
+        processed = self._process(content)
+        if len(processed) > self.max_bytes:
+            raise BadFileSizeError('File is too large')
+
+        with self._lock:
+            self._cache[digest] = processed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return processed
+
+    def _process(self, content):
+        try:
+            image = Image.open(io.BytesIO(content))
+            image.load()
+        except (UnidentifiedImageError, OSError):
+            # Let the server decide what to do with files that aren't images
+            return bytes(content)
+
+        resized = max(image.size) > self.max_side
+        if resized:
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=self.quality, optimize=True)
+        processed = output.getvalue()
+
+        # Small images may already be more compact than the re-encoded ones
+        if not resized and len(processed) >= len(content):
+            return bytes(content)
+        return processed
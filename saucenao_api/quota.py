@@ -0,0 +1,305 @@
+import abc
+import asyncio
+import bisect
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+from .errors import LimitReachedError, LongLimitReachedError
+from .resp import RespClient
+
+
+class QuotaState(NamedTuple):
+    short_limit:     int
+    short_remaining: int
+    long_limit:      int
+    long_remaining:  int
+    updated_at:      float
+
+    @classmethod
+    def from_header(cls, header: dict) -> 'QuotaState':
+        return cls(int(header['short_limit']), int(header['short_remaining']),
+                   int(header['long_limit']), int(header['long_remaining']), time.time())
+
+
+# Token bucket seeded from the quota fields of every response. A token returns to the bucket one short
+# window after it was spent, so no more than `short_limit` requests are sent in any 30 seconds.
+class Pacer:
+
+    SHORT_WINDOW = 30
+    LONG_WINDOW = 24 * 60 * 60
+
+    def __init__(self,
+                 short_window: float = SHORT_WINDOW,
+                 long_window:  float = LONG_WINDOW,
+                 *,
+                 clock: Callable[[], float] = time.monotonic,
+                 ) -> None:
+        self._short_window = short_window
+        self._long_window = long_window
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = None
+        self._short_limit = None
+        self._spent = []           # sorted start times of the last `short_limit` requests
+        self._blocked_until = 0.0
+        self._long_blocked_until = 0.0
+
+    @property
+    def state(self) -> Optional[QuotaState]:
+        return self._state
+
+    @property
+    def exhausted(self) -> bool:
+        return self._clock() < self._long_blocked_until
+
+    # Returns the number of seconds the next request would have to wait, without spending a token
+    def delay(self) -> float:
+        with self._lock:
+            now = self._clock()
+            return self._next_start(now) - now
+
+    # Spends a token and returns the number of seconds to wait before sending the request
+    def reserve(self) -> float:
+        with self._lock:
+            now = self._clock()
+            if now < self._long_blocked_until:
+                raise LongLimitReachedError('24 hours limit reached')
+
+            # Recorded even before the limit is known, so the first response doesn't undercount what was sent
+            start = self._next_start(now)
+            bisect.insort(self._spent, start)
+            self._trim(now)
+
+            return start - now
+
+    def wait(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update(self, state: QuotaState) -> None:
+        with self._lock:
+            now = self._clock()
+            self._state = state
+            self._short_limit = max(state.short_limit, 1)
+
+            # The server only knows about requests that were already sent, so count the sent ones
+            # and assume that the rest of the used quota was spent just now
+            sent = bisect.bisect_right(self._spent, now) - bisect.bisect_right(self._spent, now - self._short_window)
+            used = state.short_limit - max(state.short_remaining, 0)
+            for _ in range(used - sent):
+                bisect.insort(self._spent, now)
+            self._trim(now)
+
+            if state.long_remaining <= 0:
+                self._long_blocked_until = now + self._long_window
+
+    def penalize(self, exc: LimitReachedError) -> None:
+        with self._lock:
+            now = self._clock()
+            if isinstance(exc, LongLimitReachedError):
+                self._long_blocked_until = now + self._long_window
+            else:
+                self._blocked_until = now + self._short_window
+
+    def _next_start(self, now):
+        start = max(now, self._blocked_until)
+        if self._short_limit is not None:
+            if len(self._spent) >= self._short_limit:
+                start = max(start, self._spent[-self._short_limit] + self._short_window)
+            if self._spent:
+                start = max(start, self._spent[-1])
+        return start
+
+    def _trim(self, now):
+        if self._short_limit is None:
+            del self._spent[:bisect.bisect_right(self._spent, now - self._short_window)]
+        elif len(self._spent) > self._short_limit:
+            del self._spent[:-self._short_limit]
+
+
+# A Pacer whose bookkeeping is kept in a store shared by processes and hosts, so that all the clients of
+# one API key together stay inside its quota. Every call loads the shared state, runs the Pacer logic on it
+# and, when it changed anything, writes it back in one transaction of the store. Times are taken from
+# `clock`, which has to be the same for all the clients: the wall clock by default
+class SharedPacer(Pacer, abc.ABC):
+    def __init__(self,
+                 short_window: float = Pacer.SHORT_WINDOW,
+                 long_window:  float = Pacer.LONG_WINDOW,
+                 *,
+                 clock: Callable[[], float] = time.time,
+                 ) -> None:
+        super().__init__(short_window, long_window, clock=clock)
+        self._shared_lock = threading.Lock()
+
+    @property
+    def state(self) -> Optional[QuotaState]:
+        with self._shared_lock:
+            self._load(self._get())
+            return self._state
+
+    @property
+    def exhausted(self) -> bool:
+        with self._shared_lock:
+            self._load(self._get())
+            return Pacer.exhausted.fget(self)
+
+    def delay(self) -> float:
+        with self._shared_lock:
+            self._load(self._get())
+            return Pacer.delay(self)
+
+    def reserve(self) -> float:
+        return self._change(Pacer.reserve)
+
+    def update(self, state: QuotaState) -> None:
+        self._change(Pacer.update, state)
+
+    def penalize(self, exc: LimitReachedError) -> None:
+        self._change(Pacer.penalize, exc)
+
+    def _change(self, method, *args):
+        def apply(data):
+            self._load(data)
+            result = method(self, *args)
+            return self._dump(), result
+
+        with self._shared_lock:
+            return self._transaction(apply)
+
+    def _load(self, data):
+        if data is None:
+            self._state, self._short_limit, self._spent = None, None, []
+            self._blocked_until = self._long_blocked_until = 0.0
+            return
+
+        shared = json.loads(data)
+        self._state = QuotaState(*shared['state']) if shared['state'] is not None else None
+        self._short_limit = shared['short_limit']
+        self._spent = shared['spent']
+        self._blocked_until = shared['blocked_until']
+        self._long_blocked_until = shared['long_blocked_until']
+
+    def _dump(self):
+        return json.dumps({
+            'state': self._state,
+            'short_limit': self._short_limit,
+            'spent': self._spent,
+            'blocked_until': self._blocked_until,
+            'long_blocked_until': self._long_blocked_until,
+        }).encode()
+
+    # Returns the stored state, or None
+    @abc.abstractmethod
+    def _get(self) -> Optional[bytes]:
+        ...
+
+    # Atomically replaces the stored state with the first item of `apply(stored state)` and returns the second
+    @abc.abstractmethod
+    def _transaction(self, apply: Callable[[Optional[bytes]], Tuple[bytes, Any]]) -> Any:
+        ...
+
+
+# Shares the quota of `name` between the processes of one host through a SQLite file. Every change runs in
+# an immediate transaction, so it holds the write lock of the database while the state is read and written
+class SQLitePacer(SharedPacer):
+    def __init__(self,
+                 path:         str,
+                 name:         str = 'default',
+                 short_window: float = Pacer.SHORT_WINDOW,
+                 long_window:  float = Pacer.LONG_WINDOW,
+                 *,
+                 timeout:      float = 30,
+                 clock:        Callable[[], float] = time.time,
+                 ) -> None:
+        super().__init__(short_window, long_window, clock=clock)
+        self.path = path
+        self.name = name
+
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS pacers (name TEXT PRIMARY KEY, state BLOB NOT NULL)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._shared_lock:
+            self._conn.close()
+
+    def _get(self):
+        row = self._conn.execute('SELECT state FROM pacers WHERE name = ?', (self.name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _transaction(self, apply):
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            data, result = apply(self._get())
+            self._conn.execute('INSERT OR REPLACE INTO pacers (name, state) VALUES (?, ?)', (self.name, data))
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+        return result
+
+
+# Shares the quota of `name` between hosts through Redis, or anything that speaks its protocol. Changes use
+# WATCH/MULTI/EXEC and are retried when another client changed the state in between. The time is taken
+# from the server, so the clocks of the hosts don't have to agree
+class RedisPacer(SharedPacer):
+    KEY_PREFIX = 'saucenao:pacer:'
+
+    def __init__(self,
+                 url:          str = 'redis://localhost:6379/0',
+                 name:         str = 'default',
+                 short_window: float = Pacer.SHORT_WINDOW,
+                 long_window:  float = Pacer.LONG_WINDOW,
+                 *,
+                 timeout:      float = 5,
+                 clock:        Optional[Callable[[], float]] = None,
+                 ) -> None:
+        super().__init__(short_window, long_window, clock=clock or self._server_time)
+        self.name = name
+        self.key = self.KEY_PREFIX + name
+        self.client = RespClient.from_url(url, timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _server_time(self):
+        seconds, microseconds = self.client.execute('TIME')
+        return int(seconds) + int(microseconds) / 1e6
+
+    def _get(self):
+        return self.client.execute('GET', self.key)
+
+    def _transaction(self, apply):
+        while True:
+            self.client.execute('WATCH', self.key)
+            try:
+                data, result = apply(self._get())
+            except BaseException:
+                self.client.execute('UNWATCH')
+                raise
+
+            # EXEC replies nil when the key was changed after WATCH
+            if self.client.pipeline(('MULTI',), ('SET', self.key, data), ('EXEC',))[-1] is not None:
+                return result
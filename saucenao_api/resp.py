@@ -0,0 +1,130 @@
+import socket
+import threading
+from typing import List, Optional, Union
+from urllib.parse import urlparse
+
+Reply = Union[None, int, str, bytes, list, 'RespError']
+
+
+class RespError(Exception):
+    pass
+
+
+# A minimal client of the Redis protocol (RESP 2), enough for RedisPacer without the redis package.
+# Commands are sent as arrays of bulk strings; a pipeline sends several commands in one write.
+# The connection is opened on first use and again after a network error
+class RespClient:
+    def __init__(self,
+                 host:     str = 'localhost',
+                 port:     int = 6379,
+                 *,
+                 db:       int = 0,
+                 password: Optional[str] = None,
+                 timeout:  Optional[float] = 5.0,
+                 ) -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._sock = None
+        self._file = None
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> 'RespClient':
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f'Unsupported URL scheme {parsed.scheme!r}, only redis:// is supported')
+        db = int(parsed.path.lstrip('/') or 0)
+        return cls(parsed.hostname or 'localhost', parsed.port or 6379, db=db, password=parsed.password, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def execute(self, *args) -> Reply:
+        return self.pipeline(args)[0]
+
+    # Sends the commands at once and returns their replies. An error reply of any command is raised
+    # after all the replies are read, errors inside the reply of EXEC are returned as RespError
+    def pipeline(self, *commands) -> List[Reply]:
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(b''.join(_encode(command) for command in commands))
+                replies = [self._read() for _ in commands]
+            except (OSError, EOFError):
+                self._disconnect()
+                raise
+
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._file = self._sock.makefile('rb')
+        commands = []
+        if self.password is not None:
+            commands.append(_encode(('AUTH', self.password)))
+        if self.db:
+            commands.append(_encode(('SELECT', self.db)))
+        if commands:
+            self._sock.sendall(b''.join(commands))
+            for _ in commands:
+                reply = self._read()
+                if isinstance(reply, RespError):
+                    self._disconnect()
+                    raise reply
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def _read(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise EOFError('Connection closed by the server')
+        prefix, value = line[:1], line[1:-2]
+
+        if prefix == b'+':
+            return value.decode()
+        elif prefix == b'-':
+            return RespError(value.decode())
+        elif prefix == b':':
+            return int(value)
+        elif prefix == b'$':
+            length = int(value)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) < length + 2:
+                raise EOFError('Connection closed by the server')
+            return data[:-2]
+        elif prefix == b'*':
+            length = int(value)
+            if length < 0:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RespError(f'Unexpected reply {line!r}')
+
+
+def _encode(command):
+    parts = [b'*%d\r\n' % len(command)]
+    for arg in command:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
@@ -0,0 +1,76 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import aiohttp
+import requests
+
+from .errors import UnknownApiError, UnknownServerError, ShortLimitReachedError
+from .quota import Pacer
+
+_TRANSIENT_ERRORS = (UnknownServerError, ShortLimitReachedError, ConnectionError, asyncio.TimeoutError,
+                     requests.ConnectionError, requests.Timeout, aiohttp.ClientConnectionError)
+
+
+# Decides which errors are retried and how long to wait before the next attempt. The delay grows
+# exponentially with full jitter, and a short limit waits for the 30 seconds window to pass.
+# `budget` caps the retries of all calls in any `budget_window` seconds, so an outage doesn't
+# multiply the load on the server. Share one policy between clients to share the budget
+class RetryPolicy:
+    def __init__(self,
+                 attempts:      int = 3,
+                 *,
+                 backoff:       float = 0.5,
+                 max_backoff:   float = 30,
+                 short_window:  float = Pacer.SHORT_WINDOW,
+                 budget:        Optional[int] = None,
+                 budget_window: float = 60,
+                 clock:         Callable[[], float] = time.monotonic,
+                 jitter:        Callable[[], float] = random.random,
+                 ) -> None:
+        if attempts < 1:
+            raise ValueError('attempts must be at least 1')
+
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.short_window = short_window
+        self.budget = budget
+        self.budget_window = budget_window
+
+        self._clock = clock
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        self._retries = collections.deque()
+
+    @staticmethod
+    def retryable(exc: BaseException) -> bool:
+        if isinstance(exc, _TRANSIENT_ERRORS):
+            return True
+        # Any other status code that isn't handled by the clients
+        return isinstance(exc, UnknownApiError) and (exc.status_code or 0) >= 500
+
+    # Takes a retry from the budget when `exc` may be retried after `attempt` failed attempts
+    def allow(self, exc: BaseException, attempt: int) -> bool:
+        if attempt >= self.attempts or not self.retryable(exc):
+            return False
+        if self.budget is None:
+            return True
+
+        with self._lock:
+            now = self._clock()
+            while self._retries and self._retries[0] <= now - self.budget_window:
+                self._retries.popleft()
+            if len(self._retries) >= self.budget:
+                return False
+            self._retries.append(now)
+            return True
+
+    def delay(self, exc: BaseException, attempt: int) -> float:
+        backoff = self._jitter() * min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        if isinstance(exc, ShortLimitReachedError):
+            return self.short_window + backoff
+        return backoff
@@ -1,17 +1,53 @@
-from typing import Optional, BinaryIO
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, AsyncIterable, AsyncIterator, Iterable, Iterator, List, Tuple, Union
 
 import requests
 import aiohttp
-
-from .containers import SauceResponse
+from requests.adapters import HTTPAdapter
+
+from .batch import BatchInput, Duplicate, RecentKeys, input_key, is_url
+from .cache import Cache, make_key, params_key
+from .cassette import Cassette
+from .containers import SauceResponse, LazySauceResponse
+from .decoders import JsonLoads, default_loads
+from .flight import SingleFlight, AsyncSingleFlight
 from .errors import (UnknownApiError, UnknownServerError, UnknownClientError, BadKeyError,
-                     BadFileSizeError, ShortLimitReachedError, LongLimitReachedError)
+                     BadFileSizeError, LimitReachedError, ShortLimitReachedError, LongLimitReachedError)
+from .key_pool import KeyPool
+from .metrics import MetricsSink, RequestTimer
 from .params import _OutputType, DB, Hide, BgColor
+from .phash import PerceptualIndex
+from .planner import QueryPlanner
+from .preprocess import ImagePreprocessor
+from .upload import MultipartBody, MultipartPayload, Upload, open_upload, read_content
+from .quota import QuotaState, Pacer, SharedPacer
+from .retry import RetryPolicy
+
+
+_EXHAUSTED = object()
+
+
+# A Duplicate of the input first seen with this key, or None when it's the first. The input is only kept
+# in `seen` when the duplicates are returned
+def _duplicate_of(seen, key, item, duplicates):
+    first = (item if duplicates else None,)
+    stored = seen.setdefault(key, first)
+    return Duplicate(stored[0]) if stored is not first else None
+
+
+# Marks a response decoded off the event loop, so that its containers are built there too
+class _LargeResponse(dict):
+    pass
 
 
 class SauceNao:
     SAUCENAO_URL = 'https://saucenao.com/search.php'
 
+    _SINGLE_FLIGHT = SingleFlight
+
     def __init__(self,
                  api_key:  Optional[str] = None,
                  *,
@@ -23,6 +59,28 @@ class SauceNao:
                  frame:    int = 1,
                  hide:     int = Hide.NONE,
                  bgcolor:  int = BgColor.NONE,
+                 pool_connections: int = 1,
+                 pool_maxsize:     int = 10,
+                 keep_alive:       bool = True,
+                 preconnect:       bool = False,
+                 pacer:            Optional[Pacer] = None,
+                 key_pool:         Optional[KeyPool] = None,
+                 cache:            Optional[Cache] = None,
+                 serve_stale:      bool = False,
+                 lazy:             bool = False,
+                 keep_raw:         bool = True,
+                 data_keys:        Optional[Iterable[str]] = None,
+                 min_similarity:   Optional[float] = None,
+                 index_allowlist:  Optional[Iterable[int]] = None,
+                 top_k:            Optional[int] = None,
+                 json_loads:       Optional[JsonLoads] = None,
+                 preprocess:       Optional[ImagePreprocessor] = None,
+                 phash_index:      Optional[PerceptualIndex] = None,
+                 single_flight:    bool = False,
+                 retry:            Optional[RetryPolicy] = None,
+                 metrics:          Optional[MetricsSink] = None,
+                 cassette:         Optional[Cassette] = None,
+                 planner:          Optional[QueryPlanner] = None,
                  ) -> None:
 
         params = dict()
@@ -43,21 +101,345 @@ class SauceNao:
         params['output_type'] = _OutputType.JSON
         self.params = params
 
-    def from_file(self, file: BinaryIO) -> SauceResponse:
-        return self._search(self.params, {'file': file})
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._keep_alive = keep_alive
+        self._session_lock = threading.Lock()
+        self._session = None
+
+        self.pacer = pacer
+        self.key_pool = key_pool
+        self.cache = cache
+        self.serve_stale = serve_stale
+        self.lazy = lazy
+        self.keep_raw = keep_raw
+        self.data_keys = frozenset(data_keys) if data_keys is not None else None
+        self.min_similarity = min_similarity
+        self.index_allowlist = frozenset(index_allowlist) if index_allowlist is not None else None
+        self.top_k = top_k
+        self.json_loads = json_loads or default_loads()
+        self.preprocess = preprocess
+        self.phash_index = phash_index
+        self.retry = retry
+        self.metrics = metrics
+        self.cassette = cassette
+        self.planner = planner
+        self.quota: Optional[QuotaState] = None
+
+        # Identical searches running at the same time share one request and get the same response
+        self._flights = self._SINGLE_FLIGHT() if single_flight else None
+
+        if preconnect:
+            self.preconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def preconnect(self) -> None:
+        # Opens a keep-alive connection to the pool, so the first search skips the TCP and TLS handshake
+        try:
+            self._get_session().head(self.SAUCENAO_URL)
+        except requests.RequestException:
+            pass
+
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self._keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def from_file(self, file: Upload) -> SauceResponse:
+        if self._flights is None:
+            return self._search_file(file)
+        return self._flights.do(self._file_key(file), self._search_file, file)
 
     def from_url(self, url: str) -> SauceResponse:
         params = self.params.copy()
         params['url'] = url
-        return self._search(params)
+        if self._flights is None:
+            return self._search(params)
+        return self._flights.do(self._cache_key(params), self._search, params)
+
+    def search_many(self, inputs: Iterable[BatchInput], **kwargs
+                    ) -> List[Tuple[BatchInput, Union[SauceResponse, Exception]]]:
+        return list(self.iter_search(inputs, **kwargs))
+
+    def iter_search(self,
+                    inputs:        Iterable[BatchInput],
+                    *,
+                    workers:       Optional[int] = None,
+                    dedupe_window: int = 100_000,
+                    duplicates:    bool = False,
+                    ) -> Iterator[Tuple[BatchInput, Union[SauceResponse, Exception, Duplicate]]]:
+        workers = workers or self._pool_maxsize
+        seen = RecentKeys(dedupe_window)
+
+        # Only a couple of inputs per worker are taken from the iterator at a time
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            inputs = iter(inputs)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < workers * 2:
+                    item = next(inputs, _EXHAUSTED)
+                    if item is _EXHAUSTED:
+                        exhausted = True
+                    else:
+                        pending[executor.submit(self._search_input, item, seen, duplicates)] = item
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    result = future.result()
+                    if not isinstance(result, Duplicate) or duplicates:
+                        yield item, result
+
+    def _search_input(self, item, seen, duplicates=False):
+        try:
+            if is_url(item):
+                duplicate = _duplicate_of(seen, input_key(self.params, item), item, duplicates)
+                if duplicate is not None:
+                    return duplicate
+                return self.from_url(item)
+
+            with open_upload(item) as upload:
+                content = read_content(upload)
+                duplicate = _duplicate_of(seen, input_key(self.params, item, content), item, duplicates)
+                if duplicate is not None:
+                    return duplicate
+                return self.from_file(content)
+        except Exception as exc:
+            return exc
 
     def _search(self, params, files=None):
-        resp = requests.post(self.SAUCENAO_URL, params=params, files=files)
-        status_code = resp.status_code
+        return self._build_response(self._cached_search(params, files))
+
+    def _search_file(self, file):
+        with open_upload(file) as upload:
+            image_hash = self._image_hash(upload)
+            raw = self._find_similar(image_hash)
+            if raw is None:
+                if self.preprocess is not None:
+                    upload = self.preprocess(read_content(upload))
+                raw = self._cached_search(self.params, {'file': upload})
+                self._remember_similar(image_hash, raw)
+            return self._build_response(raw)
+
+    def _file_key(self, file):
+        with open_upload(file) as upload:
+            return self._cache_key(self.params, {'file': upload})
+
+    def _cached_search(self, params, files):
+        if self.cache is None:
+            return self._retried_search(params, files)
+
+        cache_key = self._cache_key(params, files)
+        raw = self.cache.get(cache_key)
+        if raw is not None:
+            return raw
+
+        try:
+            raw = self._retried_search(params, files)
+        except LimitReachedError:
+            # Degrade to an expired entry rather than failing
+            stale = self.cache.get(cache_key, allow_stale=True) if self.serve_stale else None
+            if stale is None:
+                raise
+            return stale
+
+        self.cache.set(cache_key, raw)
+        return raw
+
+    def _image_hash(self, upload):
+        if self.phash_index is None:
+            return None
+        return self.phash_index.hash(read_content(upload))
+
+    def _find_similar(self, image_hash):
+        if image_hash is None:
+            return None
+        return self.phash_index.find(image_hash, params_key(self.params))
+
+    def _remember_similar(self, image_hash, raw):
+        if image_hash is not None:
+            self.phash_index.add(image_hash, raw, params_key(self.params))
+
+    def _build_response(self, raw):
+        if self.metrics is None:
+            return self._make_response(raw)
+
+        started = time.perf_counter()
+        response = self._make_response(raw)
+        self.metrics.observe('saucenao_phase_seconds', time.perf_counter() - started, phase='build')
+        return response
+
+    def _make_response(self, raw):
+        response_class = LazySauceResponse if self.lazy else SauceResponse
+        return response_class(raw, keep_raw=self.keep_raw, data_keys=self.data_keys,
+                              min_similarity=self.min_similarity, index_allowlist=self.index_allowlist,
+                              top_k=self.top_k)
+
+    # The request body is encoded once and rewound for every attempt. With a planner the search may cascade,
+    # from a narrow dbmask to all the indexes
+    def _retried_search(self, params, files):
+        body = self._make_body(files)
+        mask = self._plan(params)
+        if mask is not None:
+            raw = self._retried_request({**params, 'dbmask': mask}, body)
+            if self._record_plan(raw, mask):
+                return raw
+            self._rewind(body)
+
+        raw = self._retried_request(params, body)
+        if self.planner is not None and 'dbmask' not in params:
+            self._record_plan(raw, None)
+        return raw
+
+    def _retried_request(self, params, body):
+        if self.retry is None:
+            return self._keyed_search(params, body)
+
+        attempt = 0
+        while True:
+            try:
+                return self._keyed_search(params, body)
+            except Exception as exc:
+                attempt += 1
+                if not self.retry.allow(exc, attempt):
+                    raise
+                time.sleep(self.retry.delay(exc, attempt))
+                self._rewind(body)
+
+    # A dbmask set by the caller is never replaced
+    def _plan(self, params):
+        if self.planner is None or 'dbmask' in params:
+            return None
+        return self.planner.plan()
+
+    def _record_plan(self, raw, mask):
+        matched = self.planner.record(raw, mask)
+        if self.metrics is not None:
+            stage = 'all' if mask is None else 'narrow' if matched else 'widened'
+            self.metrics.increment('saucenao_planned_searches_total', stage=stage)
+        return matched
+
+    def _keyed_search(self, params, body):
+        if self.key_pool is None:
+            try:
+                return self._paced_request(params, body, self.pacer)
+            except LimitReachedError as exc:
+                if self.pacer is not None:
+                    self.pacer.penalize(exc)
+                raise
+
+        # Fail over to the next key at most once per key. The pool penalizes the pacer of a limited key
+        attempts = len(self.key_pool)
+        while True:
+            key, pacer, delay = self.key_pool.reserve()
+            try:
+                return self._paced_request({**params, 'api_key': key}, body, pacer, delay)
+            except (BadKeyError, LimitReachedError) as exc:
+                self.key_pool.report(key, exc)
+                attempts -= 1
+                if attempts <= 0 or not self.key_pool:
+                    raise
+                self._rewind(body)
+
+    # `delay` is the wait of a permit already reserved on `pacer`, otherwise one is reserved here
+    def _paced_request(self, params, body, pacer, delay=None):
+        if delay is None and pacer is not None:
+            delay = pacer.reserve()
+        if delay:
+            time.sleep(delay)
+
+        raw = self._request(params, body)
+        self._update_quota(raw, pacer)
+        return raw
+
+    def _update_quota(self, raw, pacer):
+        self.quota = QuotaState.from_header(raw['header'])
+        if pacer is not None:
+            pacer.update(self.quota)
+        if self.metrics is not None:
+            self.metrics.set('saucenao_short_remaining', self.quota.short_remaining)
+            self.metrics.set('saucenao_long_remaining', self.quota.long_remaining)
+
+    @staticmethod
+    def _cache_key(params, files=None):
+        if files:
+            return make_key(params, content=read_content(files['file']))
+        return make_key(params, url=params['url'])
+
+    # A body that can be sent again, by a retry, a failover to another key or a widened plan, reads a file
+    # object into memory once instead of on every attempt. Paths are memory-mapped and never read
+    def _make_body(self, files):
+        if not files:
+            return None
+        resent = self.retry is not None or self.key_pool is not None or self.planner is not None
+        return MultipartBody(files, buffer_files=resent)
+
+    @staticmethod
+    def _rewind(body):
+        if body is not None:
+            body.seek(0)
+
+    def _request(self, params, body=None):
+        if self.metrics is None:
+            return self._send(params, body, None)
+        with RequestTimer(self.metrics) as timer:
+            return self._send(params, body, timer)
+
+    # The body is streamed, so that the server wait and the download are timed apart
+    def _post(self, params, body, timer):
+        if body is not None:
+            resp = self._get_session().post(self.SAUCENAO_URL, params=params,
+                                            data=timer.wrap(body) if timer is not None else body,
+                                            headers={'Content-Type': body.content_type}, stream=True)
+        else:
+            resp = self._get_session().post(self.SAUCENAO_URL, params=params, stream=True)
+        if timer is not None:
+            timer.mark('wait')
+
+        content = resp.content
+        if timer is not None:
+            timer.downloaded = len(content)
+            timer.mark('download')
+        return resp.status_code, content
+
+    def _send(self, params, body, timer):
+        if self.cassette is None:
+            status_code, content = self._post(params, body, timer)
+        else:
+            status_code, content = self.cassette.play(params, body, lambda: self._post(params, body, timer))
+        if timer is not None:
+            timer.status = status_code
 
         if status_code == 200:
-            raw = self._verify_response(resp, params)
-            return SauceResponse(raw)
+            parsed_resp = self.json_loads(content)
+            if timer is not None:
+                timer.mark('decode')
+            return self._verify_response(parsed_resp, params)
 
         # Taken from https://saucenao.com/tools/examples/api/identify_images_v1.1.py
         # Actually server returns 200 and user_id=0 if key is bad
@@ -68,15 +450,14 @@ class SauceNao:
             raise BadFileSizeError('File is too large')
 
         elif status_code == 429:
-            if 'Daily' in resp.json()['header']['message']:
+            if 'Daily' in self.json_loads(content)['header']['message']:
                 raise LongLimitReachedError('24 hours limit reached')
             raise ShortLimitReachedError('30 seconds limit reached')
 
-        raise UnknownApiError(f'Server returned status code {status_code}')
+        raise UnknownApiError(f'Server returned status code {status_code}', status_code=status_code)
 
     @staticmethod
-    def _verify_response(resp, params):
-        parsed_resp = resp.json()
+    def _verify_response(parsed_resp, params):
         resp_header = parsed_resp['header']
 
         status = resp_header['status']
@@ -107,86 +488,370 @@ class SauceNao:
 
 
 class AIOSauceNao(SauceNao):
+    _SINGLE_FLIGHT = AsyncSingleFlight
 
-    def __init__(self, *args, **kwargs):
+    # `pool_maxsize` is the connection limit of the connector. Bodies larger than `offload_threshold` bytes
+    # are decoded, and their responses built, in `executor`, so that the event loop stays responsive
+    def __init__(self,
+                 *args,
+                 session:           Optional[aiohttp.ClientSession] = None,
+                 ttl_dns_cache:     Optional[int] = 10,
+                 keepalive_timeout: float = 15,
+                 preconnect:        bool = False,
+                 offload_threshold: Optional[int] = None,
+                 executor:          Optional[Executor] = None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
 
-        self._session = None
+        self.offload_threshold = offload_threshold
+        self.executor = executor
+
+        self._session = session
+        self._owns_session = session is None
+        self._session_loop = None
+        self._entered = False
+        self._calls = 0
+        self._ttl_dns_cache = ttl_dns_cache
+        self._keepalive_timeout = keepalive_timeout
+        self._preconnect = preconnect
 
     async def __aenter__(self):
-        self._session = aiohttp.ClientSession()
+        self._entered = True
+        self._get_session()
+        if self._preconnect:
+            await self.preconnect()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self._session:
-            await self._session.close()
+        self._entered = False
+        await self.close()
 
-    async def from_file(self, file: BinaryIO) -> SauceResponse:
-        return await self._search(self.params, {'file': file})
+    async def close(self) -> None:
+        # A session passed by the caller may be shared with other clients, so it is left open
+        if self._session and self._owns_session:
+            await self._session.close()
+            self._session = None
+
+    async def preconnect(self) -> None:
+        try:
+            async with self._get_session().head(self.SAUCENAO_URL):
+                pass
+        except aiohttp.ClientError:
+            pass
+
+    # A session of the client is rebuilt on another event loop, e.g. in the next asyncio.run(), since
+    # its connector is bound to the loop it was created on
+    def _get_session(self):
+        loop = asyncio.get_event_loop()
+        if self._owns_session and self._session_loop is not loop:
+            self._session = None
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            self._session_loop = loop
+            self._owns_session = True
+        return self._session
+
+    # Outside `async with` the session of the client only lives as long as the searches that use it,
+    # so `await AIOSauceNao().from_url(...)` doesn't leave it open
+    def _begin_call(self):
+        self._calls += 1
+
+    async def _end_call(self):
+        self._calls -= 1
+        if not self._calls and not self._entered:
+            await self.close()
+
+    def _decode_response(self, body, params):
+        return self._verify_response(self.json_loads(body), params)
+
+    def _run_in_executor(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    def _create_session(self):
+        if self._keep_alive:
+            connector = aiohttp.TCPConnector(limit=self._pool_maxsize, ttl_dns_cache=self._ttl_dns_cache,
+                                             keepalive_timeout=self._keepalive_timeout)
+        else:
+            connector = aiohttp.TCPConnector(limit=self._pool_maxsize, ttl_dns_cache=self._ttl_dns_cache,
+                                             force_close=True)
+        return aiohttp.ClientSession(connector=connector)
+
+    async def from_file(self, file: Upload) -> SauceResponse:
+        self._begin_call()
+        try:
+            if self._flights is None:
+                return await self._search_file(file)
+            return await self._flights.do(self._file_key(file), self._search_file, file)
+        finally:
+            await self._end_call()
 
     async def from_url(self, url: str) -> SauceResponse:
         params = self.params.copy()
         params['url'] = url
-        return await self._search(params)
+        self._begin_call()
+        try:
+            if self._flights is None:
+                return await self._search(params)
+            return await self._flights.do(self._cache_key(params), self._search, params)
+        finally:
+            await self._end_call()
+
+    async def search_many(self, inputs: Union[Iterable[BatchInput], AsyncIterable[BatchInput]], **kwargs
+                          ) -> List[Tuple[BatchInput, Union[SauceResponse, Exception]]]:
+        return [pair async for pair in self.iter_search(inputs, **kwargs)]
+
+    async def iter_search(self,
+                          inputs:        Union[Iterable[BatchInput], AsyncIterable[BatchInput]],
+                          *,
+                          concurrency:   Optional[int] = None,
+                          dedupe_window: int = 100_000,
+                          duplicates:    bool = False,
+                          ) -> AsyncIterator[Tuple[BatchInput, Union[SauceResponse, Exception, Duplicate]]]:
+        concurrency = concurrency or self._pool_maxsize
+        seen = RecentKeys(dedupe_window)
+
+        # Both queues are bounded, so a slow consumer stops the workers and the workers stop the producer
+        input_queue = asyncio.Queue(maxsize=concurrency)
+        result_queue = asyncio.Queue(maxsize=concurrency)
+
+        # One end marker is put after the inputs, and every worker puts it back for the next one. A cancelled
+        # producer puts none: the workers are cancelled with it, and the queue may be full
+        async def produce():
+            try:
+                if hasattr(inputs, '__aiter__'):
+                    async for item in inputs:
+                        await input_queue.put(item)
+                else:
+                    for item in inputs:
+                        await input_queue.put(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await input_queue.put(_EXHAUSTED)
+                raise
+            await input_queue.put(_EXHAUSTED)
+
+        async def work():
+            while True:
+                item = await input_queue.get()
+                if item is _EXHAUSTED:
+                    input_queue.put_nowait(_EXHAUSTED)
+                    await result_queue.put(_EXHAUSTED)
+                    return
+
+                result = await self._search_input(item, seen, duplicates)
+                if not isinstance(result, Duplicate) or duplicates:
+                    await result_queue.put((item, result))
+
+        self._begin_call()
+        producer = asyncio.ensure_future(produce())
+        workers = [asyncio.ensure_future(work()) for _ in range(concurrency)]
+        try:
+            finished = 0
+            while finished < concurrency:
+                result = await result_queue.get()
+                if result is _EXHAUSTED:
+                    finished += 1
+                else:
+                    yield result
+            await producer
+        finally:
+            tasks = [producer, *workers]
+            for task in tasks:
+                task.cancel()
+            # Lets the tasks finish before the generator does, so none is left pending
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._end_call()
+
+    async def _search_input(self, item, seen, duplicates=False):
+        try:
+            if is_url(item):
+                duplicate = _duplicate_of(seen, input_key(self.params, item), item, duplicates)
+                if duplicate is not None:
+                    return duplicate
+                return await self.from_url(item)
+
+            with open_upload(item) as upload:
+                content = await self._run_in_executor(read_content, upload)
+                duplicate = _duplicate_of(seen, input_key(self.params, item, content), item, duplicates)
+                if duplicate is not None:
+                    return duplicate
+                return await self.from_file(content)
+        except asyncio.CancelledError:
+            # An Exception before Python 3.8, a cancelled worker has to stop instead of returning it
+            raise
+        except Exception as exc:
+            return exc
 
     async def _search(self, params, files=None):
-        session = self._session or aiohttp.ClientSession()
-
-        async with session.post(self.SAUCENAO_URL, params=params, data=files) as resp:
-            status_code = resp.status
-
-            # close only if not called via 'async with AIOSauceNao(...)'
-            if not self._session:
-                await session.close()
-
-            if status_code == 200:
-                parsed_resp = await resp.json()
-                raw = self._verify_response(parsed_resp, params)
-
-                return SauceResponse(raw)
-
-            # Taken from https://saucenao.com/tools/examples/api/identify_images_v1.1.py
-            # Actually server returns 200 and user_id=0 if key is bad
-            elif status_code == 403:
-                raise BadKeyError('Invalid API key')
-
-            elif status_code == 413:
-                raise BadFileSizeError('File is too large')
-
-            elif status_code == 429:
-                parsed_resp = await resp.json()
-                if 'Daily' in parsed_resp['header']['message']:
-                    raise LongLimitReachedError('24 hours limit reached')
-                raise ShortLimitReachedError('30 seconds limit reached')
-
-            raise UnknownApiError(f'Server returned status code {status_code}')
+        return await self._build_response_async(await self._cached_search(params, files))
+
+    # The search task opens the file itself, so it doesn't depend on the caller that started it
+    async def _search_file(self, file):
+        with open_upload(file) as upload:
+            image_hash = None
+            if self.phash_index is not None:
+                image_hash = await self._run_in_executor(self._image_hash, upload)
+            raw = self._find_similar(image_hash)
+            if raw is None:
+                if self.preprocess is not None:
+                    upload = await self._run_in_executor(self.preprocess, read_content(upload))
+                raw = await self._cached_search(self.params, {'file': upload})
+                self._remember_similar(image_hash, raw)
+            return await self._build_response_async(raw)
+
+    async def _build_response_async(self, raw):
+        if isinstance(raw, _LargeResponse):
+            return await self._run_in_executor(self._build_response, raw)
+        return self._build_response(raw)
+
+    async def _cached_search(self, params, files):
+        if self.cache is None:
+            return await self._retried_search(params, files)
+
+        cache_key = self._cache_key(params, files)
+        raw = self.cache.get(cache_key)
+        if raw is not None:
+            return raw
+
+        try:
+            raw = await self._retried_search(params, files)
+        except LimitReachedError:
+            # Degrade to an expired entry rather than failing
+            stale = self.cache.get(cache_key, allow_stale=True) if self.serve_stale else None
+            if stale is None:
+                raise
+            return stale
+
+        self.cache.set(cache_key, raw)
+        return raw
+
+    async def _retried_search(self, params, files):
+        body = self._make_body(files)
+        mask = self._plan(params)
+        if mask is not None:
+            raw = await self._retried_request({**params, 'dbmask': mask}, body)
+            if self._record_plan(raw, mask):
+                return raw
+            self._rewind(body)
+
+        raw = await self._retried_request(params, body)
+        if self.planner is not None and 'dbmask' not in params:
+            self._record_plan(raw, None)
+        return raw
+
+    async def _retried_request(self, params, body):
+        if self.retry is None:
+            return await self._keyed_search(params, body)
+
+        attempt = 0
+        while True:
+            try:
+                return await self._keyed_search(params, body)
+            except Exception as exc:
+                attempt += 1
+                if not self.retry.allow(exc, attempt):
+                    raise
+                await asyncio.sleep(self.retry.delay(exc, attempt))
+                self._rewind(body)
+
+    async def _keyed_search(self, params, body):
+        if self.key_pool is None:
+            try:
+                return await self._paced_request(params, body, self.pacer)
+            except LimitReachedError as exc:
+                if self.pacer is not None:
+                    await self._call_pacer(isinstance(self.pacer, SharedPacer), self.pacer.penalize, exc)
+                raise
+
+        # Fail over to the next key at most once per key. The pool penalizes the pacer of a limited key
+        attempts = len(self.key_pool)
+        while True:
+            key, pacer, delay = await self._call_pacer(self.key_pool.shared, self.key_pool.reserve)
+            try:
+                return await self._paced_request({**params, 'api_key': key}, body, pacer, delay)
+            except (BadKeyError, LimitReachedError) as exc:
+                await self._call_pacer(self.key_pool.shared, self.key_pool.report, key, exc)
+                attempts -= 1
+                if attempts <= 0 or not self.key_pool:
+                    raise
+                self._rewind(body)
+
+    # `delay` is the wait of a permit already reserved on `pacer`, otherwise one is reserved here
+    async def _paced_request(self, params, body, pacer, delay=None):
+        shared = isinstance(pacer, SharedPacer)
+        if delay is None and pacer is not None:
+            delay = await self._call_pacer(shared, pacer.reserve)
+        if delay:
+            await asyncio.sleep(delay)
+
+        raw = await self._request(params, body)
+        self._update_quota(raw, None)
+        if pacer is not None:
+            await self._call_pacer(shared, pacer.update, self.quota)
+        return raw
+
+    # A SharedPacer waits on its store, e.g. Redis round trips or a locked SQLite file, so its calls run in
+    # the executor instead of blocking the event loop
+    async def _call_pacer(self, shared, func, *args):
+        if shared:
+            return await self._run_in_executor(func, *args)
+        return func(*args)
+
+    async def _request(self, params, body=None):
+        if self.metrics is None:
+            return await self._send(params, body, None)
+        with RequestTimer(self.metrics) as timer:
+            return await self._send(params, body, timer)
+
+    async def _post(self, params, body, timer):
+        data = None
+        if body is not None:
+            data = MultipartPayload(timer.wrap(body) if timer is not None else body)
+
+        async with self._get_session().post(self.SAUCENAO_URL, params=params, data=data) as resp:
+            if timer is not None:
+                timer.mark('wait')
+
+            # Other bodies are never used
+            content = b''
+            if resp.status in (200, 429):
+                content = await resp.read()
+                if timer is not None:
+                    timer.downloaded = len(content)
+                    timer.mark('download')
+            return resp.status, content
+
+    async def _send(self, params, body, timer):
+        if self.cassette is None:
+            status_code, content = await self._post(params, body, timer)
+        else:
+            status_code, content = await self.cassette.play_async(params, body,
+                                                                  lambda: self._post(params, body, timer))
+        if timer is not None:
+            timer.status = status_code
 
-    @staticmethod
-    def _verify_response(parsed_resp, params):
-        resp_header = parsed_resp['header']
-
-        status = resp_header['status']
-        user_id = int(resp_header['user_id'])
+        if status_code == 200:
+            if self.offload_threshold is not None and len(content) > self.offload_threshold:
+                raw = _LargeResponse(await self._run_in_executor(self._decode_response, content, params))
+            else:
+                raw = self._decode_response(content, params)
+            if timer is not None:
+                timer.mark('decode')
+            return raw
 
         # Taken from https://saucenao.com/tools/examples/api/identify_images_v1.1.py
-        if status < 0:
-            raise UnknownClientError('Unknown client error, status < 0')
-        elif status > 0:
-            raise UnknownServerError('Unknown API error, status > 0')
-        elif user_id < 0:
-            raise UnknownServerError('Unknown API error, user_id < 0')
-
-        # Request passed, but api_key was ignored
-        elif user_id == 0 and 'api_key' in params:
+        # Actually server returns 200 and user_id=0 if key is bad
+        elif status_code == 403:
             raise BadKeyError('Invalid API key')
 
-        long_remaining = resp_header['long_remaining']
-        short_remaining = resp_header['short_remaining']
+        elif status_code == 413:
+            raise BadFileSizeError('File is too large')
 
-        # Taken from https://saucenao.com/tools/examples/api/identify_images_v1.1.py
-        if short_remaining < 0:
+        elif status_code == 429:
+            parsed_resp = self.json_loads(content)
+            if 'Daily' in parsed_resp['header']['message']:
+                raise LongLimitReachedError('24 hours limit reached')
             raise ShortLimitReachedError('30 seconds limit reached')
-        elif long_remaining < 0:
-            raise LongLimitReachedError('24 hours limit reached')
 
-        return parsed_resp
+        raise UnknownApiError(f'Server returned status code {status_code}', status_code=status_code)
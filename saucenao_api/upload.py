@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import io
+import mmap
+import os
+import uuid
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Union
+
+from aiohttp import payload
+
+Upload = Union[str, os.PathLike, bytes, bytearray, memoryview, mmap.mmap, BinaryIO]
+
+_BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+
+# Turns a path into a read-only memory map, so the file is never copied into the process memory.
+# Buffers and file objects are passed through as they are
+@contextmanager
+def open_upload(file: Upload) -> Iterator[Union[bytes, memoryview, BinaryIO]]:
+    if isinstance(file, mmap.mmap):
+        yield memoryview(file)
+        return
+
+    if not isinstance(file, (str, os.PathLike)):
+        yield file
+        return
+
+    with open(file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            mapped = None
+        else:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped is None:
+        yield b''
+        return
+
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        # Slices of the view may still be referenced by the request, then the map is closed by the GC
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            pass
+
+
+# Returns the whole content of an upload without moving the position of a file object
+def read_content(file: Union[bytes, memoryview, BinaryIO]) -> Union[bytes, memoryview]:
+    if isinstance(file, _BUFFER_TYPES):
+        return file
+    position = file.tell()
+    content = file.read()
+    file.seek(position)
+    return content
+
+
+# A multipart/form-data body that is read in chunks: buffers are sliced without copying and
+# files are read from their current position, so the payload is never duplicated in memory.
+# A file object is read again every time the body is rewound, unless `buffer_files` reads it into
+# memory once, for a body that is likely to be sent more than once
+class MultipartBody:
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields: dict, *, buffer_files: bool = False) -> None:
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        self._parts = []
+        self._fields = []
+        for name, value in fields.items():
+            filename = getattr(value, 'name', None)
+            if isinstance(value, _BUFFER_TYPES):
+                value = memoryview(value).cast('B')
+            elif _seekable(value) and not buffer_files:
+                value = _FilePart(value)
+            else:
+                value = memoryview(value.read())
+
+            filename = os.path.basename(filename if isinstance(filename, str) else '') or name
+            self._parts.append(memoryview(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode()))
+            self._parts.append(value)
+            self._parts.append(memoryview(b'\r\n'))
+            self._fields.append((name, value))
+        self._parts.append(memoryview(f'--{self.boundary}--\r\n'.encode()))
+
+        self._length = sum(len(part) for part in self._parts)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    # Hash of the field names and contents, which doesn't depend on the random boundary
+    def digest(self) -> bytes:
+        digest = hashlib.sha256()
+        for name, value in self._fields:
+            digest.update(f'{name}:{len(value)}:'.encode())
+            if isinstance(value, _FilePart):
+                for chunk in value.chunks(self.CHUNK_SIZE):
+                    digest.update(chunk)
+            else:
+                digest.update(value)
+        return digest.digest()
+
+    # True when no part is read from a file
+    @property
+    def buffered(self) -> bool:
+        return not any(isinstance(part, _FilePart) for part in self._parts)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        if offset != 0 and offset != self._length:
+            raise io.UnsupportedOperation('MultipartBody can only be rewound')
+
+        self._position = offset
+        self._part = 0 if offset == 0 else len(self._parts)
+        self._offset = 0
+        if offset == 0:
+            for part in self._parts:
+                if isinstance(part, _FilePart):
+                    part.rewind()
+        return offset
+
+    def read(self, size: int = -1) -> Union[bytes, memoryview]:
+        if size is None or size < 0:
+            return b''.join(bytes(chunk) for chunk in iter(lambda: self.read(self.CHUNK_SIZE), b''))
+
+        while self._part < len(self._parts):
+            part = self._parts[self._part]
+            if isinstance(part, _FilePart):
+                chunk = part.read(size)
+            else:
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+
+            if chunk:
+                self._position += len(chunk)
+                return chunk
+            self._part += 1
+            self._offset = 0
+        return b''
+
+
+# Sends a MultipartBody with aiohttp. Files are read in the default executor, buffers are written as they are
+class MultipartPayload(payload.Payload):
+    def __init__(self, body: MultipartBody, **kwargs) -> None:
+        super().__init__(body, content_type=body.content_type, **kwargs)
+        self._size = len(body)
+
+    @property
+    def body(self) -> MultipartBody:
+        return self._value
+
+    async def write(self, writer) -> None:
+        body = self._value
+        if body.buffered:
+            for chunk in body:
+                await writer.write(chunk)
+            return
+
+        loop = asyncio.get_event_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, body.read, body.CHUNK_SIZE)
+            if not chunk:
+                return
+            await writer.write(chunk)
+
+    def decode(self, encoding: str = 'utf-8', errors: str = 'strict') -> str:
+        raise TypeError('MultipartPayload is binary')
+
+
+def _seekable(file):
+    seekable = getattr(file, 'seekable', None)
+    return seekable() if seekable is not None else hasattr(file, 'seek')
+
+
+class _FilePart:
+    def __init__(self, file):
+        name = getattr(file, 'name', None)
+        self.name = name if isinstance(name, str) else None
+        self._file = file
+        self._start = file.tell()
+        self._length = file.seek(0, io.SEEK_END) - self._start
+        file.seek(self._start)
+
+    def __len__(self):
+        return self._length
+
+    def rewind(self):
+        self._file.seek(self._start)
+
+    # Reads the whole part and puts the file position back
+    def chunks(self, size):
+        position = self._file.tell()
+        self._file.seek(self._start)
+        try:
+            remaining = self._length
+            while remaining > 0:
+                chunk = self._file.read(min(size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self._file.seek(position)
+
+    def read(self, size):
+        return self._file.read(size)
@@ -14,6 +14,11 @@ setuptools.setup(
     long_description_content_type='text/markdown',
     url='https://github.com/nomnoms12/saucenao_api/',
     packages=['saucenao_api'],
+    entry_points={
+        'console_scripts': [
+            'saucenao = saucenao_api.cli:main',
+        ],
+    },
     classifiers=[
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
@@ -27,6 +32,20 @@ setuptools.setup(
         'aiohttp ~= 3.7.4'
     ],
     extras_require={
+        'fast': [
+            'orjson',
+        ],
+        'image': [
+            'Pillow',
+        ],
+        'phash': [
+            'Pillow',
+            'numpy',
+        ],
+        'export': [
+            'numpy',
+            'pyarrow',
+        ],
         'test': [
             'responses ~= 0.10.14',
             'aioresponses ~= 0.7.2',
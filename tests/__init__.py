@@ -0,0 +1,4 @@
+# Returns the content of the single file part of a multipart payload sent with aiohttp
+def sent_file(data):
+    body = bytes(data.body.read())
+    return body.split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n--', 1)[0]
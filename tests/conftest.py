@@ -0,0 +1,31 @@
+import pytest
+import responses
+from aioresponses import aioresponses
+
+
+@pytest.fixture
+def mocked_responses():
+    with responses.RequestsMock() as rsps:
+        yield rsps
+
+
+@pytest.fixture
+def mocked_aio_response():
+    with aioresponses() as m:
+        yield m
+
+
+# A clock the test moves by hand through `now`. With `step`, every call moves it forward by `step` first
+class FakeClock:
+    def __init__(self, now=1000.0, step=0.0):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -1,30 +1,20 @@
 import pytest
 import re
 import responses
-from aioresponses import aioresponses, CallbackResult
+from aioresponses import CallbackResult
 import asyncio
+import aiohttp
 
 from saucenao_api import SauceNao, AIOSauceNao
 from saucenao_api.errors import (UnknownApiError, UnknownServerError, UnknownClientError, BadKeyError,
                                  BadFileSizeError, ShortLimitReachedError, LongLimitReachedError)
-from . import test_suite as e
+from saucenao_api.quota import QuotaState, Pacer
+from . import sent_file, test_suite as e
 
 SAUCENAO_URL = SauceNao.SAUCENAO_URL
 URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
 
 
-@pytest.fixture
-def mocked_responses():
-    with responses.RequestsMock() as rsps:
-        yield rsps
-
-
-@pytest.fixture
-def mocked_aio_response():
-    with aioresponses() as m:
-        yield m
-
-
 def test_from_url(mocked_responses):
     def request_callback(request):
         assert request.params['url'] == 'https://example.com/'
@@ -69,7 +59,7 @@ def test_async_from_file(mocked_aio_response):
     loop = asyncio.get_event_loop()
 
     def request_callback(url, **kwargs):
-        assert bin_file == kwargs['data']['file']
+        assert bin_file == sent_file(kwargs['data'])
         return CallbackResult(status=500, headers={}, body='')
 
     mocked_aio_response.post(URL_PATTERN, callback=request_callback)
@@ -276,3 +266,193 @@ def test_async_long_remaining_below_zero(mocked_aio_response):
     aio_saucenao = AIOSauceNao()
     with pytest.raises(LongLimitReachedError):
         loop.run_until_complete(aio_saucenao.from_url('https://example.com/'))
+
+
+def test_session_reused(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    saucenao = SauceNao()
+    saucenao.from_url('https://example.com/')
+    session = saucenao._session
+    saucenao.from_url('https://example.com/')
+
+    assert session is not None
+    assert saucenao._session is session
+
+
+def test_session_pool_size():
+    saucenao = SauceNao(pool_connections=2, pool_maxsize=32)
+    adapter = saucenao._get_session().get_adapter(SAUCENAO_URL)
+
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 32
+
+
+def test_session_keep_alive_disabled(mocked_responses):
+    def request_callback(request):
+        assert request.headers['Connection'] == 'close'
+        return 500, {}, ''
+
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    with pytest.raises(UnknownApiError):
+        SauceNao(keep_alive=False).from_url('https://example.com/')
+
+
+def test_session_context_manager(mocked_responses):
+    mocked_responses.add(responses.HEAD, SAUCENAO_URL)
+
+    with SauceNao(preconnect=True) as saucenao:
+        assert saucenao._session is not None
+
+    assert saucenao._session is None
+    assert len(mocked_responses.calls) == 1
+
+
+def test_quota_state(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    saucenao = SauceNao()
+    assert saucenao.quota is None
+
+    saucenao.from_url('https://example.com/')
+    assert saucenao.quota[:4] == (4, 1, 100, 66)
+
+
+def test_async_quota_state(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG)
+
+    aio_saucenao = AIOSauceNao(pacer=Pacer())
+    loop.run_until_complete(aio_saucenao.from_url('https://example.com/'))
+    assert aio_saucenao.quota[:4] == (4, 1, 100, 66)
+    assert aio_saucenao.pacer.state == aio_saucenao.quota
+
+
+def test_pacer_short_window(clock):
+    pacer = Pacer(clock=clock)
+
+    # Nothing is known before the first response
+    assert pacer.reserve() == 0
+    pacer.update(QuotaState(4, 2, 100, 50, 0))
+
+    assert pacer.reserve() == 0
+    assert pacer.reserve() == 0
+    assert pacer.reserve() == 30
+
+    clock.now += 10
+    assert pacer.reserve() == 20
+
+
+def test_pacer_penalize(clock):
+    pacer = Pacer(clock=clock)
+
+    pacer.penalize(ShortLimitReachedError())
+    assert pacer.reserve() == 30
+
+    pacer.penalize(LongLimitReachedError())
+    with pytest.raises(LongLimitReachedError):
+        pacer.reserve()
+
+
+def test_pacer_long_limit(clock):
+    pacer = Pacer(clock=clock)
+    pacer.update(QuotaState(4, 3, 100, 0, 0))
+
+    with pytest.raises(LongLimitReachedError):
+        pacer.reserve()
+
+    clock.now += Pacer.LONG_WINDOW
+    assert pacer.reserve() == 0
+
+
+def test_pacer_penalized_by_client(mocked_responses, clock):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=429, json=e.ShortLimitUnregister)
+
+    saucenao = SauceNao(pacer=Pacer(clock=clock))
+    with pytest.raises(ShortLimitReachedError):
+        saucenao.from_url('https://example.com/')
+
+    assert saucenao.pacer.reserve() == 30
+
+
+def test_async_session_reused(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, repeat=True)
+
+    async def search_twice():
+        async with AIOSauceNao(pool_maxsize=4, ttl_dns_cache=60, keepalive_timeout=30) as aio_saucenao:
+            await aio_saucenao.from_url('https://example.com/')
+            session = aio_saucenao._session
+            await aio_saucenao.from_url('https://example.com/')
+
+            assert aio_saucenao._session is session
+            assert session.connector.limit == 4
+            assert session.connector._keepalive_timeout == 30
+        assert session.closed
+
+    loop.run_until_complete(search_twice())
+
+
+def test_async_session_outside_context(mocked_aio_response):
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, repeat=True)
+    aio_saucenao = AIOSauceNao()
+    sessions = []
+
+    async def search():
+        results = await aio_saucenao.from_url('https://example.com/')
+        sessions.append(aio_saucenao._session)
+        return results
+
+    async def search_in_context():
+        async with aio_saucenao:
+            await aio_saucenao.from_url('https://example.com/')
+            return aio_saucenao._session
+
+    def run(coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    # Every event loop gets its own session, which is closed after the search outside `async with`
+    assert run(search()).results
+    assert run(search()).results
+    sessions.append(run(search_in_context()))
+    sessions.append(run(search_in_context()))
+
+    assert sessions[:2] == [None, None]
+    assert sessions[2] is not sessions[3] and sessions[3].closed
+
+
+def test_async_shared_session(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, repeat=True)
+
+    async def search_with_shared_session():
+        async with aiohttp.ClientSession() as session:
+            async with AIOSauceNao(session=session) as aio_saucenao:
+                await aio_saucenao.from_url('https://example.com/')
+            async with AIOSauceNao(session=session) as aio_saucenao:
+                await aio_saucenao.from_url('https://example.com/')
+
+            assert not session.closed
+
+    loop.run_until_complete(search_with_shared_session())
+
+
+def test_async_preconnect(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.head(URL_PATTERN)
+
+    async def preconnect():
+        async with AIOSauceNao(preconnect=True, keep_alive=False) as aio_saucenao:
+            assert aio_saucenao._session.connector.force_close
+
+    loop.run_until_complete(preconnect())
+    assert len(mocked_aio_response.requests) == 1
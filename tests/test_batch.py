@@ -0,0 +1,194 @@
+import io
+import json
+import pytest
+import re
+import responses
+from aioresponses import CallbackResult
+import asyncio
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.batch import Duplicate, RecentKeys
+from saucenao_api.containers import SauceResponse
+from saucenao_api.errors import BadFileSizeError
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+def test_recent_keys():
+    keys = RecentKeys(2)
+
+    assert keys.add('a') is True
+    assert keys.setdefault('a', 1) != 1
+    assert keys.setdefault('d', 1) == 1
+    assert keys.setdefault('d', 2) == 1
+    assert keys.add('a') is False
+    keys.add('b')
+    keys.add('c')
+    assert keys.add('a') is True
+    assert keys.setdefault('a', 1) != 1
+    assert keys.setdefault('d', 1) == 1
+    assert keys.setdefault('d', 2) == 1
+
+
+def test_search_many(mocked_responses, tmp_path):
+    def request_callback(request):
+        if 'url' in request.params:
+            return 413, {}, ''
+        return 200, {}, json_body
+
+    json_body = json.dumps(e.HGame_CG)
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'image')
+    inputs = [str(path), path, io.BytesIO(b'image'), io.BytesIO(b'other image'), 'https://example.com/']
+
+    results = dict(SauceNao().search_many(inputs, workers=2))
+
+    # The path and the file object with the same content are searched only once
+    assert len(mocked_responses.calls) == 3
+    assert len(results) == 3
+    assert isinstance(results['https://example.com/'], BadFileSizeError)
+    assert isinstance(results[inputs[3]], SauceResponse)
+
+
+def test_iter_search_lazy_input(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    taken = []
+
+    def inputs():
+        for i in range(100):
+            taken.append(i)
+            yield f'https://example.com/{i}'
+
+    results = SauceNao().iter_search(inputs(), workers=2)
+    next(results)
+
+    assert len(taken) <= 5
+    assert len(list(results)) == 99
+
+
+def test_iter_search_dedupe_window(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    inputs = ['https://example.com/a', 'https://example.com/b', 'https://example.com/a']
+    results = list(SauceNao().iter_search(inputs, workers=1, dedupe_window=1))
+
+    assert len(results) == 3
+
+
+def test_iter_search_duplicates(mocked_responses, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'image')
+
+    inputs = [str(path), 'https://example.com/', io.BytesIO(b'image'), 'https://example.com/']
+    results = list(SauceNao().iter_search(inputs, workers=1, duplicates=True))
+
+    assert len(mocked_responses.calls) == 2
+    assert len(results) == 4
+    assert {result for _, result in results if isinstance(result, Duplicate)} == {
+        Duplicate(str(path)), Duplicate('https://example.com/')}
+
+
+def test_async_search_many(mocked_aio_response, tmp_path):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, repeat=True)
+
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'image')
+    inputs = [str(path), io.BytesIO(b'image'), 'https://example.com/', 'https://example.com/']
+
+    results = loop.run_until_complete(AIOSauceNao().search_many(inputs, concurrency=2))
+
+    assert len(results) == 2
+    assert all(isinstance(result, SauceResponse) for _, result in results)
+
+    results = loop.run_until_complete(AIOSauceNao().search_many(inputs, concurrency=1, duplicates=True))
+    assert len(results) == 4
+    assert {result for _, result in results if isinstance(result, Duplicate)} == {
+        Duplicate(str(path)), Duplicate('https://example.com/')}
+
+
+def test_async_iter_search_backpressure(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+    taken = []
+
+    mocked_aio_response.post(URL_PATTERN, status=413, repeat=True)
+
+    async def inputs():
+        for i in range(50):
+            taken.append(i)
+            yield f'https://example.com/{i}'
+
+    async def consume():
+        results = []
+        async for item, result in AIOSauceNao().iter_search(inputs(), concurrency=2):
+            results.append(result)
+            if len(results) == 1:
+                await asyncio.sleep(0.01)
+                # Two queues of two and two workers, plus the item being put
+                assert len(taken) <= 8
+        return results
+
+    results = loop.run_until_complete(consume())
+    assert len(results) == 50
+    assert all(isinstance(result, BadFileSizeError) for result in results)
+
+
+def test_async_iter_search_early_stop(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+    all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, repeat=True)
+
+    async def consume():
+        search = AIOSauceNao().iter_search((f'https://example.com/{i}' for i in range(100)), concurrency=2)
+        async for _ in search:
+            break
+        await asyncio.sleep(0.01)    # the workers fill both queues
+        await asyncio.wait_for(search.aclose(), 5)
+
+    loop.run_until_complete(consume())
+    assert [task for task in all_tasks(loop) if not task.done()] == []
+
+
+def test_async_iter_search_stop_in_flight(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+    all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+    started = []
+
+    async def request_callback(url, **kwargs):
+        # Only the first search gets a response, the others are in flight until they are cancelled
+        started.append(kwargs['params']['url'])
+        if len(started) > 1:
+            await asyncio.Event().wait()
+        return CallbackResult(status=200, body=json.dumps(e.HGame_CG))
+
+    mocked_aio_response.post(URL_PATTERN, callback=request_callback, repeat=True)
+
+    async def consume():
+        search = AIOSauceNao().iter_search((f'https://example.com/{i}' for i in range(100)), concurrency=2)
+        async for _ in search:
+            break
+        await asyncio.wait_for(search.aclose(), 5)
+
+    loop.run_until_complete(consume())
+    assert len(started) >= 2
+    assert [task for task in all_tasks(loop) if not task.done()] == []
+
+
+def test_async_iter_search_input_error(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, repeat=True)
+
+    def inputs():
+        yield 'https://example.com/'
+        raise RuntimeError('broken input')
+
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(AIOSauceNao().search_many(inputs()))
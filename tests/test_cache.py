@@ -0,0 +1,187 @@
+import pytest
+import re
+import responses
+import asyncio
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.cache import Cache, MemoryCache, SQLiteCache, make_key, normalize_url, params_key
+from saucenao_api.errors import ShortLimitReachedError, LongLimitReachedError
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+def test_normalize_url():
+    assert normalize_url('HTTPS://Example.COM:443/a?b=1#c') == 'https://example.com/a?b=1'
+    assert normalize_url('http://example.com:8080') == 'http://example.com:8080/'
+
+
+def test_make_key():
+    params = SauceNao('key').params
+
+    assert make_key(params, url='https://example.com/') == make_key(SauceNao().params, url='https://EXAMPLE.com')
+    assert make_key(params, url='https://example.com/') != make_key(SauceNao(numres=1).params,
+                                                                      url='https://example.com/')
+    assert make_key(params, content=b'image') != make_key(params, content=b'other image')
+    assert make_key(params, content=b'image') != make_key(params, url='image')
+    # Test mode returns at most one result per index
+    assert make_key(params, url='https://example.com/') != make_key(SauceNao(testmode=1).params,
+                                                                      url='https://example.com/')
+    assert params_key(params) != params_key(SauceNao(testmode=1).params)
+
+
+def test_incomplete_cache():
+    class GetOnlyCache(Cache):
+        def get(self, key, *, allow_stale=False):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyCache()
+
+
+def test_lru_eviction():
+    cache = MemoryCache(maxsize=2)
+    cache.set('a', {'a': 1})
+    cache.set('b', {'b': 1})
+    cache.get('a')
+    cache.set('c', {'c': 1})
+
+    assert len(cache) == 2
+    assert cache.get('a') == {'a': 1}
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_ttl(clock):
+    cache = MemoryCache(ttl=60, clock=clock)
+    cache.set('a', {'a': 1})
+
+    clock.now += 61
+    assert cache.get('a') is None
+    assert cache.get('a', allow_stale=True) == {'a': 1}
+
+
+def test_cached_from_url(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    saucenao = SauceNao(cache=MemoryCache())
+    first = saucenao.from_url('https://example.com/')
+    second = saucenao.from_url('https://example.com/')
+
+    assert len(mocked_responses.calls) == 1
+    assert second.raw == first.raw
+    assert repr(second[0]) == repr(first[0])
+    assert (saucenao.cache.hits, saucenao.cache.misses) == (1, 1)
+
+
+def test_cached_from_file(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    saucenao = SauceNao(cache=MemoryCache())
+    with open('tests/test_suite.py', 'rb') as f:
+        saucenao.from_file(f)
+        f.seek(0)
+        saucenao.from_file(f)
+
+    assert len(mocked_responses.calls) == 1
+
+
+def test_async_cached_from_file(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG)
+
+    aio_saucenao = AIOSauceNao(cache=MemoryCache())
+    first = loop.run_until_complete(aio_saucenao.from_file(b'image'))
+    second = loop.run_until_complete(aio_saucenao.from_file(b'image'))
+
+    assert second.raw == first.raw
+    assert aio_saucenao.cache.hits == 1
+
+
+def test_sqlite_cache(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with SQLiteCache(path) as cache:
+        cache.set('a', e.HGame_CG)
+
+    with SQLiteCache(path) as cache:
+        assert cache.get('a') == e.HGame_CG
+        assert cache.get('b') is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_sqlite_cache_ttl(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), ttl=60, clock=clock)
+    cache.set('a', {'a': 1})
+
+    clock.now += 61
+    assert cache.get('a') is None
+    assert cache.get('a', allow_stale=True) == {'a': 1}
+
+    cache.compact(keep_stale=True)
+    assert len(cache) == 1
+
+    cache.compact()
+    assert len(cache) == 0
+
+
+def test_sqlite_cache_caps(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), max_entries=3, max_bytes=50, clock=clock)
+    for key in 'abcde':
+        clock.now += 1
+        cache.set(key, {'value': key})
+    cache.get('a')
+
+    # Every entry is 13 bytes long
+    cache.compact()
+    assert len(cache) == 3
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is None
+
+    cache.max_bytes = 30
+    cache.compact()
+    assert len(cache) == 2
+
+
+def test_serve_stale(mocked_responses, tmp_path, clock):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=429, json=e.LongLimitUnregister)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=429, json=e.ShortLimitUnregister)
+
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite'), ttl=60, clock=clock)
+    saucenao = SauceNao(cache=cache, serve_stale=True)
+    saucenao.from_url('https://example.com/')
+
+    clock.now += 61
+    assert saucenao.from_url('https://example.com/').raw == e.HGame_CG
+
+    with pytest.raises(ShortLimitReachedError):
+        saucenao.from_url('https://example.com/other')
+
+
+def test_stale_not_served_by_default(mocked_responses, clock):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=429, json=e.LongLimitUnregister)
+
+    saucenao = SauceNao(cache=MemoryCache(ttl=60, clock=clock))
+    saucenao.from_url('https://example.com/')
+
+    clock.now += 61
+    with pytest.raises(LongLimitReachedError):
+        saucenao.from_url('https://example.com/')
+
+
+def test_async_serve_stale(mocked_aio_response, clock):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG)
+    mocked_aio_response.post(URL_PATTERN, status=429, payload=e.ShortLimitUnregister)
+
+    aio_saucenao = AIOSauceNao(cache=MemoryCache(ttl=60, clock=clock), serve_stale=True)
+    loop.run_until_complete(aio_saucenao.from_url('https://example.com/'))
+
+    clock.now += 61
+    results = loop.run_until_complete(aio_saucenao.from_url('https://example.com/'))
+    assert results.raw == e.HGame_CG
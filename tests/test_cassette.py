@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import re
+
+import pytest
+import responses
+from aioresponses import aioresponses
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.cassette import Cassette, iter_records, reindex
+from saucenao_api.errors import ShortLimitReachedError, UnrecordedRequestError
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+SHORT_LIMIT = {'header': {'status': -2, 'message': 'Search Rate Too High.'}}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'searches.cassette')
+
+
+def record(path, *bodies):
+    with responses.RequestsMock() as rsps:
+        for status, body in bodies:
+            rsps.add(responses.POST, SAUCENAO_URL, json=body, status=status)
+        with Cassette(path, 'record') as cassette:
+            client = SauceNao(cassette=cassette)
+            for _ in bodies:
+                try:
+                    client.from_file(b'content')
+                except ShortLimitReachedError:
+                    pass
+
+
+def test_record_and_replay(path):
+    record(path, (200, e.HGame_CG), (200, e.Pixiv_Images))
+
+    # No network
+    with Cassette(path) as cassette:
+        client = SauceNao(cassette=cassette)
+        assert client.from_file(b'content').raw == e.HGame_CG
+        assert client.from_file(b'content').raw == e.Pixiv_Images
+        # The last response is repeated
+        assert client.from_file(b'content').raw == e.Pixiv_Images
+
+        with pytest.raises(UnrecordedRequestError):
+            client.from_file(b'other content')
+        with pytest.raises(UnrecordedRequestError):
+            client.from_url('https://example.com/')
+
+
+def test_replay_errors(path):
+    record(path, (429, SHORT_LIMIT))
+
+    with Cassette(path) as cassette:
+        with pytest.raises(ShortLimitReachedError):
+            SauceNao(cassette=cassette).from_file(b'content')
+
+
+def test_file_object(path, tmp_path):
+    image = tmp_path / 'image.png'
+    image.write_bytes(b'content' * 100000)
+    record_body = {'header': e.HGame_CG['header'], 'results': e.HGame_CG['results']}
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, SAUCENAO_URL, json=record_body)
+        with Cassette(path, 'record') as cassette:
+            SauceNao(cassette=cassette).from_file(str(image))
+
+    with Cassette(path) as cassette, open(image, 'rb') as f:
+        f.read(10)
+        f.seek(0)
+        assert SauceNao(cassette=cassette).from_file(f).raw == record_body
+        assert f.tell() == 0
+
+
+def test_async(path):
+    with aioresponses() as m:
+        m.post(URL_PATTERN, payload=e.HGame_CG)
+        m.post(URL_PATTERN, status=429, payload=SHORT_LIMIT)
+
+        async def search():
+            with Cassette(path, 'record') as cassette:
+                async with AIOSauceNao(cassette=cassette) as aio:
+                    await aio.from_url('https://example.com/')
+                    with pytest.raises(ShortLimitReachedError):
+                        await aio.from_file(b'content')
+        asyncio.get_event_loop().run_until_complete(search())
+
+    async def replay():
+        with Cassette(path) as cassette:
+            async with AIOSauceNao(cassette=cassette) as aio:
+                assert (await aio.from_url('https://example.com/')).raw == e.HGame_CG
+                with pytest.raises(ShortLimitReachedError):
+                    await aio.from_file(b'content')
+    asyncio.get_event_loop().run_until_complete(replay())
+
+
+def test_key():
+    assert Cassette.key({'api_key': 'a', 'url': 'b'}) == Cassette.key({'url': 'b', 'api_key': 'c'})
+    assert Cassette.key({'url': 'b'}) != Cassette.key({'url': 'c'})
+
+
+def test_records(path):
+    record(path, (200, e.HGame_CG), (429, SHORT_LIMIT))
+
+    records = list(iter_records(path))
+    assert [record.status for record in records] == [200, 429]
+    assert json.loads(records[0].body) == e.HGame_CG
+    assert records[0].key == records[1].key
+    assert all(record.latency >= 0 for record in records)
+
+
+def test_reindex_interrupted_recording(path):
+    record(path, (200, e.HGame_CG))
+    os.remove(path + '.idx')
+    # A record cut off while it was written
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 10)
+
+    with Cassette(path) as cassette:
+        assert len(cassette) == 1
+        assert SauceNao(cassette=cassette).from_file(b'content').raw == e.HGame_CG
+
+    reindex(path)
+    assert os.path.exists(path + '.idx')
+
+
+def test_many_records(path):
+    with Cassette(path, 'record') as cassette:
+        for i in range(1000):
+            cassette.record(Cassette.key({'url': str(i)}), 200, str(i).encode(), 0.0)
+
+    with Cassette(path) as cassette:
+        assert len(cassette) == 1000
+        for i in (0, 1, 500, 999):
+            status, body, _ = cassette.replay(Cassette.key({'url': str(i)}))
+            assert (status, body) == (200, str(i).encode())
+
+
+def test_timing(path, monkeypatch):
+    with Cassette(path, 'record') as cassette:
+        cassette.record(Cassette.key({'url': 'a'}), 200, b'{}', 2.0)
+
+    sleeps = []
+    monkeypatch.setattr('saucenao_api.cassette.time.sleep', sleeps.append)
+    with Cassette(path, timing=True, speed=4) as cassette:
+        cassette.play({'url': 'a'}, None, None)
+    assert sleeps == [0.5]
+
+
+def test_bad_mode(path):
+    with pytest.raises(ValueError):
+        Cassette(path, 'append')
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import os
+
+import pytest
+import responses
+
+from saucenao_api import SauceNao
+from saucenao_api.cli import Checkpoint, Progress, iter_inputs, main, EXIT_LONG_LIMIT
+from saucenao_api.quota import QuotaState
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+# Plenty of quota, so the pacer never waits
+RESPONSE = {'header': dict(e.HGame_CG['header'], short_limit='100', short_remaining=99),
+            'results': e.HGame_CG['results']}
+
+
+# The key would be sent with every request, the mocked ones included
+@pytest.fixture(autouse=True)
+def no_api_key(monkeypatch):
+    monkeypatch.delenv('SAUCENAO_API_KEY', raising=False)
+
+
+@pytest.fixture
+def images(tmp_path):
+    root = tmp_path / 'images'
+    (root / 'b').mkdir(parents=True)
+    (root / 'a.png').write_bytes(b'a')
+    (root / 'b' / 'c.jpg').write_bytes(b'c')
+    (root / 'b' / 'd.JPEG').write_bytes(b'd')
+    (root / 'notes.txt').write_bytes(b'text')
+    return root
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_iter_inputs(images, tmp_path):
+    urls = tmp_path / 'urls.txt'
+    urls.write_text('https://example.com/1.png\n\n# comment\nhttps://example.com/2.png\n')
+
+    assert list(iter_inputs([str(images)])) == [
+        str(images / 'a.png'), str(images / 'b' / 'c.jpg'), str(images / 'b' / 'd.JPEG')]
+    assert list(iter_inputs([str(images / '**' / '*.jpg')])) == [str(images / 'b' / 'c.jpg')]
+    assert str(images / 'notes.txt') in iter_inputs([str(images)], extensions=None)
+    assert list(iter_inputs(['https://example.com/0.png', 'missing.png'], [str(urls)])) == [
+        'https://example.com/0.png', 'missing.png', 'https://example.com/1.png', 'https://example.com/2.png']
+
+
+def test_scan_and_resume(mocked_responses, images, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=RESPONSE)
+    output = str(tmp_path / 'results.jsonl')
+    checkpoint = str(tmp_path / 'scan.db')
+
+    assert main([str(images), '-o', output, '-c', checkpoint, '-q']) == 0
+    lines = read_jsonl(output)
+    assert sorted(line['input'] for line in lines) == sorted(iter_inputs([str(images)]))
+    assert lines[0]['error'] is None
+    assert lines[0]['results'][0]['title'] == e.HGame_CG['results'][0]['data']['title']
+    assert len(mocked_responses.calls) == 3
+
+    # Nothing is searched again, new files are
+    (images / 'e.png').write_bytes(b'e')
+    assert main([str(images), '-o', output, '-c', checkpoint, '-q']) == 0
+    assert len(mocked_responses.calls) == 4
+    assert [line['input'] for line in read_jsonl(output)[3:]] == [str(images / 'e.png')]
+
+    with Checkpoint(checkpoint) as done:
+        assert len(done) == 4
+
+
+def test_duplicate_inputs(mocked_responses, images, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=RESPONSE)
+    output = str(tmp_path / 'results.jsonl')
+    checkpoint = str(tmp_path / 'scan.db')
+    (images / 'copy.png').write_bytes(b'a')
+
+    assert main([str(images), str(images / 'a.png'), '-o', output, '-c', checkpoint, '-q', '-w', '1']) == 0
+    assert [line['input'] for line in read_jsonl(output)].count(str(images / 'a.png')) == 1
+    assert len(read_jsonl(output)) == 3
+    with Checkpoint(checkpoint) as done:
+        assert len(done) == 4
+        assert str(images / 'copy.png') in done
+
+    # The copies were checkpointed, nothing is searched again
+    assert main([str(images), '-o', output, '-c', checkpoint, '-q']) == 0
+    assert len(mocked_responses.calls) == 3
+
+
+def test_errors(mocked_responses, images, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=413)
+    output = str(tmp_path / 'results.jsonl')
+    checkpoint = str(tmp_path / 'scan.db')
+
+    assert main([str(images / 'a.png'), str(images / 'missing.png'), '-o', output, '-c', checkpoint, '-q']) == 0
+    errors = {line['input']: line['error'] for line in read_jsonl(output)}
+    assert errors[str(images / 'a.png')].startswith('BadFileSizeError')
+    assert errors[str(images / 'missing.png')].startswith('FileNotFoundError')
+    with Checkpoint(checkpoint) as done:
+        assert len(done) == 2
+
+
+def test_stats(mocked_responses, images, tmp_path, capsys):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=RESPONSE)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=413)
+    output = str(tmp_path / 'results.jsonl')
+
+    # --retries 0 still searches once
+    assert main([str(images / 'a.png'), str(images / 'b' / 'c.jpg'), str(images / 'missing.png'),
+                 '-o', output, '-w', '1', '--retries', '0']) == 0
+    # Every input is counted once
+    assert capsys.readouterr().err.splitlines()[-1].startswith('done 1, failed 2, skipped 0')
+
+
+def test_long_limit(mocked_responses, images, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.LongLimitUnregister, status=429)
+    output = str(tmp_path / 'results.jsonl')
+    checkpoint = str(tmp_path / 'scan.db')
+
+    assert main([str(images), '-o', output, '-c', checkpoint, '-q']) == EXIT_LONG_LIMIT
+    # Searched again on the next run
+    assert read_jsonl(output) == []
+    with Checkpoint(checkpoint) as done:
+        assert len(done) == 0
+
+
+def test_csv(mocked_responses, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=RESPONSE)
+    output = str(tmp_path / 'results.csv')
+
+    assert main(['https://example.com/1.png', '-o', output, '-q']) == 0
+    assert main(['https://example.com/2.png', '-o', output, '-q']) == 0
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+
+    assert len(rows) == 2 * len(e.HGame_CG['results'])
+    assert rows[0]['input'] == 'https://example.com/1.png'
+    assert rows[-1]['input'] == 'https://example.com/2.png'
+    assert float(rows[0]['similarity']) == float(e.HGame_CG['results'][0]['header']['similarity'])
+    assert rows[0]['error'] == ''
+
+
+def test_progress(clock):
+    stream = io.StringIO()
+    progress = Progress(stream, interval=5, clock=clock)
+    clock.now += 2
+    progress.done = 4
+    progress.show()
+    progress.show()
+    assert stream.getvalue() == 'done 4, failed 0, skipped 0, 2.00/s\n'
+
+    quota = QuotaState(4, 3, 100, 90, 0.0)
+    assert progress.render(quota) == 'done 4, failed 0, skipped 0, 2.00/s, quota 3/4 short 90/100 long'
+
+
+def test_no_inputs(capsys):
+    with pytest.raises(SystemExit):
+        main([])
+    assert 'nothing to search' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('option', [['--workers', '0'], ['--retries', '-1']])
+def test_invalid_counts(capsys, option):
+    with pytest.raises(SystemExit):
+        main(['https://example.com/'] + option)
+    assert option[0] + ' must' in capsys.readouterr().err
+
+
+def test_checkpoint_is_persistent(tmp_path):
+    path = str(tmp_path / 'scan.db')
+    with Checkpoint(path) as done:
+        done.add('a')
+        done.add('a')
+    with Checkpoint(path) as done:
+        assert 'a' in done
+        assert 'b' not in done
+        assert len(done) == 1
+    assert os.path.exists(path)
+
+
+def test_result_filters(mocked_responses, tmp_path):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=RESPONSE)
+    output = str(tmp_path / 'results.jsonl')
+
+    assert main(['https://example.com/1.png', '-o', output, '-q', '--top-k', '1', '--index', '2']) == 0
+    assert len(read_jsonl(output)[0]['results']) == 1
@@ -2,19 +2,17 @@ import pytest
 import responses
 
 from saucenao_api import SauceNao
-from saucenao_api.containers import BasicSauce, BookSauce, VideoSauce
+from saucenao_api import containers as saucenao_containers
+from saucenao_api.containers import (BasicSauce, BookSauce, VideoSauce, PixivSauce, BooruSauce, TwitterSauce,
+                                     SauceResponse, LazySauceResponse, FilteredCounts, container_for, register,
+                                     select_results)
+from saucenao_api.params import DB
 from . import test_suite as e
 
 
 SAUCENAO_URL = SauceNao.SAUCENAO_URL
 
 
-@pytest.fixture
-def mocked_responses():
-    with responses.RequestsMock() as rsps:
-        yield rsps
-
-
 def test_response_attrs(mocked_responses):
     mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HMagazines)
     results = SauceNao().from_url('https://example.com/')
@@ -119,7 +117,8 @@ def test_pixivimages(mocked_responses):
     assert result.title == '妖キャラをカリスマ化してみた。'
     assert result.urls == ['https://www.pixiv.net/member_illust.php?mode=medium&illust_id=4933944']
     assert result.author == '佳虫'
-    assert type(result) is BasicSauce
+    assert type(result) is PixivSauce
+    assert (result.pixiv_id, result.member_id) == (4933944, 724886)
 
 
 def test_niconicoseiga(mocked_responses):
@@ -139,7 +138,8 @@ def test_danbooru(mocked_responses):
     assert result.title == 'highly responsive to prayers, touhou, touhou (pc-98)'
     assert result.urls == ['https://danbooru.donmai.us/post/show/736634']
     assert result.author == 'nichimatsu seri'
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 736634
 
 
 def test_drawrimages(mocked_responses):
@@ -169,7 +169,8 @@ def test_yandere(mocked_responses):
     assert result.title == 'metal gear'
     assert result.urls == ['https://yande.re/post/show/33539']
     assert result.author == ''
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 33539
 
 
 def test_fakku(mocked_responses):
@@ -271,7 +272,8 @@ def test_gelbooru(mocked_responses):
     assert result.title == 'atlus, persona, persona 4'
     assert result.urls == ['https://gelbooru.com/index.php?page=post&s=view&id=559170']
     assert result.author == 'chinchikooru (pixiv)'
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 559170
 
 
 def test_konachan(mocked_responses):
@@ -281,7 +283,8 @@ def test_konachan(mocked_responses):
     assert result.title == 'tengen toppa gurren lagann'
     assert result.urls == ['https://konachan.com/post/show/82192']
     assert result.author == 'gainax, nanao'
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 82192
 
 
 def test_sankakuchannel(mocked_responses):
@@ -291,7 +294,8 @@ def test_sankakuchannel(mocked_responses):
     assert result.title == 'harry potter'
     assert result.urls == ['https://chan.sankakucomplex.com/post/show/4922724']
     assert result.author == ''
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 4922724
 
 
 def test_e621net(mocked_responses):
@@ -301,7 +305,8 @@ def test_e621net(mocked_responses):
     assert result.title == ''
     assert result.urls == ['https://e621.net/post/show/1410034']
     assert result.author == 'unknown artist'
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 1410034
 
 
 def test_idolcomplex(mocked_responses):
@@ -311,7 +316,8 @@ def test_idolcomplex(mocked_responses):
     assert result.title == ''
     assert result.urls == ['https://idol.sankakucomplex.com/post/show/441604']
     assert result.author == ''
-    assert type(result) is BasicSauce
+    assert type(result) is BooruSauce
+    assert result.post_id == 441604
 
 
 def test_bcynetillust(mocked_responses):
@@ -403,7 +409,8 @@ def test_twitter(mocked_responses):
     assert result.title == '2017-06-26T11:09:04Z'
     assert result.urls == ['https://twitter.com/i/web/status/879295443850506242']
     assert result.author == 'petty_lily_xxx'
-    assert type(result) is BasicSauce
+    assert type(result) is TwitterSauce
+    assert (result.tweet_id, result.user_id) == ('879295443850506242', '291022646')
 
 def test_artstation(mocked_responses):
     mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.Artstation)
@@ -432,3 +439,156 @@ def test_furry_network(mocked_responses):
     assert result.author == 'writersmask'
     assert type(result) is BasicSauce 
 
+
+
+def test_booru_post_id():
+    raw = {'header': {'similarity': '90.0', 'thumbnail': '', 'index_id': DB.Gelbooru, 'index_name': ''},
+           'data': {'danbooru_id': 1, 'gelbooru_id': 2, 'creator': ['first', 'second'], 'source': 'source'}}
+    result = SauceResponse._parse_result(raw)
+
+    assert type(result) is BooruSauce
+    assert result.post_id == 2
+    assert result.author == 'first'
+    assert (result.title, result.material, result.characters) == ('source', None, None)
+    assert repr(result) == "<BooruSauce(title='source', similarity=90.00)>"
+
+
+def test_container_registry():
+    assert container_for(DB.Pixiv_Historical) is PixivSauce
+    assert container_for(DB.Movies) is VideoSauce
+    assert container_for(-1) is BasicSauce
+
+    @register(-1)
+    class CustomSauce(BasicSauce):
+        __slots__ = ()
+
+        _TITLE_RULE = ('name', 'title')
+        _URLS_RULE = (('url', lambda url: [url]),)
+
+    raw = {'header': {'similarity': '50.0', 'thumbnail': '', 'index_id': -1, 'index_name': ''},
+           'data': {'title': 'title', 'name': 'name', 'url': 'https://example.com/', 'author_name': 'author'}}
+    try:
+        result = SauceResponse._parse_result(raw)
+        assert type(result) is CustomSauce
+        assert (result.title, result.urls, result.author) == ('name', ['https://example.com/'], 'author')
+        assert CustomSauce._get_urls({}) == [] and CustomSauce._get_urls({}) is not CustomSauce._get_urls({})
+        # The rules of the parent class are untouched
+        assert BasicSauce._get_title(raw['data']) == 'title'
+    finally:
+        del saucenao_containers._CONTAINERS[-1]
+
+
+SUITE_RESPONSES = [value for name, value in vars(e).items()
+                   if isinstance(value, dict) and 'results' in value]
+
+
+@pytest.mark.parametrize('raw', SUITE_RESPONSES)
+def test_lazy_response_matches_eager(raw):
+    eager = SauceResponse(raw)
+    lazy = LazySauceResponse(raw)
+
+    assert repr(lazy) == repr(eager)
+    assert lazy.minimum_similarity == eager.minimum_similarity
+    assert lazy.results_returned == eager.results_returned
+    assert [repr(result) for result in lazy] == [repr(result) for result in eager]
+    assert [result.urls for result in lazy] == [result.urls for result in eager]
+
+
+def test_lazy_response_builds_on_access():
+    lazy = LazySauceResponse(e.ALL)
+
+    with pytest.raises(AttributeError):
+        object.__getattribute__(lazy, 'short_remaining')
+    assert lazy.short_remaining == 2
+    assert object.__getattribute__(lazy, 'short_remaining') == 2
+
+    assert repr(lazy[0]) == repr(SauceResponse(e.ALL)[0])
+    assert len(lazy.results._parsed) == 1
+    assert lazy.results._order is None
+
+    assert repr(lazy[-1]) == repr(SauceResponse(e.ALL)[-1])
+    assert repr(lazy[1:3]) == repr(SauceResponse(e.ALL)[1:3])
+    with pytest.raises(IndexError):
+        lazy[len(lazy)]
+    with pytest.raises(AttributeError):
+        lazy.missing
+
+
+def test_lazy_client_option(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.DoujinshiDB)
+    results = SauceNao(lazy=True).from_url('https://example.com/')
+
+    assert isinstance(results, LazySauceResponse)
+    assert results.results == []
+    assert bool(results) is False
+
+
+def test_slots():
+    results = SauceResponse(e.ALL)
+
+    with pytest.raises(AttributeError):
+        results.extra = 1
+    with pytest.raises(AttributeError):
+        results[0].extra = 1
+
+
+def test_keep_raw_disabled(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.Anime)
+    results = SauceNao(keep_raw=False).from_url('https://example.com/')
+
+    assert results.raw is None
+    assert results[0].raw is None
+    assert repr(results[0]) == "<VideoSauce(title='One Piece', part='299', similarity=19.50)>"
+
+
+def test_data_keys(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.Pixiv_Images)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.Pixiv_Images)
+
+    results = SauceNao(data_keys=['pixiv_id']).from_url('https://example.com/')
+    assert set(results[0].raw['data']) == {'pixiv_id'}
+    assert results[0].raw['header'] == e.Pixiv_Images['results'][0]['header']
+    assert results.raw['results'][0] is results[0].raw
+    assert results[0].author == '佳虫'
+
+    results = SauceNao(data_keys=['pixiv_id'], lazy=True).from_url('https://example.com/')
+    assert set(results[0].raw['data']) == {'pixiv_id'}
+    assert results.raw == e.Pixiv_Images
+
+
+def make_results(*scores):
+    return [{'header': {'similarity': f'{similarity:.2f}', 'index_id': index_id}, 'data': {'position': position}}
+            for position, (similarity, index_id) in enumerate(scores)]
+
+
+def test_select_results():
+    results = make_results((50, 5), (90, 9), (70, 5), (90, 5), (85, 21))
+
+    kept, filtered = select_results(results)
+    assert [r['data']['position'] for r in kept] == [1, 3, 4, 2, 0]
+    assert filtered == FilteredCounts(0, 0, 0)
+
+    kept, filtered = select_results(results, min_similarity=80, index_allowlist=[5, 9], top_k=1)
+    assert [r['data']['position'] for r in kept] == [1]
+    assert filtered == FilteredCounts(index=1, similarity=2, top_k=1)
+    assert filtered.total == 4
+
+    # Ties keep their order in the response, like the full sort
+    kept, _ = select_results(results, top_k=2)
+    assert [r['data']['position'] for r in kept] == [1, 3]
+    assert select_results(None, top_k=2) == ([], FilteredCounts())
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_result_filters(mocked_responses, lazy):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.ALL)
+    best = max(e.ALL['results'], key=lambda r: float(r['header']['similarity']))
+    index_id = best['header']['index_id']
+
+    sauce = SauceNao(lazy=lazy, index_allowlist=[index_id], min_similarity=1, top_k=1)
+    results = sauce.from_url('https://example.com/')
+    assert len(results) == 1
+    assert results[0].raw == best
+    assert results.filtered.total == len(e.ALL['results']) - 1
+    assert results.raw['results'] == [best]
+    assert results.raw['header'] == e.ALL['header']
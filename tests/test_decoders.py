@@ -0,0 +1,87 @@
+import json
+import pytest
+import re
+import sys
+import responses
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.containers import SauceResponse
+from saucenao_api.decoders import default_loads
+from saucenao_api.errors import LongLimitReachedError
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+class CountingLoads:
+    def __init__(self):
+        self.bodies = []
+
+    def __call__(self, body):
+        self.bodies.append(body)
+        return json.loads(body)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    calls = 0
+
+    def submit(self, *args, **kwargs):
+        self.calls += 1
+        return super().submit(*args, **kwargs)
+
+
+def test_default_loads(monkeypatch):
+    assert default_loads()(b'{"a": [1]}') == {'a': [1]}
+
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    monkeypatch.setitem(sys.modules, 'ujson', None)
+    assert default_loads() is json.loads
+
+
+def test_custom_loads(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=429, json=e.LongLimitUnregister)
+
+    loads = CountingLoads()
+    saucenao = SauceNao(json_loads=loads)
+
+    assert saucenao.from_url('https://example.com/').raw == e.HGame_CG
+    with pytest.raises(LongLimitReachedError):
+        saucenao.from_url('https://example.com/')
+    assert len(loads.bodies) == 2
+    assert isinstance(loads.bodies[0], bytes)
+
+
+def test_async_custom_loads(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG)
+
+    loads = CountingLoads()
+    results = loop.run_until_complete(AIOSauceNao(json_loads=loads).from_url('https://example.com/'))
+
+    assert results.raw == e.HGame_CG
+    assert len(loads.bodies) == 1
+
+
+def test_async_offload(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG)
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG)
+
+    with CountingExecutor(max_workers=1) as executor:
+        small = AIOSauceNao(offload_threshold=10 ** 6, executor=executor)
+        loop.run_until_complete(small.from_url('https://example.com/'))
+        assert executor.calls == 0
+
+        large = AIOSauceNao(offload_threshold=1, executor=executor)
+        results = loop.run_until_complete(large.from_url('https://example.com/'))
+        assert executor.calls == 2
+
+    assert type(results) is SauceResponse
+    assert results.raw == e.HGame_CG
+    assert repr(results[0]) == "<BasicSauce(title='Haramiko', similarity=17.47)>"
@@ -0,0 +1,99 @@
+import pytest
+import responses
+
+from saucenao_api import SauceNao
+from . import test_suite as e
+
+np = pytest.importorskip('numpy')
+pa = pytest.importorskip('pyarrow')
+from saucenao_api.export import (COLUMNS, ColumnBuilder, iter_batches, read_table, to_arrow, to_numpy,  # noqa: E402
+                                 write_feather, write_parquet)
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+RESPONSES = [e.ALL, e.Anime, {'header': e.ALL['header'], 'results': None}, e.HMagazines]
+
+
+def expected_rows(raws):
+    # The same fields read through the result containers
+    rows = []
+    for position, raw in enumerate(raws):
+        if not raw['results']:
+            continue
+        response = SauceNao()._make_response(raw)
+        for result in sorted(response.results, key=lambda r: raw['results'].index(r.raw)):
+            rows.append({
+                'response': position,
+                'similarity': pytest.approx(result.similarity, abs=1e-4),
+                'index_id': result.index_id,
+                'title': result.title,
+                'author': result.author,
+                'url': result.urls[0] if result.urls else None,
+                'part': getattr(result, 'part', None),
+                'year': getattr(result, 'year', None),
+                'est_time': getattr(result, 'est_time', None),
+                'short_limit': int(raw['header']['short_limit']),
+                'short_remaining': raw['header']['short_remaining'],
+                'long_limit': int(raw['header']['long_limit']),
+                'long_remaining': raw['header']['long_remaining'],
+            })
+    return rows
+
+
+def test_to_arrow():
+    table = to_arrow(RESPONSES)
+    assert table.column_names == [name for name, *_ in COLUMNS]
+    assert table.to_pylist() == expected_rows(RESPONSES)
+
+
+def test_to_numpy():
+    array = to_numpy(RESPONSES)
+    rows = expected_rows(RESPONSES)
+    assert len(array) == len(rows)
+    for row, expected in zip(array, rows):
+        assert dict(zip(array.dtype.names, row.tolist())) == expected
+    assert array['similarity'].dtype == np.float32
+
+
+def test_empty():
+    assert len(to_numpy([])) == 0
+    assert to_arrow([]).num_rows == 0
+    assert len(ColumnBuilder()) == 0
+
+
+def test_sauce_responses(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.Anime)
+    response = SauceNao().from_url('https://example.com/')
+    assert to_arrow([response]).to_pylist() == expected_rows([e.Anime])
+
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.Anime)
+    with pytest.raises(ValueError):
+        to_arrow([SauceNao(keep_raw=False).from_url('https://example.com/')])
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_filtered_responses(mocked_responses, lazy):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.ALL)
+    response = SauceNao(lazy=lazy, min_similarity=50, top_k=3).from_url('https://example.com/')
+    kept = {'header': e.ALL['header'], 'results': [result.raw for result in response]}
+
+    assert response.filtered.total
+    assert to_arrow([response]).to_pylist() == expected_rows([kept])
+
+
+def test_chunks():
+    batches = list(iter_batches(RESPONSES * 10, chunk_size=20))
+    assert all(batch.num_rows >= 20 for batch in batches[:-1])
+    assert sum(batch.num_rows for batch in batches) == to_arrow(RESPONSES).num_rows * 10
+    # Positions count across chunks
+    assert batches[-1].column('response').to_pylist()[-1] == len(RESPONSES) * 10 - 1
+
+
+@pytest.mark.parametrize('write', [write_parquet, write_feather])
+def test_write_and_read(tmp_path, write):
+    path = str(tmp_path / 'results')
+    rows = write(iter(RESPONSES * 10), path, chunk_size=20)
+
+    table = read_table(path)
+    assert table.num_rows == rows == to_arrow(RESPONSES).num_rows * 10
+    assert table.slice(0, len(expected_rows(RESPONSES))).to_pylist() == expected_rows(RESPONSES)
+    assert read_table(path, columns=['title']).column_names == ['title']
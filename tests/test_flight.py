@@ -0,0 +1,181 @@
+import asyncio
+import json
+import re
+import threading
+
+import responses
+from aioresponses import aioresponses, CallbackResult
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import UnknownApiError
+from saucenao_api.flight import SingleFlight, AsyncSingleFlight
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+HGAME_CG_TEXT = json.dumps(e.HGame_CG)
+
+
+# The table of running flights, which sets `joined` once `followers` callers joined a running flight. The
+# lookup runs under the flight's lock, so the leader can't finish before the last follower got the flight
+class JoinedCalls(dict):
+    def __init__(self, followers, joined):
+        super().__init__()
+        self.followers = followers
+        self.joined = joined
+        self._count = 0
+
+    def get(self, key, default=None):
+        call = super().get(key, default)
+        if call is not None:
+            self._count += 1
+            if self._count == self.followers:
+                self.joined.set()
+        return call
+
+
+def gate(flights, followers, joined):
+    flights._calls = JoinedCalls(followers, joined)
+    return joined
+
+
+def run_threads(func, count):
+    results = [None] * count
+
+    def target(i):
+        try:
+            results[i] = func()
+        except Exception as exc:
+            results[i] = exc
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_shares_result():
+    flights = SingleFlight()
+    joined = gate(flights, 4, threading.Event())
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        joined.wait(5)
+        return object()
+
+    results = run_threads(lambda: flights.do('key', slow, 1), 5)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert len(flights) == 0
+
+    assert flights.do('key', lambda value: calls.append(value) or object(), 2) is not results[0]
+    assert calls == [1, 2]
+
+
+def test_single_flight_shares_exception():
+    flights = SingleFlight()
+    joined = gate(flights, 2, threading.Event())
+
+    def fail():
+        joined.wait(5)
+        raise ValueError('shared')
+
+    results = run_threads(lambda: flights.do('key', fail), 3)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(flights) == 0
+
+
+def test_async_single_flight_survives_cancelled_caller():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def main():
+        released = asyncio.Event()
+
+        async def slow():
+            calls.append(1)
+            await released.wait()
+            return 'result'
+
+        first = asyncio.ensure_future(flights.do('key', slow))
+        second = asyncio.ensure_future(flights.do('key', slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        released.set()
+        return await second
+
+    assert asyncio.get_event_loop().run_until_complete(main()) == 'result'
+    assert calls == [1]
+    assert len(flights) == 0
+
+
+def test_from_url_coalesced():
+    saucenao = SauceNao(single_flight=True)
+    joined = gate(saucenao._flights, 3, threading.Event())
+
+    def request_callback(request):
+        joined.wait(5)
+        return 200, {}, HGAME_CG_TEXT
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+        results = run_threads(lambda: saucenao.from_url('https://example.com/'), 4)
+        assert len(rsps.calls) == 1
+
+    assert all(result is results[0] for result in results)
+    assert results[0].raw == e.HGame_CG
+
+
+def test_from_file_coalesced():
+    saucenao = SauceNao(single_flight=True)
+    joined = gate(saucenao._flights, 3, threading.Event())
+
+    def request_callback(request):
+        joined.wait(5)
+        return 500, {}, ''
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+        results = run_threads(lambda: saucenao.from_file(b'image'), 4)
+        assert len(rsps.calls) == 1
+
+    assert all(isinstance(result, UnknownApiError) for result in results)
+
+
+def test_not_coalesced_by_default():
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, SAUCENAO_URL, body=HGAME_CG_TEXT)
+        run_threads(lambda: SauceNao().from_url('https://example.com/'), 3)
+        assert len(rsps.calls) == 3
+
+
+def test_async_coalesced():
+    calls = []
+    aio = AIOSauceNao(single_flight=True)
+
+    async def request_callback(url, **kwargs):
+        calls.append(kwargs['params'].get('url'))
+        await asyncio.wait_for(aio._flights._calls.joined.wait(), 5)
+        return CallbackResult(status=200, body=HGAME_CG_TEXT)
+
+    async def main():
+        async with aio:
+            gate(aio._flights, 3, asyncio.Event())
+            urls = await asyncio.gather(*[aio.from_url('https://example.com/') for _ in range(4)])
+            gate(aio._flights, 3, asyncio.Event())
+            files = await asyncio.gather(*[aio.from_file(b'image') for _ in range(4)])
+        return urls, files
+
+    with aioresponses() as m:
+        m.post(URL_PATTERN, callback=request_callback, repeat=True)
+        urls, files = asyncio.get_event_loop().run_until_complete(main())
+
+    assert calls == ['https://example.com/', None]
+    assert all(result is urls[0] for result in urls)
+    assert all(result is files[0] for result in files)
@@ -0,0 +1,161 @@
+import pytest
+import re
+import responses
+from aioresponses import CallbackResult
+import asyncio
+import threading
+from collections import defaultdict
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import BadKeyError, ShortLimitReachedError, LongLimitReachedError
+from saucenao_api.key_pool import KeyPool
+from saucenao_api.quota import Pacer, QuotaState
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+def test_empty_pool():
+    with pytest.raises(ValueError):
+        KeyPool([])
+
+
+def test_fresh_keys_first():
+    pool = KeyPool(['a', 'b'])
+    key, pacer = pool.acquire()
+    pacer.update(QuotaState(4, 3, 100, 99, 0))
+
+    assert pool.acquire()[0] != key
+
+
+def test_most_remaining_first():
+    pool = KeyPool(['a', 'b'])
+    pool._pacers['a'].update(QuotaState(4, 3, 100, 10, 0))
+    pool._pacers['b'].update(QuotaState(4, 3, 100, 90, 0))
+
+    assert pool.acquire()[0] == 'b'
+
+
+def test_limited_key_skipped():
+    pool = KeyPool(['a', 'b'])
+    pool.report('a', ShortLimitReachedError())
+    assert pool.acquire()[0] == 'b'
+
+    pool.report('b', LongLimitReachedError())
+    assert pool.acquire()[0] == 'a'
+
+    pool.report('a', LongLimitReachedError())
+    with pytest.raises(LongLimitReachedError):
+        pool.acquire()
+
+
+def test_reserve_stays_inside_short_limit():
+    pool = KeyPool(['a', 'b', 'c'], pacer_factory=lambda: Pacer(clock=lambda: 1000.0))
+    for key in pool.keys:
+        pool._pacers[key].update(QuotaState(2, 2, 100, 100, 0))
+    starts = defaultdict(list)
+
+    def reserve():
+        for _ in range(10):
+            key, _, delay = pool.reserve()
+            starts[key].append(delay)
+
+    threads = [threading.Thread(target=reserve) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The free slots of all the keys are used before any key has to wait
+    assert sorted(delay for delays in starts.values() for delay in delays)[:6] == [0] * 6
+    for delays in starts.values():
+        delays.sort()
+        assert all(later - earlier >= 30 for earlier, later in zip(delays, delays[2:]))
+
+
+def test_limited_key_penalized_once(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=429, json={'header': {'message': 'Search Rate Too High'}})
+    penalties = []
+
+    class CountingPacer(Pacer):
+        def penalize(self, exc):
+            penalties.append(exc)
+            super().penalize(exc)
+
+    saucenao = SauceNao(key_pool=KeyPool(['only'], pacer_factory=CountingPacer))
+    with pytest.raises(ShortLimitReachedError):
+        saucenao.from_url('https://example.com/')
+    assert len(penalties) == 1
+
+
+def test_bad_key_removed():
+    pool = KeyPool(['a', 'b'])
+    pool.report('a', BadKeyError())
+    assert pool.keys == ['b']
+
+    pool.report('b', BadKeyError())
+    with pytest.raises(BadKeyError):
+        pool.acquire()
+
+
+def test_failover(mocked_responses):
+    used_keys = []
+
+    def request_callback(request):
+        used_keys.append(request.params['api_key'])
+        if len(used_keys) == 1:
+            return 429, {}, '{"header": {"message": "Search Rate Too High"}}'
+        return 200, {}, '{"header": {"user_id": "1", "account_type": "1", "short_limit": "4", "long_limit": "100", ' \
+                        '"long_remaining": 99, "short_remaining": 3, "status": 0, "results_requested": 6, ' \
+                        '"search_depth": "128", "minimum_similarity": 0, "results_returned": 0}, "results": []}'
+
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    saucenao = SauceNao(key_pool=KeyPool(['first', 'second']))
+    results = saucenao.from_url('https://example.com/')
+
+    assert used_keys == ['first', 'second']
+    assert results.long_remaining == 99
+
+
+def test_failover_from_file(mocked_responses):
+    bodies = []
+
+    def request_callback(request):
+        bodies.append(request.body)
+        return 403, {}, ''
+
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    saucenao = SauceNao(key_pool=KeyPool(['first', 'second']))
+    with open('tests/test_suite.py', 'rb') as f:
+        bin_file = f.read()
+        f.seek(0)
+        with pytest.raises(BadKeyError):
+            saucenao.from_file(f)
+
+    assert len(bodies) == 2
+    assert bin_file in bodies[0]
+    assert bin_file in bodies[1]
+    assert saucenao.key_pool.keys == []
+
+
+def test_async_failover(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+    used_keys = []
+
+    def request_callback(url, **kwargs):
+        used_keys.append(kwargs['params']['api_key'])
+        if len(used_keys) == 1:
+            return CallbackResult(status=403)
+        return CallbackResult(status=429, payload=e.LongLimitUnregister)
+
+    mocked_aio_response.post(URL_PATTERN, callback=request_callback, repeat=True)
+
+    aio_saucenao = AIOSauceNao(key_pool=KeyPool(['first', 'second']))
+    with pytest.raises(LongLimitReachedError):
+        loop.run_until_complete(aio_saucenao.from_url('https://example.com/'))
+
+    assert used_keys == ['first', 'second']
+    assert aio_saucenao.key_pool.keys == ['second']
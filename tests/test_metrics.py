@@ -0,0 +1,124 @@
+import asyncio
+import json
+import re
+import urllib.request
+
+import pytest
+import responses
+from aioresponses import aioresponses
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import UnknownApiError
+from saucenao_api.metrics import MetricsSink, PrometheusMetrics, RequestTimer
+from . import test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+def test_render():
+    metrics = PrometheusMetrics(buckets=[1, 0.1])
+    metrics.increment('saucenao_requests_total', status='200', error='')
+    metrics.increment('saucenao_requests_total', status='200', error='')
+    metrics.increment('saucenao_requests_total', status='', error='Connection"Error')
+    metrics.set('saucenao_short_remaining', 3)
+    metrics.observe('saucenao_phase_seconds', 0.05, phase='wait')
+    metrics.observe('saucenao_phase_seconds', 0.5, phase='wait')
+    metrics.observe('saucenao_phase_seconds', 5, phase='wait')
+
+    assert metrics.render() == '''\
+# HELP saucenao_requests_total SauceNAO API requests by status code and error class.
+# TYPE saucenao_requests_total counter
+saucenao_requests_total{error="",status="200"} 2
+saucenao_requests_total{error="Connection\\"Error",status=""} 1
+# HELP saucenao_short_remaining Remaining searches in the 30 seconds window.
+# TYPE saucenao_short_remaining gauge
+saucenao_short_remaining 3
+# HELP saucenao_phase_seconds Time spent in each phase of a search.
+# TYPE saucenao_phase_seconds histogram
+saucenao_phase_seconds_bucket{phase="wait",le="0.1"} 1
+saucenao_phase_seconds_bucket{phase="wait",le="1"} 2
+saucenao_phase_seconds_bucket{phase="wait",le="+Inf"} 3
+saucenao_phase_seconds_sum{phase="wait"} 5.55
+saucenao_phase_seconds_count{phase="wait"} 3
+'''
+
+
+def test_incomplete_sink():
+    class CounterSink(MetricsSink):
+        def increment(self, name, value=1, **labels):
+            pass
+
+    with pytest.raises(TypeError):
+        CounterSink()
+
+
+def test_request_timer(clock):
+    clock.step = 0.5
+    metrics = PrometheusMetrics()
+    with pytest.raises(ValueError):
+        with RequestTimer(metrics, clock=clock) as timer:
+            timer.status = 500
+            timer.mark('wait')
+            raise ValueError
+
+    assert metrics.value('saucenao_requests_total', status='500', error='ValueError') == 1
+    assert metrics.value('saucenao_phase_seconds', phase='wait') == 1
+    assert metrics.value('saucenao_request_seconds') is None
+
+
+def test_from_file(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    metrics = PrometheusMetrics()
+    SauceNao(metrics=metrics).from_file(b'content')
+
+    assert metrics.value('saucenao_requests_total', status='200', error='') == 1
+    assert metrics.value('saucenao_request_seconds') == 1
+    for phase in ('connect', 'upload', 'wait', 'download', 'decode', 'build'):
+        assert metrics.value('saucenao_phase_seconds', phase=phase) == 1
+    assert metrics.value('saucenao_uploaded_bytes_total') == len(mocked_responses.calls[0].request.body)
+    assert metrics.value('saucenao_downloaded_bytes_total') == len(json.dumps(e.HGame_CG))
+    assert metrics.value('saucenao_short_remaining') == e.HGame_CG['header']['short_remaining']
+    assert metrics.value('saucenao_long_remaining') == e.HGame_CG['header']['long_remaining']
+
+
+def test_error(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, status=502)
+
+    metrics = PrometheusMetrics()
+    with pytest.raises(UnknownApiError):
+        SauceNao(metrics=metrics).from_url('https://example.com/')
+
+    assert metrics.value('saucenao_requests_total', status='502', error='UnknownApiError') == 1
+    assert metrics.value('saucenao_phase_seconds', phase='connect') is None
+    assert metrics.value('saucenao_phase_seconds', phase='wait') == 1
+    assert metrics.value('saucenao_short_remaining') is None
+
+
+def test_async_from_url():
+    metrics = PrometheusMetrics()
+    with aioresponses() as m:
+        m.post(URL_PATTERN, payload=e.HGame_CG)
+        aio = AIOSauceNao(metrics=metrics)
+        asyncio.get_event_loop().run_until_complete(aio.from_url('https://example.com/'))
+        asyncio.get_event_loop().run_until_complete(aio.close())
+
+    assert metrics.value('saucenao_requests_total', status='200', error='') == 1
+    for phase in ('wait', 'download', 'decode', 'build'):
+        assert metrics.value('saucenao_phase_seconds', phase=phase) == 1
+    assert metrics.value('saucenao_downloaded_bytes_total') > 0
+    assert metrics.value('saucenao_long_remaining') == e.HGame_CG['header']['long_remaining']
+
+
+def test_serve():
+    metrics = PrometheusMetrics()
+    metrics.increment('saucenao_requests_total', status='200', error='')
+    server = metrics.serve(0, '127.0.0.1')
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as resp:
+            assert resp.headers['Content-Type'] == PrometheusMetrics.CONTENT_TYPE
+            assert resp.read().decode() == metrics.render()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,162 @@
+import asyncio
+import io
+import json
+import re
+import pytest
+import responses
+
+from saucenao_api import SauceNao
+from . import test_suite as e
+
+Image = pytest.importorskip('PIL.Image')
+np = pytest.importorskip('numpy')
+from saucenao_api.phash import PerceptualIndex, dhash, phash  # noqa: E402
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+
+
+def make_image(seed, size=(256, 256), format='PNG', **kwargs):
+    pixels = np.random.RandomState(seed).randint(0, 255, (6, 6, 3), dtype=np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).resize(size, Image.BICUBIC).save(output, format=format, **kwargs)
+    return output.getvalue()
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+@pytest.mark.parametrize('hash_func', [dhash, phash])
+def test_hash_near_duplicates(hash_func):
+    original = hash_func(make_image(1))
+    resized = hash_func(make_image(1, size=(128, 128)))
+    reencoded = hash_func(make_image(1, format='JPEG', quality=60))
+    other = hash_func(make_image(2))
+
+    assert 0 <= original < 2 ** 64
+    assert distance(original, resized) <= 6
+    assert distance(original, reencoded) <= 6
+    assert distance(original, other) > 10
+
+
+def test_find_within_distance():
+    index = PerceptualIndex(max_distance=3)
+    index.add(0b1111, {'id': 1})
+    index.add(2 ** 63 + 2 ** 40, {'id': 2})
+
+    assert index.find(0b0111) == {'id': 1}
+    assert index.find(0b1111 ^ (2 ** 20 + 2 ** 50 + 2 ** 63)) == {'id': 1}
+    assert index.find(0b1111 ^ (2 ** 10 + 2 ** 20 + 2 ** 50 + 2 ** 63)) is None
+    assert index.find(2 ** 63) == {'id': 2}
+    assert index.find(0b1111, namespace='other') is None
+    assert len(index) == 2
+
+
+def test_nearest_match():
+    index = PerceptualIndex(max_distance=8)
+    index.add(0b11111111, {'id': 1})
+    index.add(0b1, {'id': 2})
+
+    assert index.find(0b11) == {'id': 2}
+
+
+def test_many_hashes():
+    hashes = np.random.RandomState(0).randint(0, 2 ** 63, 20000, dtype=np.int64).astype(np.uint64) * 2
+    index = PerceptualIndex(max_distance=4)
+    for i, image_hash in enumerate(hashes.tolist()):
+        index.add(image_hash, {'id': i})
+
+    assert index.find(hashes[1234].item() ^ 0b10101) == {'id': 1234}
+
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / 'phash.sqlite')
+    with PerceptualIndex(path) as index:
+        index.add(2 ** 64 - 1, e.HGame_CG, namespace='params')
+
+    with PerceptualIndex(path) as index:
+        assert index.find(2 ** 64 - 2, namespace='params') == e.HGame_CG
+        assert len(index) == 1
+
+
+def test_max_entries():
+    index = PerceptualIndex(max_distance=0, max_entries=2)
+    for i in range(3):
+        index.add(i, {'id': i})
+        index.find(0)
+
+    # 1 was the least recently used
+    assert index.find(1) is None
+    assert index.find(0) == {'id': 0}
+    assert index.find(2) == {'id': 2}
+    assert len(index) == 2
+
+    # The freed slots are reused instead of growing the tables
+    for i in range(3, 5000):
+        index.add(i, {'id': i})
+    assert index.find(4999) == {'id': 4999}
+    assert len(index._namespaces['']._hashes) == 1024
+
+
+def test_ttl(tmp_path, clock):
+    path = str(tmp_path / 'phash.sqlite')
+    with PerceptualIndex(path, max_distance=2, ttl=60, clock=clock) as index:
+        index.add(0b1111, {'id': 1})
+        clock.now += 30
+        index.add(0b1110, {'id': 2})
+        assert index.find(0b1111) == {'id': 1}
+
+        # The expired nearest image is dropped, a farther one is still found
+        clock.now += 40
+        assert index.find(0b1111) == {'id': 2}
+        assert len(index) == 1
+
+    clock.now += 60
+    with PerceptualIndex(path, ttl=60, clock=clock) as index:
+        assert len(index) == 0
+        assert index.find(0b1110) is None
+
+
+def test_not_an_image():
+    assert PerceptualIndex().hash(b'not an image') is None
+
+
+def test_from_file_skips_near_duplicates(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    saucenao = SauceNao(phash_index=PerceptualIndex(max_distance=6))
+    first = saucenao.from_file(make_image(1))
+    second = saucenao.from_file(io.BytesIO(make_image(1, size=(200, 200), format='JPEG')))
+    saucenao.from_file(make_image(2))
+
+    assert len(mocked_responses.calls) == 2
+    assert second.raw == first.raw
+    assert json.loads(mocked_responses.calls[0].response.text) == first.raw
+
+
+def test_different_params_not_shared(mocked_responses):
+    mocked_responses.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+
+    index = PerceptualIndex()
+    SauceNao(phash_index=index).from_file(make_image(1))
+    SauceNao(numres=1, phash_index=index).from_file(make_image(1))
+
+    assert len(mocked_responses.calls) == 2
+
+
+def test_async_from_file_skips_near_duplicates():
+    from aioresponses import aioresponses
+    from saucenao_api import AIOSauceNao
+
+    async def search_twice():
+        async with AIOSauceNao(phash_index=PerceptualIndex()) as aio:
+            first = await aio.from_file(make_image(1))
+            second = await aio.from_file(make_image(1, size=(200, 200)))
+        return first, second
+
+    with aioresponses() as m:
+        m.post(re.compile(r'^https://saucenao\.com/search\.php'), payload=e.HGame_CG)
+        first, second = asyncio.get_event_loop().run_until_complete(search_twice())
+        assert len(m.requests) == 1
+
+    assert second.raw == first.raw == e.HGame_CG
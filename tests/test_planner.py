@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.metrics import PrometheusMetrics
+from saucenao_api.params import DB
+from saucenao_api.planner import QueryPlanner, dbmask, indexes_of
+from benchmarks.stub_server import StubServer
+
+
+def make_raw(*results):
+    return {'header': {}, 'results': [{'header': {'index_id': index_id, 'similarity': str(similarity)}, 'data': {}}
+                                      for index_id, similarity in results]}
+
+
+def make_client(server, client_class=SauceNao, **kwargs):
+    client = client_class(**kwargs)
+    client.SAUCENAO_URL = server.url
+    return client
+
+
+def test_dbmask():
+    assert dbmask([]) == 0
+    assert dbmask([DB.HMagazines, DB.Pixiv_Images, DB.Danbooru]) == 0b1000100001
+    assert indexes_of(dbmask([DB.Twitter, DB.Danbooru])) == [DB.Danbooru, DB.Twitter]
+    with pytest.raises(ValueError):
+        dbmask([DB.ALL])
+
+
+def test_learns_narrow_indexes():
+    planner = QueryPlanner(80, min_matches=10, explore_every=None)
+    for _ in range(6):
+        planner.record(make_raw((DB.Pixiv_Images, 95), (DB.Danbooru, 70)))
+    assert planner.plan() is None
+
+    for _ in range(3):
+        planner.record(make_raw((DB.Danbooru, 90), (DB.Twitter, 85)))
+    planner.record(make_raw((DB.Anime, 81)))
+    # 6 + 3 of 13 matches are not 90%, Twitter is needed as well
+    assert planner.indexes == [DB.Pixiv_Images, DB.Danbooru, DB.Twitter]
+    assert planner.plan() == dbmask([DB.Pixiv_Images, DB.Danbooru, DB.Twitter])
+    assert planner.matches[DB.Anime] == 1
+
+    planner = QueryPlanner(80, min_matches=1, max_indexes=1)
+    planner.record(make_raw((DB.Pixiv_Images, 95), (DB.Danbooru, 90)))
+    assert planner.indexes == [DB.Pixiv_Images]
+
+
+def test_explore_and_decay():
+    planner = QueryPlanner(80, coverage=0.8, min_matches=1, explore_every=3, decay=0.5)
+    planner.record(make_raw((DB.Pixiv_Images, 95)))
+    assert [planner.plan() for _ in range(6)] == [dbmask([DB.Pixiv_Images])] * 2 + [None] + \
+                                                 [dbmask([DB.Pixiv_Images])] * 2 + [None]
+
+    planner.record(make_raw((DB.Danbooru, 95)))
+    planner.record(make_raw((DB.Danbooru, 95)))
+    assert planner.matches == {DB.Pixiv_Images: 0.25, DB.Danbooru: 1.5}
+    assert planner.indexes == [DB.Danbooru]
+
+
+def test_cascade():
+    planner = QueryPlanner(85, min_matches=2, explore_every=None)
+    with StubServer() as server:
+        client = make_client(server, planner=planner)
+        for _ in range(4):
+            assert client.from_url('https://example.com/')[0].index_id == DB.Pixiv_Images
+
+    assert server.dbmasks == {None: 2, dbmask([DB.Pixiv_Images]): 2}
+    assert (planner.narrowed, planner.widened, planner.full) == (2, 0, 2)
+
+
+def test_widen():
+    planner = QueryPlanner(85, min_matches=1, explore_every=None)
+    planner.record(make_raw((DB.Yandere, 90)))
+    metrics = PrometheusMetrics()
+    with StubServer() as server:
+        response = make_client(server, planner=planner, metrics=metrics).from_file(b'content')
+        # A dbmask of the caller is left alone
+        make_client(server, planner=planner, dbmask=dbmask([DB.Twitter])).from_url('https://example.com/')
+
+    assert response[0].index_id == DB.Pixiv_Images
+    assert server.dbmasks == {dbmask([DB.Yandere]): 1, None: 1, dbmask([DB.Twitter]): 1}
+    # The body is sent again by the search of all the indexes
+    assert server.bytes_received > 2 * len(b'content')
+    assert (planner.narrowed, planner.widened, planner.full) == (0, 1, 2)
+    assert metrics.value('saucenao_planned_searches_total', stage='widened') == 1
+    assert metrics.value('saucenao_planned_searches_total', stage='all') == 1
+
+
+def test_async_cascade():
+    planner = QueryPlanner(85, min_matches=1, explore_every=None)
+    planner.record(make_raw((DB.Yandere, 90)))
+    loop = asyncio.get_event_loop()
+    with StubServer() as server:
+        aio = make_client(server, AIOSauceNao, planner=planner)
+        loop.run_until_complete(aio.from_url('https://example.com/'))
+        loop.run_until_complete(aio.from_url('https://example.com/'))
+        loop.run_until_complete(aio.close())
+
+    assert server.dbmasks == {dbmask([DB.Yandere]): 1, None: 1, planner.plan(): 1}
+    assert planner.indexes == [DB.Pixiv_Images, DB.Yandere]
+
+
+def test_stub_server_rotation():
+    with StubServer(rotate=3.0, seed=1) as server:
+        client = make_client(server)
+        indexes = {client.from_url('https://example.com/')[0].index_id for _ in range(20)}
+        response = client.from_url('https://example.com/')
+
+    assert len(indexes) > 1
+    similarities = [result.raw['header']['similarity'] for result in response]
+    assert similarities == [result['header']['similarity'] for result in server._result_list]
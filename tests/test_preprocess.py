@@ -0,0 +1,103 @@
+import io
+import json
+import pytest
+import re
+import responses
+import asyncio
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import BadFileSizeError
+from . import sent_file, test_suite as e
+
+Image = pytest.importorskip('PIL.Image')
+from saucenao_api.preprocess import ImagePreprocessor  # noqa: E402
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+def make_image(size, mode='RGB'):
+    image = Image.effect_noise(size, 64).convert(mode)
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def test_downscale():
+    content = make_image((1200, 600))
+    processed = ImagePreprocessor(max_side=400)(content)
+
+    image = Image.open(io.BytesIO(processed))
+    assert image.format == 'JPEG'
+    assert image.size == (400, 200)
+    assert len(processed) < len(content)
+
+
+def test_transparent_image():
+    processed = ImagePreprocessor(max_side=100)(make_image((200, 200), mode='RGBA'))
+
+    assert Image.open(io.BytesIO(processed)).mode == 'RGB'
+
+
+def test_small_image_kept():
+    output = io.BytesIO()
+    Image.new('RGB', (32, 32), (255, 0, 0)).save(output, format='PNG')
+    content = output.getvalue()
+
+    assert ImagePreprocessor()(content) == content
+
+
+def test_not_an_image():
+    assert ImagePreprocessor()(b'not an image') == b'not an image'
+
+
+def test_too_large():
+    with pytest.raises(BadFileSizeError):
+        ImagePreprocessor(max_bytes=10)(b'not an image, but too large')
+
+
+def test_processed_cache():
+    preprocess = ImagePreprocessor(max_side=100, cache_size=1)
+    content = make_image((200, 200))
+
+    assert preprocess(content) is preprocess(content)
+    preprocess(make_image((300, 300)))
+    assert len(preprocess._cache) == 1
+
+
+def test_from_file(mocked_responses):
+    def request_callback(request):
+        assert processed in request.body
+        return 200, {}, json_body
+
+    json_body = json.dumps(e.HGame_CG)
+    content = make_image((1000, 1000))
+    preprocess = ImagePreprocessor(max_side=500)
+    processed = preprocess(content)
+
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    SauceNao(preprocess=preprocess).from_file(io.BytesIO(content))
+
+
+def test_file_too_large_not_sent(mocked_responses):
+    with pytest.raises(BadFileSizeError):
+        SauceNao(preprocess=ImagePreprocessor(max_bytes=1)).from_file(io.BytesIO(b'not an image'))
+
+    assert len(mocked_responses.calls) == 0
+
+
+def test_async_from_file(mocked_aio_response):
+    loop = asyncio.get_event_loop()
+    sent = []
+
+    def request_callback(url, **kwargs):
+        sent.append(sent_file(kwargs['data']))
+
+    mocked_aio_response.post(URL_PATTERN, payload=e.HGame_CG, callback=request_callback)
+
+    content = make_image((1000, 1000))
+    aio_saucenao = AIOSauceNao(preprocess=ImagePreprocessor(max_side=500))
+    loop.run_until_complete(aio_saucenao.from_file(content))
+
+    assert Image.open(io.BytesIO(sent[0])).size == (500, 500)
@@ -0,0 +1,188 @@
+import asyncio
+import threading
+
+import pytest
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import LongLimitReachedError, ShortLimitReachedError
+from saucenao_api.key_pool import KeyPool
+from saucenao_api.quota import QuotaState, RedisPacer, SharedPacer, SQLitePacer
+from saucenao_api.resp import RespClient, RespError
+from benchmarks.resp_server import RespServer
+from benchmarks.stub_server import StubServer
+
+
+@pytest.fixture
+def resp_server():
+    with RespServer() as server:
+        yield server
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def make_pacer(request, tmp_path):
+    pacers = []
+
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            pacer = SQLitePacer(str(tmp_path / 'quota.sqlite'), **kwargs)
+        else:
+            pacer = RedisPacer(server.url, **kwargs)
+        pacers.append(pacer)
+        return pacer
+
+    if request.param == 'redis':
+        server = request.getfixturevalue('resp_server')
+    yield make
+    for pacer in pacers:
+        pacer.close()
+
+
+def test_shared_short_window(make_pacer, clock):
+    first, second = make_pacer(clock=clock), make_pacer(clock=clock)
+    other = make_pacer(name='other key', clock=clock)
+
+    assert first.state is None
+    first.update(QuotaState(4, 4, 100, 50, 0))
+    assert second.state == QuotaState(4, 4, 100, 50, 0)
+
+    assert [first.reserve(), second.reserve(), first.reserve(), second.reserve()] == [0, 0, 0, 0]
+    assert second.delay() == 30
+    assert first.reserve() == 30
+    assert other.reserve() == 0
+
+    clock.now += 10
+    assert second.reserve() == 20
+
+
+def test_shared_penalty(make_pacer, clock):
+    first, second = make_pacer(clock=clock), make_pacer(clock=clock)
+
+    first.penalize(ShortLimitReachedError())
+    assert second.reserve() == 30
+
+    assert not second.exhausted
+    first.penalize(LongLimitReachedError())
+    assert second.exhausted
+    with pytest.raises(LongLimitReachedError):
+        second.reserve()
+
+
+def test_shared_reserve_is_atomic(make_pacer, clock):
+    make_pacer(clock=clock).update(QuotaState(10, 10, 100, 50, 0))
+    delays = []
+
+    def reserve(pacer):
+        for _ in range(5):
+            delays.append(pacer.reserve())
+
+    threads = [threading.Thread(target=reserve, args=(make_pacer(clock=clock),)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(delays) == [0] * 10 + [30] * 10
+
+
+def test_incomplete_shared_pacer():
+    class ReadOnlyPacer(SharedPacer):
+        def _get(self):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyPacer()
+
+
+def test_redis_server_time(resp_server):
+    with RedisPacer(resp_server.url) as pacer:
+        pacer.update(QuotaState(1, 1, 100, 50, 0))
+        assert pacer.reserve() == 0
+        assert 29 < pacer.delay() <= 30
+
+
+def test_resp_client(resp_server):
+    with RespClient.from_url(resp_server.url) as client:
+        assert client.execute('PING') == 'PONG'
+        assert client.execute('GET', 'key') is None
+        assert client.pipeline(('SET', 'key', b'\r\n\x00'), ('GET', 'key')) == ['OK', b'\r\n\x00']
+        assert client.execute('DEL', 'key', 'missing') == 1
+        with pytest.raises(RespError):
+            client.execute('NOSUCHCOMMAND')
+        # The connection is still usable after an error reply
+        assert client.execute('PING') == 'PONG'
+
+
+def test_resp_client_password():
+    with RespServer(password='secret') as server:
+        with RespClient.from_url(server.url) as client:
+            assert client.execute('PING') == 'PONG'
+
+        with RespClient(server.host, server.port) as client:
+            with pytest.raises(RespError):
+                client.execute('PING')
+
+    with pytest.raises(ValueError):
+        RespClient.from_url('http://localhost')
+
+
+# The calls of a shared pacer don't block the event loop of the async client
+@pytest.mark.parametrize('pooled', [False, True])
+def test_async_shared_pacer(resp_server, pooled):
+    threads = set()
+
+    class RecordingPacer(RedisPacer):
+        def reserve(self):
+            threads.add(threading.current_thread())
+            return super().reserve()
+
+        def update(self, quota):
+            threads.add(threading.current_thread())
+            super().update(quota)
+
+    pacers = []
+
+    def make_pacer():
+        pacer = RecordingPacer(resp_server.url)
+        pacers.append(pacer)
+        return pacer
+
+    async def search(url):
+        if pooled:
+            aio = AIOSauceNao(key_pool=KeyPool(['a', 'b'], pacer_factory=make_pacer))
+        else:
+            aio = AIOSauceNao(pacer=make_pacer())
+        aio.SAUCENAO_URL = url
+        async with aio:
+            await asyncio.gather(*[aio.from_url('https://example.com/') for _ in range(3)])
+        for pacer in pacers:
+            pacer.close()
+        return pacers[0].state
+
+    with StubServer(short_limit=10) as server:
+        state = asyncio.get_event_loop().run_until_complete(search(server.url))
+
+    assert state.short_limit == 10
+    assert threads and threading.current_thread() not in threads
+
+
+# Several clients with their own pacers don't go over the quota of the server together
+def test_fleet_stays_inside_quota(tmp_path, monkeypatch):
+    monkeypatch.setattr('benchmarks.stub_server.SHORT_WINDOW', 0.5)
+    with StubServer(short_limit=4, enforce_quota=True) as server:
+        def search(pacer):
+            client = SauceNao(pacer=pacer)
+            client.SAUCENAO_URL = server.url
+            for _ in range(4):
+                client.from_url('https://example.com/')
+
+        path = str(tmp_path / 'quota.sqlite')
+        pacers = [SQLitePacer(path, short_window=0.6) for _ in range(3)]
+        threads = [threading.Thread(target=search, args=(pacer,)) for pacer in pacers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for pacer in pacers:
+            pacer.close()
+
+    assert server.statuses == {200: 12}
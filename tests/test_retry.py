@@ -0,0 +1,153 @@
+import asyncio
+import io
+import json
+import re
+
+import aiohttp
+import pytest
+import requests
+import responses
+from aioresponses import aioresponses, CallbackResult
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import (UnknownApiError, UnknownServerError, BadKeyError, BadFileSizeError,
+                                 ShortLimitReachedError, LongLimitReachedError)
+from saucenao_api.retry import RetryPolicy
+from . import sent_file, test_suite as e
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr('saucenao_api.saucenao_api.time.sleep', delays.append)
+    return delays
+
+
+@pytest.mark.parametrize('exc, retryable', [
+    (UnknownApiError('', status_code=502), True),
+    (UnknownApiError('', status_code=404), False),
+    (UnknownServerError('status > 0'), True),
+    (ShortLimitReachedError(), True),
+    (LongLimitReachedError(), False),
+    (BadKeyError(), False),
+    (BadFileSizeError(), False),
+    (requests.ConnectionError(), True),
+    (requests.Timeout(), True),
+    (aiohttp.ServerDisconnectedError(), True),
+    (asyncio.TimeoutError(), True),
+    (ValueError(), False),
+])
+def test_retryable(exc, retryable):
+    assert RetryPolicy.retryable(exc) is retryable
+
+
+def test_delay():
+    policy = RetryPolicy(backoff=0.5, max_backoff=3, jitter=lambda: 1.0)
+    assert [policy.delay(UnknownServerError(), attempt) for attempt in range(1, 6)] == [0.5, 1, 2, 3, 3]
+    assert policy.delay(ShortLimitReachedError(), 1) == 30.5
+
+    policy = RetryPolicy(backoff=2, jitter=lambda: 0.25)
+    assert policy.delay(UnknownServerError(), 3) == 2
+
+
+def test_attempts():
+    policy = RetryPolicy(attempts=3)
+    assert policy.allow(UnknownServerError(), 1)
+    assert policy.allow(UnknownServerError(), 2)
+    assert not policy.allow(UnknownServerError(), 3)
+    assert not policy.allow(BadKeyError(), 1)
+
+
+def test_budget(clock):
+    policy = RetryPolicy(budget=2, budget_window=60, clock=clock)
+
+    assert policy.allow(UnknownServerError(), 1)
+    assert policy.allow(UnknownServerError(), 1)
+    assert not policy.allow(UnknownServerError(), 1)
+
+    clock.now += 60
+    assert policy.allow(UnknownServerError(), 1)
+    # Errors that aren't retried don't spend the budget
+    assert not policy.allow(BadKeyError(), 1)
+    assert policy.allow(UnknownServerError(), 1)
+
+
+def test_retry_reuses_body(no_sleep):
+    bodies = []
+
+    def request_callback(request):
+        bodies.append(request.body)
+        if len(bodies) < 3:
+            return 503, {}, ''
+        return 200, {}, json.dumps(e.HGame_CG)
+
+    class CountingFile(io.BytesIO):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            return super().read(size)
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+        file = CountingFile(b'content')
+        saucenao = SauceNao(retry=RetryPolicy(attempts=3, jitter=lambda: 1.0))
+        assert saucenao.from_file(file).raw == e.HGame_CG
+
+    assert len(bodies) == 3
+    # The same encoded body, with the same boundary, is sent every time, and the file is read once
+    assert bodies[0] == bodies[1] == bodies[2]
+    assert b'content' in bodies[0]
+    assert file.reads == 1
+    assert no_sleep == [0.5, 1]
+
+
+def test_retry_gives_up(no_sleep):
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, SAUCENAO_URL, status=500)
+        with pytest.raises(UnknownApiError):
+            SauceNao(retry=RetryPolicy(attempts=2)).from_url('https://example.com/')
+        assert len(rsps.calls) == 2
+
+
+def test_no_retry_by_default():
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, SAUCENAO_URL, body=requests.ConnectionError())
+        with pytest.raises(requests.ConnectionError):
+            SauceNao().from_url('https://example.com/')
+        assert len(rsps.calls) == 1
+
+
+def test_short_limit_waits_for_window(no_sleep):
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.POST, SAUCENAO_URL, status=429, json={'header': {'message': 'Too many requests'}})
+        rsps.add(responses.POST, SAUCENAO_URL, json=e.HGame_CG)
+        SauceNao(retry=RetryPolicy(jitter=lambda: 0.0)).from_url('https://example.com/')
+
+    assert no_sleep == [30]
+
+
+def test_async_retry_reuses_body(monkeypatch):
+    sent = []
+
+    def request_callback(url, **kwargs):
+        sent.append(sent_file(kwargs['data']))
+        if len(sent) < 2:
+            return CallbackResult(status=502)
+        return CallbackResult(status=200, payload=e.HGame_CG)
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr('saucenao_api.saucenao_api.asyncio.sleep', no_sleep)
+    with aioresponses() as m:
+        m.post(URL_PATTERN, callback=request_callback, repeat=True)
+        aio = AIOSauceNao(retry=RetryPolicy())
+        resp = asyncio.get_event_loop().run_until_complete(aio.from_file(b'content'))
+        asyncio.get_event_loop().run_until_complete(aio.close())
+
+    assert resp.raw == e.HGame_CG
+    assert sent == [b'content', b'content']
@@ -0,0 +1,56 @@
+import pytest
+
+from saucenao_api import SauceNao
+from saucenao_api.errors import BadKeyError, BadFileSizeError, ShortLimitReachedError, LongLimitReachedError
+from benchmarks.stub_server import StubServer
+
+
+def make_client(server, **kwargs):
+    client = SauceNao(**kwargs)
+    client.SAUCENAO_URL = server.url
+    return client
+
+
+def test_results_and_quota():
+    with StubServer(results=9, short_limit=5, long_limit=50) as server:
+        client = make_client(server)
+        first = client.from_url('https://example.com/')
+        second = client.from_file(b'content')
+
+    assert len(first.results) == len(second.results) == 9
+    assert (first.short_remaining, first.long_remaining) == (4, 49)
+    assert (second.short_remaining, second.long_remaining) == (3, 48)
+    assert server.requests == 2
+    assert server.bytes_received > len(b'content')
+
+
+@pytest.mark.parametrize('status, error', [
+    (403, BadKeyError),
+    (413, BadFileSizeError),
+    (429, ShortLimitReachedError),
+])
+def test_faults(status, error):
+    with StubServer(faults={status: 1.0}) as server:
+        with pytest.raises(error):
+            make_client(server).from_url('https://example.com/')
+    assert server.statuses == {status: 1}
+
+
+def test_enforce_quota():
+    with StubServer(short_limit=2, enforce_quota=True) as server:
+        client = make_client(server)
+        client.from_url('https://example.com/')
+        client.from_url('https://example.com/')
+        with pytest.raises(ShortLimitReachedError):
+            client.from_url('https://example.com/')
+
+    with StubServer(short_limit=10, long_limit=1, enforce_quota=True) as server:
+        client = make_client(server)
+        client.from_url('https://example.com/')
+        with pytest.raises(LongLimitReachedError):
+            client.from_url('https://example.com/')
+
+
+def test_unknown_fault():
+    with pytest.raises(ValueError):
+        StubServer(faults={500: 0.1})
@@ -0,0 +1,151 @@
+import io
+import mmap
+import pytest
+import re
+import responses
+import asyncio
+
+from saucenao_api import SauceNao, AIOSauceNao
+from saucenao_api.errors import UnknownApiError
+from saucenao_api.upload import MultipartBody, open_upload, read_content
+from . import sent_file
+
+SAUCENAO_URL = SauceNao.SAUCENAO_URL
+URL_PATTERN = re.compile(r'https://saucenao.com/search.php(.*)')
+CONTENT = bytes(range(256)) * 1000
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / 'image.png'
+    path.write_bytes(CONTENT)
+    return path
+
+
+class Unseekable(io.RawIOBase):
+    def __init__(self, content):
+        self._content = io.BytesIO(content)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._content.readinto(buffer)
+
+
+def expected_body(body, content, filename='file'):
+    return (f'--{body.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content +
+            f'\r\n--{body.boundary}--\r\n'.encode())
+
+
+def test_multipart_buffer():
+    body = MultipartBody({'file': memoryview(CONTENT)})
+    chunks = list(body)
+
+    assert b''.join(chunks) == expected_body(body, CONTENT)
+    assert len(body) == len(expected_body(body, CONTENT))
+    assert max(len(chunk) for chunk in chunks) == MultipartBody.CHUNK_SIZE
+    # Buffers are sliced, not copied
+    assert any(isinstance(chunk, memoryview) and chunk.obj is CONTENT for chunk in chunks)
+
+
+def test_multipart_file_rewind(image_path):
+    with open(image_path, 'rb') as f:
+        f.read(10)
+        body = MultipartBody({'file': f})
+        first = body.read()
+
+        assert first == expected_body(body, CONTENT[10:], filename='image.png')
+        assert body.seek(0) == 0
+        assert body.read() == first
+        with pytest.raises(io.UnsupportedOperation):
+            body.seek(5)
+
+
+def test_multipart_buffer_files(image_path):
+    with open(image_path, 'rb') as f:
+        f.read(10)
+        body = MultipartBody({'file': f}, buffer_files=True)
+
+        assert body.buffered
+        assert body.read() == expected_body(body, CONTENT[10:], filename='image.png')
+        f.seek(0)
+        body.seek(0)
+        assert body.read() == expected_body(body, CONTENT[10:], filename='image.png')
+
+
+def test_multipart_unseekable():
+    body = MultipartBody({'file': Unseekable(CONTENT)})
+
+    assert body.read() == expected_body(body, CONTENT)
+
+
+def test_open_upload_path(image_path):
+    with open_upload(str(image_path)) as upload:
+        assert isinstance(upload, memoryview)
+        assert upload == CONTENT
+        assert read_content(upload) is upload
+
+
+def test_open_upload_empty_file(tmp_path):
+    path = tmp_path / 'empty.png'
+    path.write_bytes(b'')
+
+    with open_upload(path) as upload:
+        assert upload == b''
+
+
+def test_read_content_keeps_position():
+    f = io.BytesIO(CONTENT)
+    f.seek(5)
+
+    assert read_content(f) == CONTENT[5:]
+    assert f.tell() == 5
+
+
+@pytest.mark.parametrize('make_upload', [
+    lambda path: str(path),
+    lambda path: path,
+    lambda path: CONTENT,
+    lambda path: memoryview(CONTENT),
+    lambda path: io.BytesIO(CONTENT),
+])
+def test_from_file_inputs(mocked_responses, image_path, make_upload):
+    def request_callback(request):
+        assert CONTENT in request.body
+        assert request.headers['Content-Length'] == str(len(request.body))
+        assert request.headers['Content-Type'].startswith('multipart/form-data; boundary=')
+        return 500, {}, ''
+
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    with pytest.raises(UnknownApiError):
+        SauceNao().from_file(make_upload(image_path))
+
+
+def test_from_file_mmap(mocked_responses, image_path):
+    def request_callback(request):
+        assert CONTENT in request.body
+        return 500, {}, ''
+
+    mocked_responses.add_callback(responses.POST, SAUCENAO_URL, callback=request_callback)
+
+    with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with pytest.raises(UnknownApiError):
+            SauceNao().from_file(mapped)
+
+
+def test_async_from_path(mocked_aio_response, image_path):
+    loop = asyncio.get_event_loop()
+    sent = []
+
+    def request_callback(url, **kwargs):
+        sent.append(sent_file(kwargs['data']))
+
+    mocked_aio_response.post(URL_PATTERN, status=500, callback=request_callback)
+
+    with pytest.raises(UnknownApiError):
+        loop.run_until_complete(AIOSauceNao().from_file(image_path))
+
+    assert sent[0] == CONTENT